@@ -0,0 +1,128 @@
+# assessment_journal.py
+
+import json
+import os
+from rating_store import likelihood_codes, impact_codes, likelihood_entries, impact_entries
+
+# Number of journal events after which the journal is compacted into the snapshot
+COMPACT_EVERY = 200
+
+_event_counts = {}
+
+
+# Function to get the journal and snapshot paths of an assessment ("likelihood" or "impact")
+def get_journal_paths(kind):
+    base_path = os.getcwd()
+    return (
+        os.path.join(base_path, f".files\\{kind}_journal.jsonl"),
+        os.path.join(base_path, f".files\\{kind}_journal_snapshot.json"),
+    )
+
+
+def get_scenario_key(scenario):
+    return f"{scenario['asset']} - {scenario['threat']} - {scenario['vector']} - {scenario['scenario_id']}"
+
+
+def _write_json_atomic(data, file_path):
+    with open(file_path + ".tmp", "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(file_path + ".tmp", file_path)
+
+
+# Function to rebuild the submitted scenarios of an in-progress assessment from the snapshot and journal
+def load_submitted_scenarios(kind):
+    journal_path, snapshot_path = get_journal_paths(kind)
+    submitted = []
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, "r") as f:
+            submitted = json.load(f)["Scenarios"]
+
+    events = 0
+    if os.path.exists(journal_path):
+        with open(journal_path, "rb+") as f:
+            # Offset just after the last complete event
+            valid_end = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    event = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write; everything before it is intact. Cut it off,
+                    # so that the next event is not appended to it and lost on the next replay
+                    f.truncate(valid_end)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    break
+                valid_end += len(line)
+                events += 1
+                if event["op"] == "submit":
+                    submitted.append(decode_submit(event))
+                elif event["op"] == "remove":
+                    for index in range(len(submitted) - 1, -1, -1):
+                        if get_scenario_key(submitted[index]) == event["key"]:
+                            del submitted[index]
+                            break
+
+    _event_counts[journal_path] = events
+    return submitted
+
+
+# Function to durably append one event to the journal
+def append_event(kind, event, submitted=None):
+    journal_path, _ = get_journal_paths(kind)
+    with open(journal_path, "a") as f:
+        f.write(json.dumps(event) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    _event_counts[journal_path] = _event_counts.get(journal_path, 0) + 1
+    if submitted is not None and _event_counts[journal_path] >= COMPACT_EVERY:
+        compact_journal(kind, submitted)
+
+
+# Function to encode a submitted scenario as an event, storing its ratings as level codes
+def encode_submit(scenario):
+    event = {"op": "submit", "scenario": {k: v for k, v in scenario.items() if k not in ("Likelihood", "Impact")}}
+    if "Likelihood" in scenario:
+        event["likelihood"] = likelihood_codes(scenario["Likelihood"])
+    if "Impact" in scenario:
+        event["impact"] = impact_codes(scenario["Impact"])
+    return event
+
+
+# Function to rebuild a submitted scenario from its event
+def decode_submit(event):
+    scenario = dict(event["scenario"])
+    if "likelihood" in event:
+        scenario["Likelihood"] = likelihood_entries(event["likelihood"])
+    if "impact" in event:
+        scenario["Impact"] = impact_entries(event["impact"])
+    return scenario
+
+
+def record_submit(kind, scenario, submitted):
+    append_event(kind, encode_submit(scenario), submitted)
+
+
+def record_remove(kind, scenario, submitted):
+    append_event(kind, {"op": "remove", "key": get_scenario_key(scenario)}, submitted)
+
+
+# Function to fold the journal into the snapshot and start an empty journal
+def compact_journal(kind, submitted):
+    journal_path, snapshot_path = get_journal_paths(kind)
+    _write_json_atomic({"Scenarios": submitted}, snapshot_path)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+    _event_counts[journal_path] = 0
+
+
+# Function to finalize an assessment: the snapshot becomes the final file and the journal is cleared
+def finalize_journal(kind, submitted, final_path):
+    journal_path, snapshot_path = get_journal_paths(kind)
+    if os.path.exists(journal_path) or not os.path.exists(snapshot_path):
+        compact_journal(kind, submitted)
+    os.replace(snapshot_path, final_path)
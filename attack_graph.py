@@ -1,381 +1,1064 @@
 # attack_graph.py
 
 import streamlit as st
+import hashlib
+import json
 import os
-from pyvis.network import Network
+import re
+import string
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, unquote
+from graph_layout import layered_layout
+from attack_paths import path_key
+from graph_selection import attack_graph_selection, display_selected_scenarios
+from global_graph import NODE_KINDS, KIND_LAYERS, build_global_graph, node_assets, shared_nodes
 
-def create_attack_graph(asset_data, output_dir):
+# Directory, relative to the graph pages, holding the CSS and JS shared by every attack graph
+GRAPH_ASSETS_DIR = "assets"
+
+# Directory, next to the graph pages, caching the precomputed layout of every asset by content hash
+GRAPH_LAYOUT_DIR = "layouts"
+
+# Directory, relative to the graph pages, holding the deferred nodes of level-of-detail graphs
+GRAPH_DATA_DIR = "data"
+
+# Directory, next to the graph pages, holding the global cross-asset attack graph
+GRAPH_GLOBAL_DIR = "global"
+
+# File, next to the graph pages, recording the content hash every page was rendered from
+GRAPH_MANIFEST = "manifest.json"
+
+# Number of nodes above which a graph is rendered in level-of-detail mode
+GRAPH_LOD_THRESHOLD = 400
+
+# Bumped whenever graph_layout or the node/edge builder changes, so that cached layouts are recomputed
+GRAPH_LAYOUT_VERSION = 2
+
+# Layouts computed by this process, keyed by asset content hash
+_layout_cache = {}
+
+# Directory of the app's static route (server.enableStaticServing) where the graph pages are published, and
+# its URL. Streamlit serves ./static next to main.py, which is also where lib/ is shipped.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAPH_STATIC_DIR = os.path.join(APP_DIR, "static", "attack_graphs")
+GRAPH_STATIC_URL = "app/static/attack_graphs"
+GRAPH_LIB_DIR = os.path.join(APP_DIR, "lib")
+
+# CDN files referenced by the graph pages that are published from the vendored copies in lib/ instead
+GRAPH_VENDOR_FILES = {
+    "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css": "vis-9.1.2/vis-network.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js": "vis-9.1.2/vis-network.min.js",
+}
+
+# <link href="..."> and <script src="..."> tags of a graph page
+_ASSET_TAG = re.compile(r'<(link|script)\b[^>]*?\b(?:href|src)="([^"]+)"[^>]*>')
+_SRI_ATTRIBUTES = re.compile(r'\s(?:integrity|crossorigin)="[^"]*"')
+
+# vis-network options of the attack graphs
+GRAPH_OPTIONS = {
+    "configure": {"enabled": False},
+    "nodes": {"font": {"color": "white"}},
+    "edges": {"color": {"inherit": True}, "smooth": {"enabled": True, "type": "cubicBezier", "forceDirection": "horizontal", "roundness": 0.4}},
+    "interaction": {"dragNodes": True, "hideEdgesOnDrag": False, "hideNodesOnDrag": False},
+    # Nodes carry positions precomputed by graph_layout, so the browser does not simulate anything
+    "physics": {"enabled": False},
+}
+
+GRAPH_CSS = """
+#mynetwork {
+    width: 100%;
+    height: 750px;
+    background-color: #222222;
+    border: 1px solid lightgray;
+    position: relative;
+    float: left;
+}
+
+.toast {
+    position: fixed;
+    bottom: 0;
+    left: 0;
+    padding: 0.5rem 1rem;
+    margin: 1rem;
+    background-color: rgba(0, 0, 0, 0.6);
+    color: white;
+    border-radius: 0.25rem;
+    max-width: 100%;
+    z-index: 100;
+    opacity: 0;
+    transition: opacity 0.05s ease-in-out;
+}
+
+.toast.show {
+    opacity: 1;
+}
+"""
+
+GRAPH_JS = """
+var network = null;
+var lastClickedNode = null;
+var asset_name = '';
+var selected_scenarios = {};
+var graph_children = null;
+var expanded_nodes = {};
+
+var GRAPH_CONTROLS_HTML = `
+<div id="buttons-container" style="position: absolute; top: 10px; right: 10px; z-index: 10;">
+    <button onclick="zoomIn()" style="background-color: #444; color: white; border: none; padding: 10px;">Zoom In</button>
+    <button onclick="zoomOut()" style="background-color: #444; color: white; border: none; padding: 10px;">Zoom Out</button>
+    <button onclick="maximize()" style="background-color: #444; color: white; border: none; padding: 10px;">Maximize</button>
+    <button onclick="saveAsPNG()" style="background-color: #444; color: white; border: none; padding: 10px;">Save as PNG</button>
+</div>
+<div id="legend-container" style="position: absolute; bottom: 10px; left: 10px; z-index: 10; background-color: #444; color: white; padding: 10px; border: 2px dashed gray;">
+    <h4>Legend</h4>
+    <p><span style="color: #0000ff;">&#x25A0;</span> Asset</p>
+    <p><span style="color: #ff0000;">&#x25C6;</span> Threat</p>
+    <p><span style="color: #ff8080;">&#x25CF;</span> Attack Vector</p>
+    <p><span style="color: #ffa500;">&#x2B2C;</span> Scenario</p>
+    <p><span style="border: 1px dashed white; padding: 0 4px;">+N</span> Collapsed, click to expand</p>
+    <p><span style="background: linear-gradient(to right, #2e7d32, #ef6c00, #c62828); padding: 0 12px;"></span> Fill: aggregated risk, low to high</p>
+</div>
+<div id="scenario-details" style="position: absolute; bottom: 10px; left: 55%; transform: translateX(-50%); z-index: 10; background-color: #444; color: white; padding: 10px; border: 2px dashed gray; width: 60%; font-size: 12px; display: none;">
+    <h4>Scenario Details</h4>
+    <p id="scenario-asset"><strong>Asset:</strong> N/A</p>
+    <p id="scenario-threat"><strong>Threat:</strong> N/A</p>
+    <p id="scenario-vector"><strong>Attack Vector:</strong> N/A</p>
+    <p id="scenario-desc"><strong>Scenario Description:</strong> N/A</p>
+    <button id="add-scenario-button" onclick="addScenario()" style="background-color: #28a745; color: white; border: none; padding: 5px 10px; cursor: pointer;">+</button>
+    <button id="remove-scenario-button" onclick="removeScenario()" style="background-color: #dc3545; color: white; border: none; padding: 5px 10px; cursor: pointer;">-</button>
+    <button id="selection-completed-button" onclick="saveSelection()" style="background-color: #17a2b8; color: white; border: none; padding: 5px 10px; cursor: pointer; margin-left: 10px;">Selection Completed</button>
+</div>
+<div id="toast-container" style="position: fixed; bottom: 60px; left: 250px; z-index: 100;">
+    <div id="toast-message" class="toast hide" role="alert" aria-live="assertive" aria-atomic="true">
+        <div class="toast-body"></div>
+    </div>
+</div>
+`;
+
+// Draws the attack graph of one asset and wires up the controls shared by every graph page
+function drawAttackGraph(assetName, nodes, edges, options) {
+    asset_name = assetName;
+    document.getElementById('graph-legend-container').insertAdjacentHTML('beforeend', GRAPH_CONTROLS_HTML);
+    var container = document.getElementById('mynetwork');
+    network = new vis.Network(container, {nodes: new vis.DataSet(nodes), edges: new vis.DataSet(edges)}, options);
+
+    network.on("click", function (params) {
+        var nodeId = params.nodes[0];
+        if (nodeId) {
+            lastClickedNode = nodeId;
+            expandNode(nodeId).then(function () {
+                revealNeighbours(nodeId);
+                showScenarioDetails(nodeId);
+            });
+        }
+    });
+    return network;
+}
+
+// Draws the global attack graph with a selector that shows only the nodes and edges of some assets
+function drawGlobalAttackGraph(assetNames, nodes, edges, options) {
+    drawAttackGraph("Global", nodes, edges, options);
+    var select = document.createElement('select');
+    select.multiple = true;
+    select.size = Math.min(assetNames.length, 8);
+    select.style.cssText = 'position: absolute; top: 10px; left: 10px; z-index: 10; background-color: #444; color: white;';
+    assetNames.forEach(function (name) {
+        select.add(new Option(name, name, true, true));
+    });
+    select.addEventListener('change', function () {
+        var selected = {};
+        Array.from(select.selectedOptions).forEach(function (option) { selected[option.value] = true; });
+        var filter = function (item) {
+            return {id: item.id, hidden: !item.assets.some(function (name) { return selected[name]; })};
+        };
+        network.body.data.nodes.update(network.body.data.nodes.get().map(filter));
+        network.body.data.edges.update(network.body.data.edges.get().map(filter));
+    });
+    document.getElementById('graph-legend-container').appendChild(select);
+    return network;
+}
+
+// Fetches the deferred nodes and edges of a level-of-detail graph once, on the first expansion
+function loadGraphChildren() {
+    if (!graph_children) {
+        var link = document.getElementById('graph-children');
+        graph_children = fetch(link.href).then(function (response) { return response.json(); });
+    }
+    return graph_children;
+}
+
+// Adds the children of a collapsed node of a level-of-detail graph in one batched update
+function expandNode(nodeId) {
+    var node = network.body.data.nodes.get(nodeId);
+    if (!node.lod_children || expanded_nodes[nodeId]) {
+        return Promise.resolve();
+    }
+    expanded_nodes[nodeId] = true;
+    return loadGraphChildren().then(function (children) {
+        var nodes = [{id: nodeId, label: node.lod_label, borderWidth: 1, shapeProperties: {borderDashes: false}}];
+        var edges = [];
+        var added = {};
+        children.children[nodeId].forEach(function (edgeIndex) {
+            var edge = children.edges[edgeIndex];
+            edges.push(edge);
+            if (!added[edge.to] && !network.body.data.nodes.get(edge.to)) {
+                added[edge.to] = true;
+                var child = children.nodes[edge.to];
+                if (child.data && !child.title) {
+                    child.title = child.data.scenario_desc;
+                }
+                nodes.push(child);
+            }
+        });
+        network.body.data.nodes.update(nodes);
+        network.body.data.edges.update(edges);
+        markSelectedScenarios();
+    }).catch(function () {
+        expanded_nodes[nodeId] = false;
+        showToast("Could not load the graph data.");
+    });
+}
+
+// Shows the edges and nodes connected to a node in one batched update
+function revealNeighbours(nodeId) {
+    network.body.data.edges.update(network.getConnectedEdges(nodeId).map(function (edgeId) {
+        return {id: edgeId, hidden: false};
+    }));
+    network.body.data.nodes.update(network.getConnectedNodes(nodeId).map(function (connectedNodeId) {
+        return {id: connectedNodeId, hidden: false};
+    }));
+}
+
+function showScenarioDetails(nodeId) {
+    var nodeData = network.body.data.nodes.get(nodeId);
+    if (nodeData.data) {
+        const scenarioDetails = nodeData.data;
+        document.getElementById("scenario-asset").innerText = "Asset: " + scenarioDetails.asset;
+        document.getElementById("scenario-threat").innerText = "Threat: " + scenarioDetails.threat;
+        document.getElementById("scenario-vector").innerText = "Attack Vector: " + scenarioDetails.vector;
+        document.getElementById("scenario-desc").innerText = "Scenario Description: " + scenarioDetails.scenario_desc;
+        document.getElementById("scenario-details").style.display = "block";
+    }
+}
+
+function zoomIn() {
+    network.moveTo({ scale: network.getScale() + 0.1 });
+}
+
+function zoomOut() {
+    network.moveTo({ scale: network.getScale() - 0.1 });
+}
+
+function maximize() {
+    var container = document.getElementById('graph-legend-container');
+    var requestFullscreen = container.requestFullscreen || container.mozRequestFullScreen
+        || container.webkitRequestFullscreen || container.msRequestFullscreen;
+    if (requestFullscreen) {
+        requestFullscreen.call(container);
+    }
+}
+
+// Saves the visible part of the graph from the network's own canvas, on the graph background color
+function saveAsPNG() {
+    var source = document.querySelector('#mynetwork canvas');
+    var canvas = document.createElement('canvas');
+    canvas.width = source.width;
+    canvas.height = source.height;
+    var context = canvas.getContext('2d');
+    context.fillStyle = getComputedStyle(document.getElementById('mynetwork')).backgroundColor;
+    context.fillRect(0, 0, canvas.width, canvas.height);
+    context.drawImage(source, 0, 0);
+    var link = document.createElement('a');
+    link.href = canvas.toDataURL('image/png');
+    link.download = asset_name + '-Attack-graph.png';
+    link.click();
+}
+
+function showToast(message) {
+    var toast = document.getElementById("toast-message");
+    toast.querySelector(".toast-body").textContent = message;
+    toast.classList.remove("hide");
+    toast.classList.add("show");
+    setTimeout(function () {
+        toast.classList.remove("show");
+        toast.classList.add("hide");
+    }, 500);
+}
+
+// Marks the scenario nodes of the selection with a check mark
+function markSelectedScenarios() {
+    var updates = [];
+    network.body.data.nodes.get({filter: function (node) { return node.data; }}).forEach(function (node) {
+        var label = node.label.replace(/^\u2713 /, '');
+        if (selected_scenarios[node.data.key]) {
+            label = '\u2713 ' + label;
+        }
+        if (label !== node.label) {
+            updates.push({id: node.id, label: label});
+        }
+    });
+    network.body.data.nodes.update(updates);
+}
+
+// Sends a selection change to the embedding page (the selection component of the app), if any
+function postSelection(action, scenario) {
+    if (window.parent !== window) {
+        window.parent.postMessage({type: 'attack-graph-selection', action: action, scenario: scenario}, '*');
+    }
+}
+
+// Replaces the selection by the scenario keys selected in the app
+window.addEventListener('message', function (event) {
+    if (event.data && event.data.type === 'attack-graph-selected' && network) {
+        selected_scenarios = {};
+        event.data.scenarios.forEach(function (scenario) {
+            selected_scenarios[scenario.key] = scenario;
+        });
+        markSelectedScenarios();
+    }
+});
+
+function addScenario() {
+    var node = lastClickedNode && network.body.data.nodes.get(lastClickedNode);
+    if (node && node.data && !selected_scenarios[node.data.key]) {
+        selected_scenarios[node.data.key] = node.data;
+        markSelectedScenarios();
+        postSelection('add', node.data);
+        showToast("Scenario added.");
+    }
+}
+
+function removeScenario() {
+    var node = lastClickedNode && network.body.data.nodes.get(lastClickedNode);
+    if (node && node.data && selected_scenarios[node.data.key]) {
+        delete selected_scenarios[node.data.key];
+        markSelectedScenarios();
+        postSelection('remove', node.data);
+        showToast("Scenario removed.");
+    }
+}
+
+function saveSelection() {
+    var scenarios = Object.keys(selected_scenarios).map(function (key) { return selected_scenarios[key]; });
+    if (scenarios.length === 0) {
+        showToast("No scenarios selected.");
+        return;
+    }
+    var threats = [];
+    var vectors = {};
+    scenarios.forEach(function (scenario) {
+        var threat = threats.find(t => t.name === scenario.threat);
+        if (!threat) {
+            threat = {name: scenario.threat, vectors: []};
+            threats.push(threat);
+        }
+        var vector = vectors[scenario.threat + ' - ' + scenario.vector];
+        if (!vector) {
+            vector = {vector_name: scenario.vector, scenarios: []};
+            vectors[scenario.threat + ' - ' + scenario.vector] = vector;
+            threat.vectors.push(vector);
+        }
+        vector.scenarios.push({scenario_id: scenario.scenario_id, scenario_description: scenario.scenario_desc});
+    });
+
+    var json_data = JSON.stringify({name: asset_name, threats: threats}, null, 2);
+    var link = document.createElement("a");
+    link.href = URL.createObjectURL(new Blob([json_data], { type: "application/json" }));
+    link.download = asset_name + "_selected_scenarios.json";
+    link.click();
+    showToast("Scenarios saved.");
+}
+"""
+
+# Page of one attack graph; everything static is in the shared assets, the page only carries the graph data
+GRAPH_TEMPLATE = string.Template("""<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css" integrity="sha512-WgxfT5LWjfszlPHXRmBWHkV2eceiWTOBvrKCNbdgDYTHrT2AeLCGbF4sZlZw3UMN3WtL0tGUoIAKsu8mllg/XA==" crossorigin="anonymous" referrerpolicy="no-referrer" />
+<script src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js" integrity="sha512-LnvoEWDFrqGHlHmDD2101OrLcbsfkrzoSpvtSQtxK3RMnRV0eOkhhBN2dXHKRrUU8p2DGRTk35n4O8nWSVe1mQ==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+<link rel="stylesheet" href="$assets_dir/attack_graph.css" />
+<script src="$assets_dir/attack_graph.js"></script>
+$data_link</head>
+<body>
+<div id="graph-legend-container"><div id="graph-container"><div id="mynetwork"></div></div></div>
+<script type="text/javascript">
+$draw($asset_name, $nodes, $edges, $options);
+</script>
+</body>
+</html>
+""")
+
+
+# Function to serialize a value for a <script> block, so that data can never close the block early
+def _script_json(value):
+    return json.dumps(value).replace("</", "<\\/")
+
+
+# Fill colors of the aggregated risk scale, from lowest to highest
+RISK_COLORS = [(46, 125, 50), (239, 108, 0), (198, 40, 40)]
+
+
+# Function to map a normalized risk value in [0, 1] to a color of the RISK_COLORS scale
+def risk_color(value):
+    position = min(max(value, 0.0), 1.0) * (len(RISK_COLORS) - 1)
+    low = min(int(position), len(RISK_COLORS) - 2)
+    fraction = position - low
+    rgb = [round(a + (b - a) * fraction) for a, b in zip(RISK_COLORS[low], RISK_COLORS[low + 1])]
+    return "#{:02x}{:02x}{:02x}".format(*rgb)
+
+
+# Function to build the vis-network nodes and edges of an asset's attack graph. node_risk maps the path keys
+# of the asset, its threats, vectors and scenarios to their aggregated risk in
+# [0, 1]; those nodes are filled with the risk color and keep the color of their kind as the border.
+def build_attack_graph_elements(asset_data, node_risk=None):
     asset_name = asset_data["name"]
-    net = Network(height="750px", width="100%", bgcolor="#222222", font_color="white", directed=True)
-    net.add_node(asset_name, label=asset_name, color="#0000ff", shape="box")  # Blue box for the asset
-    
+    nodes = {}
+    edges = []
+    node_risk = node_risk or {}
+    risk = {}
+
+    def add_node(node_id, **options):
+        if node_id not in nodes:
+            nodes[node_id] = dict(options, id=node_id)
+
+    def add_edge(source, to, **options):
+        edges.append(dict(options, arrows=options.get("arrows", "to"), **{"from": source, "to": to}))
+
+    # Vectors and scenarios shared by several threats of the asset are drawn once, with their highest risk
+    def add_risk(node_id, *names):
+        value = node_risk.get(path_key(*names))
+        if value is not None:
+            risk[node_id] = max(risk.get(node_id, 0.0), value)
+
+    add_node(asset_name, label=asset_name, color="#0000ff", shape="box")  # Blue box for the asset
+    add_risk(asset_name, asset_name)
+
     # Dictionary to store unique vectors and scenarios
     unique_nodes = {}
 
     def get_unique_node_id(node_type, node_name):
-        if (node_type, node_name) in unique_nodes:
-            return unique_nodes[(node_type, node_name)]
-        else:
-            unique_id = f"{node_type}_{len(unique_nodes) + 1}"
-            unique_nodes[(node_type, node_name)] = unique_id
-            return unique_id
+        if (node_type, node_name) not in unique_nodes:
+            unique_nodes[(node_type, node_name)] = f"{node_type}_{len(unique_nodes) + 1}"
+        return unique_nodes[(node_type, node_name)]
 
-    def add_threat_nodes(threat_data):
+    for threat_data in asset_data["threats"]:
         threat_name = threat_data["name"]
         objectives_text = "\n- ".join(threat_data["objectives"])
-        net.add_node(
-            threat_name,
-            label=threat_name,
-            title=f"Attacker Objectives:\n- {objectives_text}", 
-            color="#ff0000",
-            shape="diamond",
-            hidden=True,
-        )   # Red diamond
-        net.add_edge(
-            asset_name, threat_name, title="Threat", color="#ffff00", hidden=True
-        )  # Yellow edge for threats
-
-        # Counter for attack vectors
-        vector_counter = 1
-
-        for vector in threat_data["vectors"]:
+        add_node(threat_name, label=threat_name, title=f"Attacker Objectives:\n- {objectives_text}",
+                 color="#ff0000", shape="diamond", hidden=True)  # Red diamond
+        add_edge(asset_name, threat_name, title="Threat", color="#ffff00", hidden=True)  # Yellow edge for threats
+        add_risk(threat_name, asset_name, threat_name)
+
+        for vector_counter, vector in enumerate(threat_data["vectors"], 1):
             vector_name = vector["vector_name"]
             vector_id = get_unique_node_id("vector", vector_name)
-            net.add_node(vector_id, label=vector_name, color="#ff8080", hidden=True)
-            net.add_edge(
-                threat_name,
-                vector_id,
-                label=f"Attack Vector {vector_counter}",  # Label on edge
-                color='red',  # Set arrow color to white
-                font_color='white', # Set text color to white
-                arrows="to",     # Make the arrow point from Threat to vector
-                hidden=True,
-            )
-
-            # Counter for scenarios
-            scenario_counter = 1
-
-            for scenario in vector["scenarios"]:
-                scenario_id = get_unique_node_id(
-                    "scenario", scenario["scenario_description"]
-                )  # Get unique ID
-                net.add_node(
+            add_node(vector_id, label=vector_name, color="#ff8080", shape="dot", hidden=True)
+            add_risk(vector_id, asset_name, threat_name, vector_name)
+            add_edge(threat_name, vector_id, label=f"Attack Vector {vector_counter}", color="red",
+                     font_color="white", arrows="to", hidden=True)
+
+            for scenario_counter, scenario in enumerate(vector["scenarios"], 1):
+                scenario_id = get_unique_node_id("scenario", scenario["scenario_description"])
+                add_node(
                     scenario_id,
                     label=f"Scenario {scenario_counter}",
                     title=scenario["scenario_description"],
                     color="#ffa500",
                     shape="ellipse",
                     hidden=True,
-                    data={"asset": asset_name, "threat": threat_name, "vector": vector_name, "scenario_desc": scenario["scenario_description"]}
-                )
-                net.add_edge(
-                    vector_id,
-                    scenario_id,
-                    title="Leads to",
-                    color="#ffa500",
-                    hidden=True,
+                    data={
+                        "key": path_key(asset_name, threat_name, vector_name, scenario["scenario_id"]),
+                        "asset": asset_name,
+                        "threat": threat_name,
+                        "vector": vector_name,
+                        "scenario_id": scenario["scenario_id"],
+                        "scenario_desc": scenario["scenario_description"],
+                    },
                 )
-                scenario_counter += 1
-
-            vector_counter += 1
+                add_edge(vector_id, scenario_id, title="Leads to", color="#ffa500", hidden=True)
+                add_risk(scenario_id, asset_name, threat_name, vector_name, scenario["scenario_id"])
 
         for control in threat_data["controls"]:
-            net.add_node(control, label=control, color="#00ff00", shape="box", hidden=True)  # Green square
-            net.add_edge(threat_name, control, title="Control", hidden=True)
-
-    for threat in asset_data["threats"]:
-        add_threat_nodes(threat)
-
-    output_path = f"{output_dir}/{asset_name}.html"
-    net.save_graph(output_path)
-
-    legend_html = """
-    <div id="legend-container" style="position: absolute; bottom: 10px; left: 10px; z-index: 10; background-color: #444; color: white; padding: 10px; border: 2px dashed gray;">
-        <h4>Legend</h4>
-        <p><span style="color: #0000ff;">&#x25A0;</span> Asset</p>
-        <p><span style="color: #ff0000;">&#x25C6;</span> Threat</p>
-        <p><span style="color: #ff8080;">&#x25CF;</span> Attack Vector</p>
-        <p><span style="color: #ffa500;">&#x2B2C;</span> Scenario</p>
-    </div>
-    <div id="scenario-details" style="position: absolute; bottom: 10px; left: 55%; transform: translateX(-50%); z-index: 10; background-color: #444; color: white; padding: 10px; border: 2px dashed gray; width: 60%; font-size: 12px; display: none;">
-        <h4>Scenario Details</h4>
-        <p id="scenario-asset"><strong>Asset:</strong> N/A</p>
-        <p id="scenario-threat"><strong>Threat:</strong> N/A</p>
-        <p id="scenario-vector"><strong>Attack Vector:</strong> N/A</p>
-        <p id="scenario-desc"><strong>Scenario Description:</strong> N/A</p>
-        <button id="add-scenario-button" onclick="addScenario()" style="background-color: #28a745; color: white; border: none; padding: 5px 10px; cursor: pointer;">+</button>
-        <button id="remove-scenario-button" onclick="removeScenario()" style="background-color: #dc3545; color: white; border: none; padding: 5px 10px; cursor: pointer;">-</button>
-        <button id="selection-completed-button" onclick="saveSelection()" style="background-color: #17a2b8; color: white; border: none; padding: 5px 10px; cursor: pointer; margin-left: 10px;">Selection Completed</button>
+            add_node(control, label=control, color="#00ff00", shape="box", hidden=True)  # Green square
+            add_edge(threat_name, control, title="Control", hidden=True)
 
-    </div>
+    for node_id, value in risk.items():
+        node = nodes[node_id]
+        node.update(color={"background": risk_color(value), "border": node["color"]}, borderWidth=2, risk=round(value, 3))
+
+    return list(nodes.values()), edges
+
+
+# Function to hash the content of an asset, so that an unchanged asset reuses its cached layout
+def asset_content_hash(asset_data):
+    content = json.dumps([GRAPH_LAYOUT_VERSION, asset_data], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_attack_graph_layout(asset_data, nodes, edges, layout_dir=None):
     """
+    Returns {node_id: [x, y]} for the nodes of an asset's attack graph, from the in-process cache,
+    from the layout cache directory or by computing the layered layout.
 
-    toast_html = """
-    <div id="toast-container" style="position: fixed; bottom: 60px; left: 250px; z-index: 100;">
-        <div id="toast-message" class="toast hide" role="alert" aria-live="assertive" aria-atomic="true">
-            <div class="toast-body"></div>
-        </div>
-    </div>
+    Parameters:
+    asset_data (dict): Asset of the unified attack model.
+    nodes, edges (list): vis-network elements built from the asset.
+    layout_dir (str): Directory where layouts are cached by content hash, no disk cache if None.
     """
+    content_hash = asset_content_hash(asset_data)
+    if content_hash in _layout_cache:
+        return _layout_cache[content_hash]
 
-    toast_css = """
-    <style>
-    .toast {{
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        padding: 0.5rem 1rem;
-        margin: 1rem;
-        background-color: rgba(0, 0, 0, 0.6);
-        color: white;
-        border-radius: 0.25rem;
-        max-width: 100%;
-        z-index: 100;
-        opacity: 0;
-        transition: opacity 0.05s ease-in-out;
-    }}
-
-    .toast.show {{
-        opacity: 1;
-    }}
-    </style>
+    layout_path = os.path.join(layout_dir, f"{content_hash}.json") if layout_dir else None
+    if layout_path and os.path.exists(layout_path):
+        with open(layout_path, "r", encoding="utf-8") as file:
+            layout = json.load(file)
+    else:
+        positions = layered_layout([node["id"] for node in nodes], [(edge["from"], edge["to"]) for edge in edges])
+        layout = {node_id: list(position) for node_id, position in positions.items()}
+        if layout_path:
+            os.makedirs(layout_dir, exist_ok=True)
+            with open(layout_path, "w", encoding="utf-8") as file:
+                json.dump(layout, file)
+    _layout_cache[content_hash] = layout
+    return layout
+
+
+# Function to mark a node as a collapsed cluster of its `count` children
+def _collapsed_node(node, count):
+    return dict(node, label=f"{node['label']}\n(+{count})", lod_label=node["label"], lod_children=True,
+                borderWidth=3, shapeProperties={"borderDashes": [5, 5]})
+
+
+def split_attack_graph_levels(nodes, edges):
+    """
+    Splits the elements of an attack graph for level-of-detail rendering: the page embeds the asset and
+    its threats, every node with children starts as a collapsed cluster, and the remaining nodes and
+    edges go to a compact document fetched on the first expansion. Returns the embedded nodes and edges
+    and that document ({"nodes": {id: node}, "edges": [...], "children": {id: [edge index, ...]}}).
     """
-    legend_html = f"{toast_css}{legend_html}{toast_html}"
+    root = nodes[0]["id"]
+    embedded_edges = [edge for edge in edges if edge["from"] == root]
+    deferred_edges = [edge for edge in edges if edge["from"] != root]
+    embedded_ids = {root} | {edge["to"] for edge in embedded_edges}
 
-    interaction_script = f"""
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js"></script>
-    <script type="text/javascript">
-    var lastClickedNode = null;
-    var asset_name = '{asset_name}';
-    var selected_scenarios = [];
-    console.log("Interaction script loaded");
+    children = {}
+    for edge_index, edge in enumerate(deferred_edges):
+        children.setdefault(edge["from"], []).append(edge_index)
 
-    network.on("dragEnd", function (params) {{
-        var nodeId = params.nodes[0];
-        if (nodeId) {{
-            console.log("Node dragged and fixed:", nodeId);
-            network.body.data.nodes.update({{id: nodeId, fixed: {{x: true, y: true}}}});
-        }}
-    }});
+    embedded_nodes = []
+    deferred_nodes = {}
+    for node in nodes:
+        if node["id"] in children:
+            node = _collapsed_node(node, len(children[node["id"]]))
+        if node["id"] in embedded_ids:
+            embedded_nodes.append(node)
+        else:
+            # Deferred nodes are shown as soon as they are added; scenario tooltips are rebuilt from their data
+            node = {key: value for key, value in node.items() if key != "hidden" and not (key == "title" and "data" in node)}
+            deferred_nodes[node["id"]] = node
+    deferred_edges = [{key: value for key, value in edge.items() if key != "hidden"} for edge in deferred_edges]
+    return embedded_nodes, embedded_edges, {"nodes": deferred_nodes, "edges": deferred_edges, "children": children}
 
-    network.on("click", function (params) {{
-        var nodeId = params.nodes[0];
-        if (nodeId) {{
-            console.log("Node clicked:", nodeId);
-            lastClickedNode = nodeId;
-            var connectedEdges = network.getConnectedEdges(nodeId);
-
-            connectedEdges.forEach(function (edgeId) {{
-                console.log("Connected edge shown:", edgeId);
-                network.body.data.edges.update({{id: edgeId, hidden: false}});
-            
-                var connectedNodeId = network.getConnectedNodes(edgeId);
-                for (var i = 0; i < connectedNodeId.length; i++){{
-                    if(connectedNodeId[i] != nodeId){{
-                        console.log("Connected node shown:", connectedNodeId[i]);
-                        network.body.data.nodes.update({{id: connectedNodeId[i], hidden: false}});
-                    }}
-                }}
-            }});
-
-            var nodeData = network.body.data.nodes.get(nodeId);
-            console.log("Node data:", nodeData);
-            if (nodeData.data) {{
-                const scenarioDetails = nodeData.data;
-                document.getElementById("scenario-asset").innerText = "Asset: " + scenarioDetails.asset;
-                document.getElementById("scenario-threat").innerText = "Threat: " + scenarioDetails.threat;
-                document.getElementById("scenario-vector").innerText = "Attack Vector: " + scenarioDetails.vector;
-                document.getElementById("scenario-desc").innerText = "Scenario Description: " + scenarioDetails.scenario_desc;
-                document.getElementById("scenario-details").style.display = "block";
-            }}
-        }}
-    }});
-
-    function zoomIn() {{
-        var scale = network.getScale();
-        console.log("Zooming in, scale:", scale);
-        network.moveTo({{ scale: scale + 0.1 }});
-    }}
-
-    function zoomOut() {{
-        var scale = network.getScale();
-        console.log("Zooming out, scale:", scale);
-        network.moveTo({{ scale: scale - 0.1 }});
-    }}
-
-    function maximize() {{
-        var container = document.getElementById('graph-legend-container');
-        if (container.requestFullscreen) {{
-            console.log("Maximizing");
-            container.requestFullscreen();
-        }} else if (container.mozRequestFullScreen) {{
-            console.log("Maximizing with mozRequestFullScreen");
-            container.mozRequestFullScreen();
-        }} else if (container.webkitRequestFullscreen) {{
-            console.log("Maximizing with webkitRequestFullscreen");
-            container.webkitRequestFullscreen();
-        }} else if (container.msRequestFullscreen) {{
-            console.log("Maximizing with msRequestFullscreen");
-            container.msRequestFullscreen();
-        }}
-    }}
-
-    function saveAsPNG() {{
-        var buttons = document.getElementById('buttons-container');
-        buttons.style.display = 'none';
-        html2canvas(document.getElementById('graph-legend-container')).then(canvas => {{
-            var link = document.createElement('a');
-            link.href = canvas.toDataURL();
-            link.download = '{asset_name}-Attack-graph.png';
-            console.log("Saving as PNG");
-            link.click();
-            buttons.style.display = 'block';
-        }});
-    }}
-
-    //add toast message
-    function showToast(message) {{
-        var toast = document.getElementById("toast-message");
-        var toastBody = toast.querySelector(".toast-body");
-        toastBody.textContent = message;
-        toast.classList.remove("hide");
-        toast.classList.add("show");
-        setTimeout(function () {{
-            toast.classList.remove("show");
-            toast.classList.add("hide");
-        }}, 500);
-    }}
-
-    function addScenario() {{
-        if (lastClickedNode && selected_scenarios.indexOf(lastClickedNode) === -1) {{
-            selected_scenarios.push(lastClickedNode);
-            console.log("Scenario added:", lastClickedNode);
-            showToast("Scenario added.");
-        }}
-    }}
-
-    function removeScenario() {{
-        if (lastClickedNode && selected_scenarios.indexOf(lastClickedNode) !== -1) {{
-            selected_scenarios.splice(selected_scenarios.indexOf(lastClickedNode), 1);
-            console.log("Scenario removed:", lastClickedNode);
-            showToast("Scenario removed.");
-        }}
-    }}
-
-    function saveSelection() {{ 
-        if (selected_scenarios.length === 0) {{
-            showToast("No scenarios selected.");
-        return;
-        }}
-        var scenarios_data = [];
-        selected_scenarios.forEach(function (scenario_id) {{
-            var scenario_data = network.body.data.nodes.get(scenario_id).data;
-            scenarios_data.push(scenario_data);
-        }});
-        
-        var threats = [];
-        var vectors = [];
-        
-        scenarios_data.forEach(function (scenario) {{
-            var threat = threats.find(t => t.name === scenario.threat);
-            if (!threat) {{
-                threat = {{
-                    name: scenario.threat,
-                    vectors: []
-                }};
-                threats.push(threat);
-            }}
-            
-            var vector = vectors[scenario.vector];
-            if (!vector) {{
-                vector = {{
-                    vector_name: scenario.vector,
-                    scenarios: []
-                }};
-                vectors[scenario.vector] = vector;
-                threat.vectors.push(vector);
-            }}
-            
-            vector.scenarios.push({{
-                scenario_id: scenario.scenario_id,
-                scenario_description: scenario.scenario_desc
-            }});
-        }});
-
-        var selected_asset = {{
-            name: asset_name,
-            threats: threats
-        }};
-        
-        var json_data = JSON.stringify(selected_asset, null, 2);
-        var blob = new Blob([json_data], {{ type: "application/json" }});
-        var url = URL.createObjectURL(blob);
-        var link = document.createElement("a");
-        link.href = url;
-        link.download = "{asset_name}_selected_scenarios.json";
-        link.click();
-        showToast("Scenarios saved.");
-    }}
-    </script>
+
+# Function to render the complete HTML page of an asset's attack graph in one pass. In level-of-detail mode
+# (lod=True, or None and more than GRAPH_LOD_THRESHOLD nodes) the deferred elements are returned as well and
+# must be written to GRAPH_DATA_DIR/<asset name>.json, relative to the page.
+def render_attack_graph_html(asset_data, assets_dir=GRAPH_ASSETS_DIR, layout_dir=None, lod=None, node_risk=None):
+    nodes, edges = build_attack_graph_elements(asset_data, node_risk)
+    layout = get_attack_graph_layout(asset_data, nodes, edges, layout_dir)
+    for node in nodes:
+        node["x"], node["y"] = layout[node["id"]]
+
+    deferred = None
+    data_link = ""
+    if lod or (lod is None and len(nodes) > GRAPH_LOD_THRESHOLD):
+        nodes, edges, deferred = split_attack_graph_levels(nodes, edges)
+        data_url = f"{GRAPH_DATA_DIR}/{quote(asset_data['name'])}.json"
+        data_link = f'<link rel="alternate" type="application/json" id="graph-children" href="{data_url}" />\n'
+
+    html_content = GRAPH_TEMPLATE.substitute(
+        assets_dir=assets_dir,
+        data_link=data_link,
+        draw="drawAttackGraph",
+        asset_name=_script_json(asset_data["name"]),
+        nodes=_script_json(nodes),
+        edges=_script_json(edges),
+        options=_script_json(GRAPH_OPTIONS),
+    )
+    return html_content, deferred
+
+
+# Function to write the shared CSS and JS next to the graph pages, skipping files that are already current
+def write_graph_assets(output_dir):
+    assets_path = os.path.join(output_dir, GRAPH_ASSETS_DIR)
+    os.makedirs(assets_path, exist_ok=True)
+    for file_name, content in (("attack_graph.css", GRAPH_CSS), ("attack_graph.js", GRAPH_JS)):
+        file_path = os.path.join(assets_path, file_name)
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                if file.read() == content:
+                    continue
+        with open(file_path, "w", encoding="utf-8") as file:
+            file.write(content)
+
+
+# Function to render one asset's attack graph page, and its deferred nodes in level-of-detail mode; the
+# shared assets must already be written
+def render_attack_graph(asset_data, output_dir, lod=None, node_risk=None):
+    html_content, deferred = render_attack_graph_html(
+        asset_data, layout_dir=os.path.join(output_dir, GRAPH_LAYOUT_DIR), lod=lod, node_risk=node_risk
+    )
+    data_path = os.path.join(output_dir, GRAPH_DATA_DIR, f"{asset_data['name']}.json")
+    if deferred is not None:
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        with open(data_path, "w", encoding="utf-8") as file:
+            json.dump(deferred, file, separators=(",", ":"))
+    elif os.path.exists(data_path):
+        os.remove(data_path)
+
+    output_path = f"{output_dir}/{asset_data['name']}.html"
+    with open(output_path, "w", encoding="utf-8") as file:
+        file.write(html_content)
+    return output_path
+
+
+def create_attack_graph(asset_data, output_dir, lod=None, node_risk=None):
+    write_graph_assets(output_dir)
+    return render_attack_graph(asset_data, output_dir, lod, node_risk)
+
+
+def create_attack_graphs(assets, output_dir, parallel=True, max_workers=None, lod=None, node_risk=None):
     """
+    Renders the attack graph pages of all assets, writing the shared assets once.
 
-    with open(output_path, "a") as file:
-        file.write(interaction_script)
+    Parameters:
+    assets (list): Asset dictionaries of the unified attack model.
+    output_dir (str): Directory where the HTML files are stored.
+    parallel (bool): Render the assets concurrently in worker processes.
+    max_workers (int): Number of worker processes, the number of CPUs by default.
+    lod (bool): Render in level-of-detail mode, by default only graphs above GRAPH_LOD_THRESHOLD nodes.
+    node_risk (dict): Aggregated risk of the nodes per asset name (see risk_rollup.rollup_node_values).
+    """
+    write_graph_assets(output_dir)
+    node_risk = node_risk or {}
+    asset_risks = [node_risk.get(asset["name"]) for asset in assets]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(assets))
+    if not parallel or max_workers < 2:
+        return [render_attack_graph(asset, output_dir, lod, risk) for asset, risk in zip(assets, asset_risks)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(render_attack_graph, assets, [output_dir] * len(assets), [lod] * len(assets), asset_risks))
 
-    buttons_html = """
-    <div id="buttons-container" style="position: absolute; top: 10px; right: 10px; z-index: 10;">
-        <button onclick="zoomIn()" style="background-color: #444; color: white; border: none; padding: 10px;">Zoom In</button>
-        <button onclick="zoomOut()" style="background-color: #444; color: white; border: none; padding: 10px;">Zoom Out</button>
-        <button onclick="maximize()" style="background-color: #444; color: white; border: none; padding: 10px;">Maximize</button>
-        <button onclick="saveAsPNG()" style="background-color: #444; color: white; border: none; padding: 10px;">Save as PNG</button>
-    </div>
+
+# Function to render all assets of the unified attack model
+def create_attack_graphs_from_file(unified_attack_model_path, output_dir, parallel=True, max_workers=None, lod=None):
+    with open(unified_attack_model_path, "r") as file:
+        data = json.load(file)
+    return create_attack_graphs(data["assets"], output_dir, parallel, max_workers, lod)
+
+
+# vis-network style of every node kind of the global graph, and of the edges leading to it, as in the asset graphs
+GLOBAL_NODE_STYLES = {
+    "asset": {"color": "#0000ff", "shape": "box"},
+    "threat": {"color": "#ff0000", "shape": "diamond"},
+    "vector": {"color": "#ff8080", "shape": "dot"},
+    "control": {"color": "#00ff00", "shape": "box"},
+    "scenario": {"color": "#ffa500", "shape": "ellipse"},
+}
+GLOBAL_EDGE_STYLES = {
+    "threat": {"title": "Threat", "color": "#ffff00"},
+    "vector": {"title": "Attack Vector", "color": "red"},
+    "control": {"title": "Control"},
+    "scenario": {"title": "Leads to", "color": "#ffa500"},
+}
+
+
+# Function to build the vis-network nodes and edges of the global graph, laid out in layers by node kind
+def build_global_graph_elements(graph):
+    kinds = [NODE_KINDS[code] for code in graph["kinds"]]
+    nodes = []
+    scenario_counter = 0
+    for node, kind in enumerate(kinds):
+        label = graph["labels"][node]
+        options = {"label": label}
+        if kind == "scenario":
+            scenario_counter += 1
+            options = {"label": f"Scenario {scenario_counter}", "title": label}
+        nodes.append(dict(GLOBAL_NODE_STYLES[kind], id=node, assets=node_assets(graph, node), **options))
+
+    edge_owners = np.repeat(np.arange(len(graph["sources"])), np.diff(graph["edge_asset_ptr"]))
+    edge_assets = [[] for _ in range(len(graph["sources"]))]
+    for edge, asset in zip(edge_owners.tolist(), graph["edge_asset_idx"].tolist()):
+        edge_assets[edge].append(graph["asset_names"][asset])
+    edges = [
+        dict(GLOBAL_EDGE_STYLES[kinds[target]], arrows="to", assets=assets, **{"from": source, "to": target})
+        for source, target, assets in zip(graph["sources"].tolist(), graph["targets"].tolist(), edge_assets)
+    ]
+
+    layout = layered_layout(
+        range(len(nodes)), [(edge["from"], edge["to"]) for edge in edges], layers=[KIND_LAYERS[kind] for kind in kinds]
+    )
+    for node in nodes:
+        node["x"], node["y"] = layout[node["id"]]
+    return nodes, edges
+
+
+def render_global_graph_html(graph, assets_dir=f"../{GRAPH_ASSETS_DIR}"):
+    nodes, edges = build_global_graph_elements(graph)
+    return GRAPH_TEMPLATE.substitute(
+        assets_dir=assets_dir,
+        data_link="",
+        draw="drawGlobalAttackGraph",
+        asset_name=_script_json(graph["asset_names"]),
+        nodes=_script_json(nodes),
+        edges=_script_json(edges),
+        options=_script_json(GRAPH_OPTIONS),
+    )
+
+
+# Function to write the global graph page, and the nodes shared by several assets, to GRAPH_GLOBAL_DIR
+def write_global_attack_graph(assets, output_dir):
+    graph = build_global_graph(assets)
+    global_dir = os.path.join(output_dir, GRAPH_GLOBAL_DIR)
+    os.makedirs(global_dir, exist_ok=True)
+    with open(os.path.join(global_dir, "index.html"), "w", encoding="utf-8") as file:
+        file.write(render_global_graph_html(graph))
+    with open(os.path.join(global_dir, "shared_nodes.json"), "w", encoding="utf-8") as file:
+        json.dump([{"Kind": kind, "Node": label, "Assets": count} for kind, label, count in shared_nodes(graph)], file, indent=2)
+    return os.path.join(global_dir, "index.html")
+
+
+# Function to hash everything an asset's page is rendered from: the asset subtree, its node risks, the page
+# template and options
+def graph_page_hash(asset_data, lod=None, node_risk=None):
+    content = json.dumps(
+        [asset_content_hash(asset_data), node_risk or {}, GRAPH_TEMPLATE.template, GRAPH_OPTIONS, lod, GRAPH_LOD_THRESHOLD],
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Function to remove the pages, level-of-detail data and layouts of assets that are no longer in the model
+def remove_orphaned_attack_graphs(output_dir, assets):
+    names = {asset["name"] for asset in assets}
+    layout_hashes = {asset_content_hash(asset) for asset in assets}
+    removed = []
+    for file_name in os.listdir(output_dir):
+        if file_name.endswith(".html") and file_name[:-len(".html")] not in names:
+            os.remove(os.path.join(output_dir, file_name))
+            removed.append(file_name[:-len(".html")])
+    for directory, keep in ((GRAPH_DATA_DIR, names), (GRAPH_LAYOUT_DIR, layout_hashes)):
+        directory_path = os.path.join(output_dir, directory)
+        if os.path.isdir(directory_path):
+            for file_name in os.listdir(directory_path):
+                if file_name.endswith(".json") and file_name[:-len(".json")] not in keep:
+                    os.remove(os.path.join(directory_path, file_name))
+    return sorted(removed)
+
+
+def update_attack_graphs(assets, output_dir, parallel=True, max_workers=None, lod=None, node_risk=None):
+    """
+    Brings the attack graph pages in line with the assets: only assets whose content hash differs from
+    the one recorded in GRAPH_MANIFEST (or whose page is missing) are rendered again, and the graphs of
+    assets that no longer exist are removed. The global graph is rewritten when anything changed. Returns
+    the paths of all pages and the names of the assets that were rendered and removed.
+
+    Parameters:
+    assets (list): Asset dictionaries of the unified attack model.
+    output_dir (str): Directory where the HTML files are stored.
+    parallel (bool): Render the changed assets concurrently in worker processes.
+    max_workers (int): Number of worker processes, the number of CPUs by default.
+    lod (bool): Render in level-of-detail mode, by default only graphs above GRAPH_LOD_THRESHOLD nodes.
+    node_risk (dict): Aggregated risk of the nodes per asset name, filled into the node colors; an asset
+        is also rendered again when its risks changed.
+    """
+    node_risk = node_risk or {}
+    manifest_path = os.path.join(output_dir, GRAPH_MANIFEST)
+    recorded = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            recorded = json.load(file)
+
+    hashes = {asset["name"]: graph_page_hash(asset, lod, node_risk.get(asset["name"])) for asset in assets}
+    changed = [
+        asset for asset in assets
+        if recorded.get(asset["name"]) != hashes[asset["name"]] or not os.path.exists(f"{output_dir}/{asset['name']}.html")
+    ]
+    create_attack_graphs(changed, output_dir, parallel, max_workers, lod, node_risk)
+    removed = remove_orphaned_attack_graphs(output_dir, assets)
+    global_path = os.path.join(output_dir, GRAPH_GLOBAL_DIR, "index.html")
+    if changed or removed or not os.path.exists(global_path):
+        write_global_attack_graph(assets, output_dir)
+
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(hashes, file, indent=2)
+    return {
+        "paths": [f"{output_dir}/{asset['name']}.html" for asset in assets],
+        "rendered": [asset["name"] for asset in changed],
+        "removed": removed,
+    }
+
+
+# Function to hash file content for the content-addressed names of the published files
+def _content_hash(content):
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+# Function to find the local file behind a reference of a graph page, None for external URLs
+def _resolve_graph_reference(url, page_dir, lib_dir):
+    if url in GRAPH_VENDOR_FILES:
+        path = os.path.join(lib_dir, GRAPH_VENDOR_FILES[url])
+    elif "://" in url or url.startswith("//"):
+        return None
+    elif url.startswith("lib/"):
+        path = os.path.join(lib_dir, url[len("lib/"):])
+    else:
+        path = os.path.join(page_dir, unquote(url))
+    return path if os.path.isfile(path) else None
+
+
+# Function to identify the version of a file without reading it
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# Function to check whether a source file, and every file it references, is published unchanged
+def _is_published(source_path, sources, static_dir):
+    entry = sources.get(source_path)
+    return (
+        entry is not None
+        and os.path.exists(source_path)
+        and entry["signature"] == _file_signature(source_path)
+        and os.path.exists(os.path.join(static_dir, entry["name"]))
+        and all(_is_published(reference, sources, static_dir) for reference in entry["references"])
+    )
+
+
+# Function to keep the entry of an unchanged source file, and of the files it references
+def _keep_published(source_path, previous, current):
+    if source_path not in current:
+        current[source_path] = previous[source_path]
+        for reference in previous[source_path]["references"]:
+            _keep_published(reference, previous, current)
+
+
+# Function to copy a file referenced by the graph pages to the static assets under a content-hashed name
+def _publish_graph_asset(source_path, static_dir, previous, current):
+    if source_path not in current:
+        if _is_published(source_path, previous, static_dir):
+            _keep_published(source_path, previous, current)
+        else:
+            with open(source_path, "rb") as file:
+                content = file.read()
+            root, extension = os.path.splitext(os.path.basename(source_path))
+            name = f"assets/{root}.{_content_hash(content)}{extension}"
+            target_path = os.path.join(static_dir, name)
+            if not os.path.exists(target_path):
+                with open(target_path, "wb") as file:
+                    file.write(content)
+            current[source_path] = {"signature": _file_signature(source_path), "name": name, "references": []}
+    return current[source_path]["name"]
+
+
+# Function to publish one graph page with its references rewritten to the published assets
+def _publish_graph_page(page_path, static_dir, lib_dir, previous, current):
+    with open(page_path, "r", encoding="utf-8") as file:
+        html_content = file.read()
+    references = []
+
+    def publish_reference(match):
+        source_path = _resolve_graph_reference(match.group(2), os.path.dirname(page_path), lib_dir)
+        if source_path is None:
+            return match.group(0)
+        references.append(source_path)
+        url = quote(_publish_graph_asset(source_path, static_dir, previous, current))
+        # The published copy may differ from the CDN file, so drop its subresource integrity
+        return _SRI_ATTRIBUTES.sub("", match.group(0).replace(match.group(2), url, 1))
+
+    content = _ASSET_TAG.sub(publish_reference, html_content).encode("utf-8")
+    name = f"{_content_hash(content)}.html"
+    if not os.path.exists(os.path.join(static_dir, name)):
+        with open(os.path.join(static_dir, name), "wb") as file:
+            file.write(content)
+    current[page_path] = {"signature": _file_signature(page_path), "name": name, "references": references}
+    return name
+
+
+def publish_attack_graphs(html_dir, static_dir=GRAPH_STATIC_DIR, lib_dir=GRAPH_LIB_DIR):
+    """
+    Publishes the attack graph pages to the app's static route under content-hashed names, so that the
+    browser can cache them and only fetches a page again when its content changed. The CSS/JS the pages
+    reference (the shared graph assets, vis-network and anything else under lib/) are published the same
+    way. Pages whose file, and referenced files, did not change since the last publication are not read
+    again. The global graph is published too. Writes manifest.json ({"assets": {asset name: page},
+    "global": page}), removes files that are no longer referenced and returns the manifest.
+
+    Parameters:
+    html_dir (str): Directory where the generated HTML files are stored.
+    static_dir (str): Directory of the static route where the pages are published.
+    lib_dir (str): Directory of the vendored JavaScript libraries.
+    """
+    os.makedirs(os.path.join(static_dir, "assets"), exist_ok=True)
+    sources_path = os.path.join(static_dir, "sources.json")
+    previous = {}
+    if os.path.exists(sources_path):
+        with open(sources_path, "r", encoding="utf-8") as file:
+            previous = json.load(file)
+    current = {}
+    manifest = {}
+
+    for file_name in sorted(os.listdir(html_dir)):
+        if not file_name.endswith(".html"):
+            continue
+        page_path = os.path.join(html_dir, file_name)
+        if _is_published(page_path, previous, static_dir):
+            _keep_published(page_path, previous, current)
+            manifest[file_name[:-len(".html")]] = current[page_path]["name"]
+        else:
+            manifest[file_name[:-len(".html")]] = _publish_graph_page(page_path, static_dir, lib_dir, previous, current)
+
+    global_page = None
+    global_path = os.path.join(html_dir, GRAPH_GLOBAL_DIR, "index.html")
+    if os.path.exists(global_path):
+        if _is_published(global_path, previous, static_dir):
+            _keep_published(global_path, previous, current)
+            global_page = current[global_path]["name"]
+        else:
+            global_page = _publish_graph_page(global_path, static_dir, lib_dir, previous, current)
+    manifest = {"assets": manifest, "global": global_page}
+
+    with open(os.path.join(static_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    with open(sources_path, "w", encoding="utf-8") as file:
+        json.dump(current, file)
+
+    # Remove the pages and assets of earlier versions
+    referenced = {entry["name"] for entry in current.values()} | {"manifest.json", "sources.json"}
+    for root, _, file_names in os.walk(static_dir):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            if os.path.relpath(path, static_dir).replace(os.sep, "/") not in referenced:
+                os.remove(path)
+    return manifest
+
+
+# Function to generate a synthetic unified attack model for benchmarking
+def generate_benchmark_assets(n_assets=20, n_threats=10, n_vectors=5, n_scenarios=10):
+    return [
+        {
+            "name": f"Asset {a}",
+            "threats": [
+                {
+                    "name": f"Threat {a}-{t}",
+                    "objectives": [f"Objective {t}-{o}" for o in range(3)],
+                    "vectors": [
+                        {
+                            "vector_name": f"Vector {a}-{t}-{v}",
+                            "scenarios": [
+                                {"scenario_id": f"scenario_{s + 1}", "scenario_description": f"Scenario {a}-{t}-{v}-{s} " + "x" * 120}
+                                for s in range(n_scenarios)
+                            ],
+                        }
+                        for v in range(n_vectors)
+                    ],
+                    "controls": [f"Control {t}-{c}" for c in range(3)],
+                }
+                for t in range(n_threats)
+            ],
+        }
+        for a in range(n_assets)
+    ]
+
+
+def benchmark_attack_graphs(output_dir, n_assets=20, **kwargs):
+    """
+    Times rendering synthetic assets with cold layouts, with the layouts cached by content hash,
+    in parallel worker processes (which read the cached layouts from disk), and updating the
+    graphs when nothing or a single asset changed.
     """
+    assets = generate_benchmark_assets(n_assets, **kwargs)
+    _layout_cache.clear()
+    timings = {}
+    for name, parallel in (("cold", False), ("cached", False), ("parallel", True)):
+        start = time.perf_counter()
+        paths = create_attack_graphs(assets, output_dir, parallel=parallel)
+        timings[name] = time.perf_counter() - start
+    timings["bytes_per_page"] = sum(os.path.getsize(path) for path in paths) / len(paths)
 
-    with open(output_path, "r") as file:
-        filedata = file.read()
+    # Incremental updates: nothing changed, then one asset changed
+    update_attack_graphs(assets, output_dir, parallel=False)
+    start = time.perf_counter()
+    update_attack_graphs(assets, output_dir, parallel=False)
+    timings["unchanged"] = time.perf_counter() - start
+    assets[0]["threats"][0]["objectives"].append("Changed objective")
+    start = time.perf_counter()
+    update_attack_graphs(assets, output_dir, parallel=False)
+    timings["one_changed"] = time.perf_counter() - start
+    return timings
 
-    filedata = filedata.replace('<div id="mynetwork"', '<div id="graph-legend-container"><div id="graph-container"><div id="mynetwork"')
-    filedata = filedata.replace('</body>', buttons_html + legend_html + '</body>')
 
-    with open(output_path, "w") as file:
-        file.write(filedata)
+# Function to read the manifest of the published attack graphs, cached until it changes
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_graph_manifest(manifest_path, mtime):
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
 
 
+# Function to read the nodes shared by several assets, written with the global graph
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_shared_nodes(shared_nodes_path, mtime):
+    with open(shared_nodes_path, "r", encoding="utf-8") as file:
+        return json.load(file)
 
-def display_attackgraph_html_files(html_dir):
+
+def display_attackgraph_html_files(html_dir, static_dir=GRAPH_STATIC_DIR):
     """
-    Function to display HTML files from a specified directory in a Streamlit app.
+    Function to display the attack graphs of a specified directory in a Streamlit app. The pages are
+    embedded by URL from the static route, so reruns and switching assets only send that URL to the browser.
     
     Parameters:
     html_dir (str): Directory where the generated HTML files are stored.
+    static_dir (str): Directory of the static route where the pages are published.
     """
-    # Function to read HTML file content
-    def get_html_content(file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-
-    # List all HTML files in the directory
-    html_files = [f for f in os.listdir(html_dir) if f.endswith('.html')]
+    manifest_path = os.path.join(static_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        publish_attack_graphs(html_dir, static_dir)
+    manifest = load_graph_manifest(manifest_path, os.path.getmtime(manifest_path))
+    if "assets" not in manifest:
+        # Published before the global graph existed
+        manifest = publish_attack_graphs(html_dir, static_dir)
 
     # Handle case where no HTML files are found
-    if not html_files:
+    if not manifest["assets"]:
         st.warning("No attack graph HTML files found in the directory.")
         st.stop()
 
-    # Create a mapping from display names to actual file names
-    display_names = [f[:-5] for f in html_files]  # Remove the ".html" postfix
+    view = "Per asset"
+    if manifest["global"]:
+        view = st.radio("View", ["Per asset", "Global"], horizontal=True,
+                        help="The global view merges the threats, attack vectors and scenarios shared by several assets.")
 
-    # Dropdown to select an asset
-    selected_display_name = st.selectbox("Select an Asset", display_names)
+    if view == "Global":
+        st.components.v1.iframe(f"{GRAPH_STATIC_URL}/{manifest['global']}", height=760, scrolling=True)
+        shared_nodes_path = os.path.join(html_dir, GRAPH_GLOBAL_DIR, "shared_nodes.json")
+        if os.path.exists(shared_nodes_path):
+            shared = load_shared_nodes(shared_nodes_path, os.path.getmtime(shared_nodes_path))
+            if shared:
+                st.markdown("**Shared by several assets**")
+                st.dataframe(shared, hide_index=True, width="stretch")
+        return
 
-    # Map the selected display name back to the actual file name
-    selected_asset = html_files[display_names.index(selected_display_name)]
+    # Dropdown to select an asset
+    selected_asset = st.selectbox("Select an Asset", list(manifest["assets"]))
 
-    # Read and display the selected HTML file
+    # Embed the selected page by reference, the browser caches it under its content-hashed URL; scenarios
+    # selected in it are kept in the session for the customized likelihood assessment
     if selected_asset:
-        html_path = os.path.join(html_dir, selected_asset)
-        html_content = get_html_content(html_path)
-        st.components.v1.html(html_content, height=760, scrolling=True)
+        attack_graph_selection(f"{GRAPH_STATIC_URL}/{manifest['assets'][selected_asset]}", selected_asset, height=760)
+        display_selected_scenarios()
 
 #  Example Usage
 
@@ -393,3 +1076,15 @@ def display_attackgraph_html_files(html_dir):
 # # Create attack graphs for each asset in the JSON file
 # for asset in data["assets"]:
 #     create_attack_graph(asset, output_dir)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        timings = benchmark_attack_graphs(output_dir)
+    print(f"20 assets x 500 scenarios: cold layouts {timings['cold'] * 1000:.0f} ms, "
+          f"cached layouts {timings['cached'] * 1000:.0f} ms, parallel {timings['parallel'] * 1000:.0f} ms, "
+          f"{timings['bytes_per_page'] / 1024:.0f} KB per page")
+    print(f"Update with no asset changed {timings['unchanged'] * 1000:.0f} ms, "
+          f"with one asset changed {timings['one_changed'] * 1000:.0f} ms")
@@ -1,10 +1,11 @@
 # attack_model.py
 
 import json
-from openai import OpenAI
 
 
 def create_attack_model_prompt(api_key, model_name, input_file_name, output_file_name):
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
 
     with open(input_file_name, 'r') as file:
@@ -198,6 +199,28 @@ def create_unified_threat_model(threats_file, attack_model_file, output_file):
 
     print(f"Unified data has been saved into {output_file}.")
 
+# Function to list the threats of the attack model that no asset of the unified attack model holds, in the
+# threat format of the unified attack model; create_unified_threat_model only keeps the threats whose name
+# matches a threat of threats.json exactly
+def get_unassigned_threats(unified_assets, attack_model_data):
+    assigned = {threat["name"] for asset in unified_assets for threat in asset["threats"]}
+    return [
+        {
+            "name": attack["Threat"],
+            "objectives": attack["Attacker Objectives"],
+            "vectors": [{
+                "vector_id": vector["vector_id"],
+                "vector_name": vector["vector_name"],
+                "scenarios": [{
+                    "scenario_id": scenario["scenario_id"],
+                    "scenario_description": scenario["scenario_description"]
+                } for scenario in vector["Attack Scenarios"]]
+            } for vector in attack["Attack Vectors"]],
+            "controls": attack.get("controls", []),
+        }
+        for attack in attack_model_data["attack_model"] if attack["Threat"] not in assigned
+    ]
+
 # def create_unified_attack_model(threats_file, attack_model_file, output_file):
 #     """
 #     Load threats and attack model JSON files, merge the data, and save unified data to an output file.
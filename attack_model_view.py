@@ -0,0 +1,153 @@
+# attack_model_view.py
+
+import json
+import os
+import time
+import streamlit as st
+from attack_model import get_unassigned_threats
+
+# Number of threats shown per page of an asset section
+THREATS_PER_PAGE = 10
+
+# Name of the section listing the threats of the attack model that are not assigned to any asset
+UNASSIGNED_SECTION = "Threats not assigned to an asset"
+
+_attack_model_view_cache = {}
+
+
+# Function to build the Markdown list of the scenarios of an attack vector
+def scenarios_markdown(vector):
+    return "\n".join(f"{idx}. {scenario['scenario_description']}" for idx, scenario in enumerate(vector["scenarios"], 1))
+
+
+def build_attack_model_view(assets, unassigned=None):
+    """
+    Builds the attack model view from the assets of the unified attack model: one section per asset
+    with its threats, and every block of Markdown the view shows, so that a page only outputs
+    prebuilt strings. Threats of the attack model that no asset holds get a last section of their own.
+
+    Parameters:
+    assets (list): Assets of the unified attack model.
+    unassigned (list): Threats not assigned to any asset (see attack_model.get_unassigned_threats).
+    """
+    sections = []
+    groups = [(asset["name"], asset["threats"]) for asset in assets]
+    if unassigned:
+        groups.append((UNASSIGNED_SECTION, unassigned))
+    for name, asset_threats in groups:
+        threats = []
+        for threat in asset_threats:
+            threats.append({
+                "name": threat["name"],
+                "objectives": "\n".join(f"- {objective}" for objective in threat.get("objectives", [])),
+                "vectors": [
+                    {"name": vector["vector_name"], "count": len(vector["scenarios"]), "scenarios": scenarios_markdown(vector)}
+                    for vector in threat.get("vectors", [])
+                ],
+            })
+        sections.append({
+            "name": name,
+            "threats": threats,
+            "vector_count": sum(len(threat["vectors"]) for threat in threats),
+            "scenario_count": sum(vector["count"] for threat in threats for vector in threat["vectors"]),
+        })
+    return {
+        "assets": sections,
+        "asset_count": len(assets),
+        "unassigned_count": len(unassigned or []),
+        "names": [section["name"] for section in sections],
+        "threat_count": sum(len(section["threats"]) for section in sections),
+        "scenario_count": sum(section["scenario_count"] for section in sections),
+    }
+
+
+# Function to load the attack model view of the unified attack model and of the threats of the attack model
+# it leaves out, built once per version of the files; the view is kept in memory and not copied, so a rerun
+# does not depend on the model size
+def load_attack_model_view(file_path, attack_model_path=None):
+    key = (file_path, os.path.getmtime(file_path), attack_model_path, attack_model_path and os.path.getmtime(attack_model_path))
+    if _attack_model_view_cache.get("key") != key:
+        with open(file_path, "r") as file:
+            assets = json.load(file)["assets"]
+        unassigned = None
+        if attack_model_path is not None:
+            with open(attack_model_path, "r") as file:
+                unassigned = get_unassigned_threats(assets, json.load(file))
+        _attack_model_view_cache["key"] = key
+        _attack_model_view_cache["view"] = build_attack_model_view(assets, unassigned)
+    return _attack_model_view_cache["view"]
+
+
+# Function to return the threats of one page of an asset section
+def page_threats(section, page, page_size=THREATS_PER_PAGE):
+    return section["threats"][(page - 1) * page_size:page * page_size]
+
+
+@st.fragment
+def display_attack_model_view(view, page_size=THREATS_PER_PAGE):
+    st.markdown("## Attack Model")
+    st.write(f"{view['asset_count']} assets, {view['threat_count']} threats, {view['scenario_count']} attack scenarios.")
+    if not view["assets"]:
+        return
+    if view["unassigned_count"]:
+        st.warning(
+            f"{view['unassigned_count']} threats of the attack model do not match a threat of the threat model by name, "
+            f"so they are not assigned to any asset; they are listed under '{UNASSIGNED_SECTION}'."
+        )
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        asset_index = st.selectbox(
+            "Asset", range(len(view["assets"])), key="attack_model_view_asset",
+            format_func=lambda index: (
+                f"{view['names'][index]} ({len(view['assets'][index]['threats'])} threats, "
+                f"{view['assets'][index]['vector_count']} attack vectors, {view['assets'][index]['scenario_count']} scenarios)"
+            ),
+        )
+    section = view["assets"][asset_index]
+    pages = max(1, -(-len(section["threats"]) // page_size))
+    # The page of the previous asset may not exist for this one
+    if st.session_state.get("attack_model_view_page", 1) > pages:
+        st.session_state.attack_model_view_page = 1
+    with col2:
+        page = int(st.number_input("Page", min_value=1, max_value=pages, key="attack_model_view_page"))
+
+    for threat in page_threats(section, page, page_size):
+        st.markdown(f"### {threat['name']}")
+        if threat["objectives"]:
+            st.markdown("**Attacker Objectives**")
+            st.markdown(threat["objectives"])
+        st.markdown("**Attack Vectors and Scenarios**")
+        for vector in threat["vectors"]:
+            with st.expander(f"{vector['name']} ({vector['count']} scenarios)"):
+                st.markdown(vector["scenarios"])
+    st.caption(f"Threats {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(page_threats(section, page, page_size))} of {len(section['threats'])} for {section['name']}")
+
+
+def benchmark_attack_model_view(n_assets=100, n_threats=100, n_vectors=5, n_scenarios=2):
+    """
+    Times building the view of a synthetic attack model (10^5 scenarios by default) and getting one
+    page, and compares the Markdown sent for one page with the Markdown of the whole model.
+    """
+    from attack_paths import generate_benchmark_model
+
+    assets, _, _ = generate_benchmark_model(n_assets, n_threats, n_vectors, n_scenarios)
+    start = time.perf_counter()
+    view = build_attack_model_view(assets)
+    timings = {"scenarios": view["scenario_count"], "build": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    threats = page_threats(view["assets"][0], 1)
+    timings["page"] = time.perf_counter() - start
+    timings["page_characters"] = sum(len(threat["objectives"]) + sum(len(vector["scenarios"]) for vector in threat["vectors"]) for threat in threats)
+    timings["model_characters"] = sum(
+        len(threat["objectives"]) + sum(len(vector["scenarios"]) for vector in threat["vectors"])
+        for section in view["assets"] for threat in section["threats"]
+    )
+    return timings
+
+
+if __name__ == "__main__":
+    timings = benchmark_attack_model_view()
+    print(f"View of {timings['scenarios']} scenarios built in {timings['build'] * 1000:.0f} ms; one page in "
+          f"{timings['page'] * 1e6:.1f} us sends {timings['page_characters']} of {timings['model_characters']} characters")
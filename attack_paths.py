@@ -0,0 +1,297 @@
+# attack_paths.py
+
+import heapq
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from risk_model import load_risk_model, scenario_codes, score_codes
+
+# Scenario metrics a path can be ranked by, computed from the likelihood and impact ratings
+PATH_METRICS = {
+    "risk": "Risk Level",
+    "feasibility": "Attack Feasibility",
+    "impact": "Impact",
+}
+
+# Levels of an attack path, from the asset to the scenario
+PATH_LEVELS = ["asset", "threat", "vector", "scenario"]
+
+
+# Function to build the key of an asset, threat, vector or scenario, in the format of get_scenario_key
+def path_key(*names):
+    return " - ".join(str(name) for name in names)
+
+
+def score_risk_rows(rows, metric="risk", model=None):
+    """
+    Returns {scenario key: score} for assessed scenarios (entries of risk_assessment.json). Scores are the
+    risk value (1 = lowest), the attack feasibility or the impact rating (1 = lowest). Scenarios without
+    an attack feasibility ("Not Applicable") are left out.
+    """
+    if not rows:
+        return {}
+    model = model or load_risk_model()
+    codes = [scenario_codes(model, row) for row in rows]
+    scores = score_codes(model, [c[0] for c in codes], [c[1] for c in codes])
+    values = {"risk": scores["risk"], "feasibility": scores["feasibility"] + 1, "impact": scores["impact"] + 1}[metric]
+    return {
+        path_key(row["asset"], row["threat"], row["vector"], row["scenario_id"]): float(value)
+        for row, value, feasibility in zip(rows, values, scores["feasibility"])
+        if feasibility >= 0
+    }
+
+
+# Function to compute max(bound of children) for every parent from CSR child pointers, -inf for no children
+def _max_children(child_bounds, child_ptr):
+    result = np.full(len(child_ptr) - 1, -np.inf)
+    has_children = np.diff(child_ptr) > 0
+    if has_children.any():
+        result[has_children] = np.maximum.reduceat(child_bounds, child_ptr[:-1][has_children])
+    return result
+
+
+def build_path_index(assets, scenario_scores, node_scores=None):
+    """
+    Flattens the asset -> threat -> vector -> scenario tree of the unified attack model into one array
+    per level with CSR child pointers, and memoizes the bound of every subtree: the best score of any
+    path through it. Unscored scenarios get -inf and are never returned.
+
+    Parameters:
+    assets (list): Asset dictionaries of the unified attack model.
+    scenario_scores (dict): Score per scenario key (see score_risk_rows).
+    node_scores (dict): Optional additive score per asset, threat or vector key (path_key of its names),
+        added to every path through that node.
+    """
+    node_scores = node_scores or {}
+    keys = {level: [] for level in PATH_LEVELS}
+    names = {level: [] for level in PATH_LEVELS}
+    child_ptr = {level: [0] for level in PATH_LEVELS[:-1]}
+
+    for asset in assets:
+        keys["asset"].append(path_key(asset["name"]))
+        names["asset"].append(asset["name"])
+        for threat in asset["threats"]:
+            keys["threat"].append(path_key(asset["name"], threat["name"]))
+            names["threat"].append(threat["name"])
+            for vector in threat["vectors"]:
+                keys["vector"].append(path_key(asset["name"], threat["name"], vector["vector_name"]))
+                names["vector"].append(vector["vector_name"])
+                for scenario in vector["scenarios"]:
+                    keys["scenario"].append(path_key(asset["name"], threat["name"], vector["vector_name"], scenario["scenario_id"]))
+                    names["scenario"].append(scenario["scenario_description"])
+                child_ptr["vector"].append(len(keys["scenario"]))
+            child_ptr["threat"].append(len(keys["vector"]))
+        child_ptr["asset"].append(len(keys["threat"]))
+
+    scores = {
+        level: np.array([node_scores.get(key, 0.0) for key in keys[level]], dtype=np.float64)
+        for level in PATH_LEVELS[:-1]
+    }
+    scores["scenario"] = np.array([scenario_scores.get(key, -np.inf) for key in keys["scenario"]], dtype=np.float64)
+    child_ptr = {level: np.array(ptr, dtype=np.int64) for level, ptr in child_ptr.items()}
+
+    # Subtree bounds, bottom-up: own score plus the best bound among the children
+    bounds = {"scenario": scores["scenario"]}
+    for level, child_level in zip(PATH_LEVELS[-2::-1], PATH_LEVELS[:0:-1]):
+        bounds[level] = scores[level] + _max_children(bounds[child_level], child_ptr[level])
+
+    return {"keys": keys, "names": names, "scores": scores, "bounds": bounds, "child_ptr": child_ptr, "sorted_children": {}}
+
+
+# Function to return the children of a node sorted by decreasing bound, memoized per node
+def _sorted_children(index, level, node):
+    cache_key = (level, node)
+    if cache_key not in index["sorted_children"]:
+        if level is None:
+            children = np.arange(len(index["keys"]["asset"]))
+            bounds = index["bounds"]["asset"]
+        else:
+            child_level = PATH_LEVELS[PATH_LEVELS.index(level) + 1]
+            start, end = index["child_ptr"][level][node], index["child_ptr"][level][node + 1]
+            children = np.arange(start, end)
+            bounds = index["bounds"][child_level][start:end]
+        order = np.argsort(-bounds, kind="stable")
+        index["sorted_children"][cache_key] = children[order][np.isfinite(bounds[order])].tolist()
+    return index["sorted_children"][cache_key]
+
+
+def top_k_paths(index, k=10, asset=None):
+    """
+    Returns the k best asset -> threat -> vector -> scenario paths, best first, as (score, [asset, threat,
+    vector, scenario] node indices). Best-first search over the memoized subtree bounds: a heap entry is a
+    path prefix plus the rank of its last node among its siblings, prioritized by the prefix score plus
+    that node's bound. Popping an entry pushes its next sibling and its best child, so only about
+    k * depth entries are created instead of every path.
+
+    Parameters:
+    index (dict): Path index from build_path_index.
+    k (int): Number of paths to return.
+    asset (str): Only return paths of this asset, all assets if None.
+    """
+    if asset is None:
+        roots = _sorted_children(index, None, None)
+    else:
+        roots = [i for i in _sorted_children(index, None, None) if index["names"]["asset"][i] == asset]
+
+    heap = []
+    counter = 0
+
+    def push(prefix, prefix_score, siblings, rank, level):
+        nonlocal counter
+        if rank < len(siblings):
+            node = siblings[rank]
+            priority = prefix_score + index["bounds"][level][node]
+            heapq.heappush(heap, (-priority, counter, prefix, prefix_score, siblings, rank, level))
+            counter += 1
+
+    push((), 0.0, roots, 0, "asset")
+    paths = []
+    while heap and len(paths) < k:
+        negative_priority, _, prefix, prefix_score, siblings, rank, level = heapq.heappop(heap)
+        node = siblings[rank]
+        push(prefix, prefix_score, siblings, rank + 1, level)
+        path = prefix + (node,)
+        score = prefix_score + index["scores"][level][node]
+        if level == "scenario":
+            paths.append((-negative_priority, list(path)))
+        else:
+            child_level = PATH_LEVELS[PATH_LEVELS.index(level) + 1]
+            push(path, score, _sorted_children(index, level, node), 0, child_level)
+    return paths
+
+
+def top_k_paths_per_asset(index, k=10):
+    return {name: top_k_paths(index, k, asset=name) for name in index["names"]["asset"]}
+
+
+# Function to turn a path into a table row
+def describe_path(index, score, path):
+    asset, threat, vector, scenario = path
+    scenario_key = index["keys"]["scenario"][scenario]
+    return {
+        "Asset": index["names"]["asset"][asset],
+        "Threat": index["names"]["threat"][threat],
+        "Attack Vector": index["names"]["vector"][vector],
+        "Scenario ID": scenario_key.rsplit(" - ", 1)[1],
+        "Scenario": index["names"]["scenario"][scenario],
+        "Score": round(float(score), 4),
+    }
+
+
+# Function to score every path and sort them, the exhaustive baseline of top_k_paths
+def all_paths_sorted(index):
+    vector_of_scenario = np.repeat(np.arange(len(index["keys"]["vector"])), np.diff(index["child_ptr"]["vector"]))
+    threat_of_vector = np.repeat(np.arange(len(index["keys"]["threat"])), np.diff(index["child_ptr"]["threat"]))
+    asset_of_threat = np.repeat(np.arange(len(index["keys"]["asset"])), np.diff(index["child_ptr"]["asset"]))
+    threat = threat_of_vector[vector_of_scenario]
+    asset = asset_of_threat[threat]
+    scores = (index["scores"]["scenario"] + index["scores"]["vector"][vector_of_scenario]
+              + index["scores"]["threat"][threat] + index["scores"]["asset"][asset])
+    order = np.argsort(-scores, kind="stable")
+    order = order[np.isfinite(scores[order])]
+    return [(float(scores[s]), [int(asset[s]), int(threat[s]), int(vector_of_scenario[s]), int(s)]) for s in order]
+
+
+# Function to generate a synthetic unified attack model and random scenario scores for benchmarking
+def generate_benchmark_model(n_assets=10, n_threats=10, n_vectors=10, n_scenarios=100, seed=0):
+    rng = np.random.default_rng(seed)
+    assets = [
+        {
+            "name": f"Asset {a}",
+            "threats": [
+                {
+                    "name": f"Threat {t}",
+                    "vectors": [
+                        {
+                            "vector_name": f"Vector {v}",
+                            "scenarios": [{"scenario_id": f"scenario_{s}", "scenario_description": f"Scenario {a}-{t}-{v}-{s}"} for s in range(n_scenarios)],
+                        }
+                        for v in range(n_vectors)
+                    ],
+                }
+                for t in range(n_threats)
+            ],
+        }
+        for a in range(n_assets)
+    ]
+    scenario_scores = {
+        path_key(f"Asset {a}", f"Threat {t}", f"Vector {v}", f"scenario_{s}"): float(rng.integers(1, 6))
+        for a in range(n_assets) for t in range(n_threats) for v in range(n_vectors) for s in range(n_scenarios)
+    }
+    node_scores = {path_key(f"Asset {a}", f"Threat {t}"): float(rng.random()) for a in range(n_assets) for t in range(n_threats)}
+    return assets, scenario_scores, node_scores
+
+
+def benchmark_attack_paths(k=10, **kwargs):
+    """
+    Times the best-first top-k search against scoring and sorting every path (10^5 paths by default).
+    """
+    assets, scenario_scores, node_scores = generate_benchmark_model(**kwargs)
+    start = time.perf_counter()
+    index = build_path_index(assets, scenario_scores, node_scores)
+    timings = {"paths": len(index["keys"]["scenario"]), "build": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    best = top_k_paths(index, k)
+    timings["top_k"] = time.perf_counter() - start
+    start = time.perf_counter()
+    top_k_paths_per_asset(index, k)
+    timings["top_k_per_asset"] = time.perf_counter() - start
+    start = time.perf_counter()
+    exhaustive = all_paths_sorted(index)[:k]
+    timings["exhaustive"] = time.perf_counter() - start
+
+    if [score for score, _ in best] != [score for score, _ in exhaustive]:
+        raise AssertionError("Best-first and exhaustive top-k scores differ.")
+    return timings
+
+
+# Function to read the assets of the unified attack model, cached until the file changes
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_unified_assets(file_path, mtime):
+    with open(file_path, "r") as file:
+        return json.load(file)["assets"]
+
+
+@st.fragment
+def display_attack_paths(risk_rows):
+    st.subheader("Top Attack Paths")
+    st.markdown("Ranks the asset → threat → attack vector → scenario paths of the attack model by the ratings of their scenarios.")
+
+    unified_attack_model_path = os.path.join(os.getcwd(), ".files\\unified_attack_model.json")
+    if not os.path.exists(unified_attack_model_path):
+        st.write("Generate the attack model first.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        metric = st.selectbox("Rank by", list(PATH_METRICS), format_func=PATH_METRICS.get, key="attack_paths_metric")
+    with col2:
+        per_asset = st.radio("Scope", ["All assets", "Per asset"], horizontal=True, key="attack_paths_scope") == "Per asset"
+    with col3:
+        k = int(st.number_input("Paths (K)", 1, 1000, 10, key="attack_paths_k"))
+
+    assets = load_unified_assets(unified_attack_model_path, os.path.getmtime(unified_attack_model_path))
+    index = build_path_index(assets, score_risk_rows(risk_rows, metric))
+    if per_asset:
+        ranked = [(rank, path) for paths in top_k_paths_per_asset(index, k).values() for rank, path in enumerate(paths, 1)]
+    else:
+        ranked = list(enumerate(top_k_paths(index, k), 1))
+
+    if not ranked:
+        st.write("No rated scenario matches the attack model.")
+        return
+    st.dataframe(
+        pd.DataFrame([dict(Rank=rank, **describe_path(index, score, path)) for rank, (score, path) in ranked]),
+        hide_index=True,
+    )
+
+
+if __name__ == "__main__":
+    timings = benchmark_attack_paths()
+    print(f"{timings['paths']} paths: index built in {timings['build'] * 1000:.0f} ms, "
+          f"best-first top-10 {timings['top_k'] * 1000:.1f} ms, per asset {timings['top_k_per_asset'] * 1000:.1f} ms, "
+          f"scoring and sorting every path {timings['exhaustive'] * 1000:.1f} ms")
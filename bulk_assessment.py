@@ -0,0 +1,351 @@
+# bulk_assessment.py
+
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+from util import levels, impact_levels, rerun_fragment
+from rating_store import LIKELIHOOD_FACTORS, LIKELIHOOD_CODES, IMPACT_FACTORS, IMPACT_CODES, likelihood_entries, impact_entries
+from likelihood_assessment_full import load_attack_model_scenarios
+from impact_assessment import load_likelihood_assessment
+from pre_rating import load_pre_rating_drafts
+from scenario_similarity import SIMILARITY_THRESHOLD, cluster_scenarios
+
+SCENARIO_COLUMNS = ["Asset", "Threat", "Attack Vector", "Scenario ID", "Scenario Description"]
+KEY_COLUMNS = ["Asset", "Threat", "Attack Vector", "Scenario ID"]
+RATIONALE_COLUMN = "Pre-rating Rationale"
+DUPLICATE_COLUMN = "Duplicate Of"
+
+
+# Function to build the rating grid: one row per scenario, one column per factor
+def build_grid(scenarios, factor_levels, ratings_key=None):
+    rows = []
+    for scenario in scenarios:
+        row = {
+            "Asset": scenario["asset"],
+            "Threat": scenario["threat"],
+            "Attack Vector": scenario["vector"],
+            "Scenario ID": scenario["scenario_id"],
+            "Scenario Description": scenario["scenario_desc"],
+        }
+        existing = scenario.get(ratings_key, []) if ratings_key else []
+        existing_levels = {factor["Factor"]: factor["Level"] for factor in existing}
+        for factor in factor_levels:
+            row[factor] = existing_levels.get(factor)
+        row[RATIONALE_COLUMN] = " ".join(
+            f"{factor['Factor']}: {factor['Rationale']}" for factor in existing if factor.get("Rationale")
+        )
+        rows.append(row)
+
+    grid = pd.DataFrame(rows, columns=SCENARIO_COLUMNS + list(factor_levels) + [RATIONALE_COLUMN])
+    if not grid[RATIONALE_COLUMN].any():
+        grid = grid.drop(columns=[RATIONALE_COLUMN])
+    return grid
+
+
+# Function to attach the LLM draft ratings to the scenarios that have no ratings yet
+def apply_drafts(scenarios, drafts, ratings_key):
+    if not drafts:
+        return scenarios
+    drafted = []
+    for scenario in scenarios:
+        draft = drafts.get((scenario["asset"], scenario["threat"], scenario["vector"], scenario["scenario_id"]))
+        if draft is not None and ratings_key not in scenario and ratings_key in draft:
+            scenario = dict(scenario, **{ratings_key: draft[ratings_key]})
+        drafted.append(scenario)
+    return drafted
+
+
+# Function to fill one factor with a level, either on all rows or only on the empty cells
+def fill_factor(grid, factor, level, only_empty=True, asset=None):
+    grid = grid.copy()
+    mask = pd.Series(True, index=grid.index)
+    if only_empty:
+        mask &= grid[factor].isna()
+    if asset:
+        mask &= grid["Asset"] == asset
+    grid.loc[mask, factor] = level
+    return grid
+
+
+# Function to copy each rated cell down into the empty cells below it
+def copy_down(grid, factor_levels):
+    grid = grid.copy()
+    factors = list(factor_levels)
+    grid[factors] = grid[factors].ffill()
+    return grid
+
+
+# Function to return the scenario key of every row of the grid
+def grid_keys(grid):
+    return grid[KEY_COLUMNS].astype(str).agg(" - ".join, axis=1)
+
+
+# Function to mark the near-duplicate scenarios of the grid with the key of their cluster representative
+def mark_duplicates(grid, threshold=SIMILARITY_THRESHOLD):
+    grid = grid.copy()
+    representatives = cluster_scenarios(grid["Scenario Description"].fillna("").tolist(), threshold)["representatives"]
+    keys = grid_keys(grid).to_numpy()
+    duplicates = np.where(representatives != np.arange(len(grid)), keys[representatives], None)
+    if DUPLICATE_COLUMN in grid.columns:
+        grid[DUPLICATE_COLUMN] = duplicates
+    else:
+        grid.insert(len(SCENARIO_COLUMNS), DUPLICATE_COLUMN, duplicates)
+    return grid
+
+
+# Function to copy the ratings of each representative to the scenarios marked as its duplicates
+def propagate_representative_ratings(grid, factor_levels, only_empty=True):
+    grid = grid.copy()
+    rows = pd.Series(np.arange(len(grid)), index=grid_keys(grid).to_numpy())
+    duplicates = np.flatnonzero(grid[DUPLICATE_COLUMN].notna().to_numpy())
+    representatives = rows.reindex(grid[DUPLICATE_COLUMN].iloc[duplicates]).to_numpy()
+    known = ~np.isnan(representatives)
+    duplicates, representatives = duplicates[known], representatives[known].astype(int)
+    for factor in factor_levels:
+        column = grid.columns.get_loc(factor)
+        source = grid.iloc[representatives, column].to_numpy()
+        mask = pd.notna(source)
+        if only_empty:
+            mask &= grid.iloc[duplicates, column].isna().to_numpy()
+        grid.iloc[duplicates[mask], column] = source[mask]
+    return grid
+
+
+# Function to validate every cell of the grid, returning a list of problems
+def validate_grid(grid, factor_levels):
+    problems = []
+    for factor, options in factor_levels.items():
+        column = grid[factor]
+        for index in grid.index[column.isna()]:
+            problems.append(f"{grid.at[index, 'Scenario ID']} ({grid.at[index, 'Asset']}): {factor} is not rated.")
+        for index in grid.index[column.notna() & ~column.isin(options)]:
+            problems.append(f"{grid.at[index, 'Scenario ID']} ({grid.at[index, 'Asset']}): '{grid.at[index, factor]}' is not a valid level for {factor}.")
+    return problems
+
+
+# Function to merge ratings from an imported grid into the current grid, matching scenarios by key
+def merge_imported_grid(grid, imported, factor_levels):
+    missing = [column for column in KEY_COLUMNS if column not in imported.columns]
+    if missing:
+        raise ValueError(f"Imported file is missing the columns: {', '.join(missing)}.")
+    factors = [factor for factor in factor_levels if factor in imported.columns]
+    imported = imported.astype({column: str for column in KEY_COLUMNS}).drop_duplicates(subset=KEY_COLUMNS, keep="last")
+    merged = grid.drop(columns=factors).merge(imported[KEY_COLUMNS + factors], on=KEY_COLUMNS, how="left")
+    for factor in factors:
+        merged[factor] = merged[factor].where(merged[factor].notna(), grid[factor].values)
+    return merged[grid.columns]
+
+
+def read_grid_file(uploaded_file):
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        return pd.read_excel(uploaded_file, dtype=str)
+    return pd.read_csv(uploaded_file, dtype=str, keep_default_na=False).replace("", None)
+
+
+def grid_to_xlsx(grid):
+    buffer = io.BytesIO()
+    grid.to_excel(buffer, index=False, sheet_name="Ratings")
+    return buffer.getvalue()
+
+
+def _grid_records(grid):
+    return grid.to_dict(orient="records")
+
+
+# Function to convert a validated likelihood grid into the final likelihood assessment scenarios
+def likelihood_scenarios_from_grid(grid):
+    scenarios = []
+    for row in _grid_records(grid):
+        codes = [LIKELIHOOD_CODES[factor][row[factor]] for factor in LIKELIHOOD_FACTORS]
+        scenarios.append({
+            "asset": row["Asset"],
+            "threat": row["Threat"],
+            "vector": row["Attack Vector"],
+            "scenario_id": row["Scenario ID"],
+            "scenario_desc": row["Scenario Description"],
+            "Likelihood": likelihood_entries(codes),
+        })
+    return scenarios
+
+
+# Function to convert a validated impact grid into the final impact assessment scenarios
+def impact_scenarios_from_grid(grid, likelihood_scenarios):
+    likelihood_by_key = {
+        (s["asset"], s["threat"], s["vector"], s["scenario_id"]): s["Likelihood"] for s in likelihood_scenarios
+    }
+    scenarios = []
+    for row in _grid_records(grid):
+        key = (row["Asset"], row["Threat"], row["Attack Vector"], row["Scenario ID"])
+        scenarios.append({
+            "asset": row["Asset"],
+            "threat": row["Threat"],
+            "vector": row["Attack Vector"],
+            "scenario_id": row["Scenario ID"],
+            "scenario_desc": row["Scenario Description"],
+            "Likelihood": likelihood_by_key[key],
+            "Impact": impact_entries([IMPACT_CODES[factor][row[factor]] for factor in IMPACT_FACTORS]),
+        })
+    return scenarios
+
+
+def bulk_rating_grid(kind, scenarios, factor_levels, ratings_key, save_scenarios):
+    """
+    Renders an editable grid of all scenarios x factors with fill, copy-down, duplicate grouping
+    with rating propagation, CSV/XLSX import/export and a single validated save.
+
+    Parameters:
+    kind (str): "likelihood" or "impact", used to namespace the session state.
+    scenarios (list): Scenario dictionaries with asset, threat, vector, scenario_id and scenario_desc.
+    factor_levels (dict): Factor name -> list of allowed levels.
+    ratings_key (str): Key of existing ratings in the scenarios ("Likelihood" or "Impact").
+    save_scenarios (callable): Called with the validated grid to persist it.
+    """
+    grid_key = f"bulk_{kind}_grid"
+    version_key = f"bulk_{kind}_version"
+    if grid_key not in st.session_state:
+        st.session_state[grid_key] = build_grid(scenarios, factor_levels, ratings_key)
+        st.session_state[version_key] = 0
+
+    def replace_grid(grid):
+        st.session_state[grid_key] = grid
+        st.session_state[version_key] += 1
+        rerun_fragment()
+
+    column_config = {column: st.column_config.TextColumn(column, disabled=True) for column in SCENARIO_COLUMNS + [DUPLICATE_COLUMN, RATIONALE_COLUMN]}
+    for factor, options in factor_levels.items():
+        column_config[factor] = st.column_config.SelectboxColumn(factor, options=options, width="medium")
+
+    edited = st.data_editor(
+        st.session_state[grid_key],
+        column_config=column_config,
+        hide_index=True,
+        num_rows="fixed",
+        width="stretch",
+        key=f"bulk_{kind}_editor_{st.session_state[version_key]}",
+    )
+
+    rated = int(edited[list(factor_levels)].notna().all(axis=1).sum())
+    st.write(f"Fully rated scenarios: {rated} / {len(edited)}")
+
+    st.subheader("Fill")
+    col1, col2, col3, col4 = st.columns([2, 3, 2, 2])
+    with col1:
+        fill_factor_name = st.selectbox("Factor", list(factor_levels), key=f"bulk_{kind}_fill_factor")
+    with col2:
+        fill_level = st.selectbox("Level", factor_levels[fill_factor_name], key=f"bulk_{kind}_fill_level")
+    with col3:
+        assets = sorted(edited["Asset"].unique())
+        fill_asset = st.selectbox("Asset", ["All assets"] + assets, key=f"bulk_{kind}_fill_asset")
+    with col4:
+        only_empty = st.checkbox("Only empty cells", value=True, key=f"bulk_{kind}_fill_empty")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Fill Column", key=f"bulk_{kind}_fill"):
+            replace_grid(fill_factor(edited, fill_factor_name, fill_level, only_empty, None if fill_asset == "All assets" else fill_asset))
+    with col2:
+        if st.button("Copy Down Into Empty Cells", key=f"bulk_{kind}_copy_down"):
+            replace_grid(copy_down(edited, factor_levels))
+
+    st.subheader("Duplicates")
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        threshold = st.slider("Similarity threshold", 0.3, 1.0, SIMILARITY_THRESHOLD, 0.05, key=f"bulk_{kind}_duplicate_threshold",
+                              help="Cosine similarity of the scenario descriptions above which two scenarios are duplicates")
+    with col2:
+        propagate_only_empty = st.checkbox("Only empty cells", value=True, key=f"bulk_{kind}_propagate_empty")
+    if DUPLICATE_COLUMN in edited.columns:
+        duplicates = int(edited[DUPLICATE_COLUMN].notna().sum())
+        representatives = edited[DUPLICATE_COLUMN].nunique()
+        st.write(f"{duplicates} scenarios are duplicates of {representatives} representatives: rate the {len(edited) - duplicates} other scenarios and copy the ratings.")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Find Duplicates", key=f"bulk_{kind}_find_duplicates"):
+            replace_grid(mark_duplicates(edited, threshold))
+    with col2:
+        if st.button("Copy Representative Ratings", key=f"bulk_{kind}_propagate", disabled=DUPLICATE_COLUMN not in edited.columns):
+            replace_grid(propagate_representative_ratings(edited, factor_levels, propagate_only_empty))
+
+    st.subheader("Import / Export")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "Export CSV",
+            data=edited.to_csv(index=False),
+            file_name=f"{kind}_ratings.csv",
+            mime="text/csv",
+            key=f"bulk_{kind}_export_csv",
+        )
+        try:
+            st.download_button(
+                "Export XLSX",
+                data=grid_to_xlsx(edited),
+                file_name=f"{kind}_ratings.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key=f"bulk_{kind}_export_xlsx",
+            )
+        except ImportError:
+            st.caption("Install openpyxl to export XLSX files.")
+    with col2:
+        uploaded_file = st.file_uploader("Import ratings (CSV or XLSX)", type=["csv", "xlsx"], key=f"bulk_{kind}_import")
+        if uploaded_file is not None and st.button("Apply Imported Ratings", key=f"bulk_{kind}_apply_import"):
+            try:
+                replace_grid(merge_imported_grid(edited, read_grid_file(uploaded_file), factor_levels))
+            except ImportError:
+                st.error("Install openpyxl to import XLSX files.")
+            except ValueError as e:
+                st.error(f"Could not import ratings: {e}")
+
+    st.markdown("---")
+    if st.button(f"Save {kind.capitalize()} Assessment", key=f"bulk_{kind}_save"):
+        problems = validate_grid(edited, factor_levels)
+        if problems:
+            st.error(f"{len(problems)} problem(s) found. Please rate every factor before saving.")
+            st.write("\n".join(f"- {problem}" for problem in problems[:50]))
+        else:
+            st.session_state[grid_key] = edited
+            save_scenarios(edited)
+
+
+@st.fragment
+def bulk_likelihood_assessment():
+    scenarios = apply_drafts(load_attack_model_scenarios(), load_pre_rating_drafts("likelihood"), "Likelihood")
+    if not scenarios:
+        st.write("No scenarios available")
+        return
+
+    def save_scenarios(grid):
+        final_result = {"Scenarios": likelihood_scenarios_from_grid(grid)}
+        file_path = os.path.join(os.getcwd(), ".files\\final_likelihood_assessment.json")
+        with open(file_path, "w") as f:
+            json.dump(final_result, f, indent=4)
+        st.success("Likelihood Assessment successfully submitted.")
+        st.session_state.likelihood_assessment_complete = True
+        st.rerun()  # Refresh the whole app so the Impact Assessment tab picks up the result
+
+    st.title("Bulk Likelihood Evaluation")
+    bulk_rating_grid("likelihood", scenarios, levels, "Likelihood", save_scenarios)
+
+
+@st.fragment
+def bulk_impact_assessment():
+    likelihood_data = load_likelihood_assessment()
+    if likelihood_data is None:
+        st.write("No data available from Likelihood Assessment. Please complete the Likelihood Assessment first.")
+        return
+
+    def save_scenarios(grid):
+        final_result = {"Scenarios": impact_scenarios_from_grid(grid, likelihood_data["Scenarios"])}
+        file_path = os.path.join(os.getcwd(), ".files\\final_impact_assessment.json")
+        with open(file_path, "w") as f:
+            json.dump(final_result, f, indent=4)
+        st.success("Impact Assessment successfully submitted.")
+        st.session_state.impact_assessment_complete = True
+        st.rerun()  # Refresh the whole app so the Risk Evaluation tab picks up the result
+
+    st.title("Bulk Impact Assessment")
+    scenarios = apply_drafts(likelihood_data["Scenarios"], load_pre_rating_drafts("impact"), "Impact")
+    bulk_rating_grid("impact", scenarios, impact_levels, "Impact", save_scenarios)
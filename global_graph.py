@@ -0,0 +1,144 @@
+# global_graph.py
+
+import re
+import numpy as np
+
+# Node kinds of the global attack graph and the layer each kind is drawn on
+NODE_KINDS = ["asset", "threat", "vector", "control", "scenario"]
+KIND_LAYERS = {"asset": 0, "threat": 1, "vector": 2, "control": 2, "scenario": 3}
+
+
+# Function to normalize a label so that the same threat, vector or scenario written slightly differently
+# in two assets ("OBD-II port access" / "OBD-II Port Access.") is interned as one node
+def normalize_label(label):
+    return re.sub(r"[\W_]+", " ", str(label)).strip().casefold()
+
+
+# Function to build the (row pointer, column) arrays of a CSR structure from (row, column) pairs
+def _csr(rows, columns, n_rows):
+    order = np.lexsort((columns, rows))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, columns[order], order
+
+
+def build_global_graph(assets):
+    """
+    Builds one attack graph across all assets in which threats, vectors, controls and scenarios are
+    interned by kind and normalized label, so that a node shared by several assets exists only once.
+
+    The graph is a dictionary of compact arrays:
+    - "kinds" (int8, index into NODE_KINDS), "labels" (first label seen) and "index" ((kind, normalized
+      label) -> node) describe the nodes,
+    - "indptr"/"indices" (successors) and "rindptr"/"rindices" (predecessors) are CSR adjacency arrays,
+      "sources"/"targets" list the edges in CSR order,
+    - "node_asset_ptr"/"node_asset_idx" and "edge_asset_ptr"/"edge_asset_idx" map every node and edge
+      to the indices of the assets in "asset_names" it belongs to.
+
+    Parameters:
+    assets (list): Asset dictionaries of the unified attack model.
+    """
+    index = {}
+    kinds = []
+    labels = []
+    node_memberships = set()
+    edge_index = {}
+    edge_memberships = set()
+
+    def intern(kind, label, asset):
+        key = (kind, normalize_label(label))
+        if key not in index:
+            index[key] = len(labels)
+            kinds.append(NODE_KINDS.index(kind))
+            labels.append(label)
+        node_memberships.add((index[key], asset))
+        return index[key]
+
+    def connect(source, target, asset):
+        edge = edge_index.setdefault((source, target), len(edge_index))
+        edge_memberships.add((edge, asset))
+
+    for asset, asset_data in enumerate(assets):
+        asset_node = intern("asset", asset_data["name"], asset)
+        for threat_data in asset_data["threats"]:
+            threat_node = intern("threat", threat_data["name"], asset)
+            connect(asset_node, threat_node, asset)
+            for vector in threat_data["vectors"]:
+                vector_node = intern("vector", vector["vector_name"], asset)
+                connect(threat_node, vector_node, asset)
+                for scenario in vector["scenarios"]:
+                    connect(vector_node, intern("scenario", scenario["scenario_description"], asset), asset)
+            for control in threat_data["controls"]:
+                connect(threat_node, intern("control", control, asset), asset)
+
+    n_nodes = len(labels)
+    edges = np.array(list(edge_index), dtype=np.int64).reshape(-1, 2)
+    sources, targets = edges[:, 0], edges[:, 1]
+    indptr, indices, order = _csr(sources, targets, n_nodes)
+    rindptr, rindices, _ = _csr(targets, sources, n_nodes)
+
+    # Renumber the edges in CSR order before mapping them to assets
+    edge_rank = np.empty(len(order), dtype=np.int64)
+    edge_rank[order] = np.arange(len(order))
+    edge_pairs = np.array(sorted(edge_memberships), dtype=np.int64).reshape(-1, 2)
+    edge_asset_ptr, edge_asset_idx, _ = _csr(edge_rank[edge_pairs[:, 0]], edge_pairs[:, 1], len(order))
+    node_pairs = np.array(sorted(node_memberships), dtype=np.int64).reshape(-1, 2)
+    node_asset_ptr, node_asset_idx, _ = _csr(node_pairs[:, 0], node_pairs[:, 1], n_nodes)
+
+    return {
+        "asset_names": [asset_data["name"] for asset_data in assets],
+        "kinds": np.array(kinds, dtype=np.int8),
+        "labels": labels,
+        "index": index,
+        "indptr": indptr,
+        "indices": indices,
+        "rindptr": rindptr,
+        "rindices": rindices,
+        "sources": sources[order],
+        "targets": indices,
+        "node_asset_ptr": node_asset_ptr,
+        "node_asset_idx": node_asset_idx,
+        "edge_asset_ptr": edge_asset_ptr,
+        "edge_asset_idx": edge_asset_idx,
+    }
+
+
+def find_node(graph, kind, label):
+    return graph["index"].get((kind, normalize_label(label)))
+
+
+def successors(graph, node):
+    return graph["indices"][graph["indptr"][node]:graph["indptr"][node + 1]]
+
+
+def predecessors(graph, node):
+    return graph["rindices"][graph["rindptr"][node]:graph["rindptr"][node + 1]]
+
+
+def node_assets(graph, node):
+    asset_indices = graph["node_asset_idx"][graph["node_asset_ptr"][node]:graph["node_asset_ptr"][node + 1]]
+    return [graph["asset_names"][asset] for asset in asset_indices]
+
+
+# Function to compute the nodes and edges that belong to any of the given assets, as boolean masks
+def asset_subgraph(graph, asset_names):
+    selected = [graph["asset_names"].index(name) for name in asset_names if name in graph["asset_names"]]
+    masks = []
+    for ptr, idx in (("node_asset_ptr", "node_asset_idx"), ("edge_asset_ptr", "edge_asset_idx")):
+        owners = np.repeat(np.arange(len(graph[ptr]) - 1), np.diff(graph[ptr]))
+        mask = np.zeros(len(graph[ptr]) - 1, dtype=bool)
+        mask[owners[np.isin(graph[idx], selected)]] = True
+        masks.append(mask)
+    return masks[0], masks[1]
+
+
+def shared_nodes(graph, min_assets=2, kinds=("threat", "vector", "scenario")):
+    """
+    Returns (kind, label, number of assets) for the nodes used by at least `min_assets` assets,
+    most shared first.
+    """
+    counts = np.diff(graph["node_asset_ptr"])
+    kind_codes = [NODE_KINDS.index(kind) for kind in kinds]
+    nodes = np.flatnonzero((counts >= min_assets) & np.isin(graph["kinds"], kind_codes))
+    nodes = nodes[np.argsort(-counts[nodes], kind="stable")]
+    return [(NODE_KINDS[graph["kinds"][node]], graph["labels"][node], int(counts[node])) for node in nodes]
@@ -0,0 +1,370 @@
+# graph_export.py
+
+import hashlib
+import io
+import json
+import math
+import os
+import time
+import zipfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+from attack_graph import (
+    GRAPH_LAYOUT_DIR, GRAPH_OPTIONS, asset_content_hash, build_attack_graph_elements,
+    get_attack_graph_layout, generate_benchmark_assets,
+)
+
+# Directory, next to the graph pages, holding the exported images
+GRAPH_IMAGES_DIR = "images"
+
+# Bumped whenever the drawing below changes, so that exported images are drawn again
+GRAPH_EXPORT_VERSION = 1
+
+# Image formats the attack graphs can be exported to
+EXPORT_FORMATS = ["svg", "png"]
+
+# Drawing constants, in layout units (one unit is one pixel at scale 1)
+BACKGROUND_COLOR = "#222222"
+FONT_SIZE = 14
+CHAR_WIDTH = 7.5
+NODE_HEIGHT = 26
+NODE_RADIUS = 10
+MARGIN = 40
+BEZIER_STEPS = 16
+
+# Largest side of an exported PNG in pixels; larger graphs are scaled down, the SVG keeps every detail
+PNG_MAX_SIDE = 8192
+
+# Scale under which PNG labels would be unreadable and are left out
+PNG_MIN_LABEL_SCALE = 0.35
+
+# Legend of the exported images, drawn in a row under the title: (color, label)
+LEGEND = [
+    ("#0000ff", "Asset"),
+    ("#ff0000", "Threat"),
+    ("#ff8080", "Attack Vector"),
+    ("#ffa500", "Scenario"),
+    ("#00ff00", "Control"),
+]
+
+
+# Function to estimate the drawn width of a label, the same for SVG and PNG so that both have the same geometry
+def _label_width(label):
+    return max(len(line) for line in str(label).split("\n")) * CHAR_WIDTH
+
+
+# Function to return the (fill, border) colors of a vis-network node
+def _node_colors(node):
+    color = node.get("color", "#97c2fc")
+    if isinstance(color, dict):
+        return color.get("background", "#97c2fc"), color.get("border", color.get("background", "#97c2fc"))
+    return color, color
+
+
+# Function to place the legend entries under the title, returning (x, y, color, label) with y the text baseline
+def _legend_entries(left, top):
+    x, y = left + MARGIN, top + MARGIN + FONT_SIZE * 1.8
+    entries = []
+    for color, label in LEGEND:
+        entries.append((x, y, color, label))
+        x += 16 + _label_width(label) + 20
+    return entries
+
+
+# Function to return the half width and half height of a node's shape
+def _node_extent(node):
+    if node["shape"] in ("box", "ellipse"):
+        return _label_width(node["label"]) / 2 + 10, NODE_HEIGHT / 2
+    return NODE_RADIUS, NODE_RADIUS
+
+
+# Function to compute the control points of the edges, drawn as vis-network's horizontal cubic Bezier curves
+# from the right side of their source to the left side of their target, as an (edges, 4, 2) array
+def _edge_controls(nodes, edges):
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    x = np.array([node["x"] for node in nodes], dtype=np.float64)
+    y = np.array([node["y"] for node in nodes], dtype=np.float64)
+    half_width = np.array([_node_extent(node)[0] for node in nodes])
+    sources = np.array([index[edge["from"]] for edge in edges], dtype=np.int64)
+    targets = np.array([index[edge["to"]] for edge in edges], dtype=np.int64)
+    x1, y1 = x[sources] + half_width[sources], y[sources]
+    x2, y2 = x[targets] - half_width[targets], y[targets]
+    dx = (x2 - x1) * GRAPH_OPTIONS["edges"]["smooth"]["roundness"]
+    return np.stack([np.stack([x1, y1], 1), np.stack([x1 + dx, y1], 1), np.stack([x2 - dx, y2], 1), np.stack([x2, y2], 1)], 1)
+
+
+# Function to sample the Bezier curves of the edges, as an (edges, steps + 1, 2) array
+def _bezier_points(controls, steps=BEZIER_STEPS):
+    t = np.linspace(0.0, 1.0, steps + 1)[:, None]
+    basis = np.hstack([(1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t ** 2, t ** 3])
+    return np.einsum("sk,ekd->esd", basis, controls)
+
+
+def build_graph_scene(asset_data, layout_dir=None, node_risk=None):
+    """
+    Returns the nodes and edges of an asset's attack graph, fully expanded, with the positions of the
+    layered layout (cached by content hash in layout_dir, as for the HTML pages) and the size of the
+    drawing: (nodes, edges, (min_x, min_y, width, height)).
+
+    Parameters:
+    asset_data (dict): Asset of the unified attack model.
+    layout_dir (str): Directory of the cached layouts, no disk cache if None.
+    node_risk (dict): Aggregated risk of the asset's nodes, drawn as their fill color.
+    """
+    nodes, edges = build_attack_graph_elements(asset_data, node_risk)
+    layout = get_attack_graph_layout(asset_data, nodes, edges, layout_dir)
+    for node in nodes:
+        node["x"], node["y"] = layout[node["id"]]
+
+    left = min(node["x"] - _node_extent(node)[0] for node in nodes) - MARGIN
+    right = max(node["x"] + _node_extent(node)[0] for node in nodes) + MARGIN
+    top = min(node["y"] - _node_extent(node)[1] for node in nodes) - MARGIN
+    bottom = max(node["y"] + _node_extent(node)[1] + FONT_SIZE * 1.5 for node in nodes) + MARGIN
+    # Room for the title and the legend
+    top -= FONT_SIZE * 5
+    legend_right = _legend_entries(left, top)[-1][0] + 16 + _label_width(LEGEND[-1][1])
+    right = max(right, left + 2 * MARGIN + _label_width(f"{asset_data['name']} - Attack Graph") * 1.4, legend_right + MARGIN)
+    bottom += FONT_SIZE * 2
+    return nodes, edges, (left, top, right - left, bottom - top)
+
+
+# Function to draw one node as SVG
+def _svg_node(node):
+    x, y = node["x"], node["y"]
+    fill, border = _node_colors(node)
+    half_width, half_height = _node_extent(node)
+    label = escape(str(node["label"]).replace("\n", " "))
+    shape = node["shape"]
+    parts = []
+    if shape == "box":
+        parts.append(f'<rect x="{x - half_width:.1f}" y="{y - half_height:.1f}" width="{2 * half_width:.1f}" height="{2 * half_height:.1f}" rx="4" fill="{fill}" stroke="{border}" stroke-width="2"/>')
+    elif shape == "ellipse":
+        parts.append(f'<ellipse cx="{x}" cy="{y}" rx="{half_width:.1f}" ry="{half_height:.1f}" fill="{fill}" stroke="{border}" stroke-width="2"/>')
+    elif shape == "diamond":
+        r = NODE_RADIUS * 1.3
+        parts.append(f'<polygon points="{x},{y - r} {x + r},{y} {x},{y + r} {x - r},{y}" fill="{fill}" stroke="{border}" stroke-width="2"/>')
+    else:
+        parts.append(f'<circle cx="{x}" cy="{y}" r="{NODE_RADIUS}" fill="{fill}" stroke="{border}" stroke-width="2"/>')
+    # Boxes and ellipses carry their label inside, the other shapes below
+    label_y = y + FONT_SIZE / 3 if shape in ("box", "ellipse") else y + half_height + FONT_SIZE
+    parts.append(f'<text x="{x}" y="{label_y:.1f}" text-anchor="middle">{label}</text>')
+    if node.get("title"):
+        parts.insert(0, f'<title>{escape(str(node["title"]))}</title>')
+    return f'<g>{"".join(parts)}</g>'
+
+
+def render_graph_svg(asset_name, nodes, edges, bounds):
+    """
+    Draws an attack graph scene (see build_graph_scene) as a standalone SVG document, with the node
+    tooltips as <title> elements.
+    """
+    left, top, width, height = bounds
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{left:.0f} {top:.0f} {width:.0f} {height:.0f}" '
+        f'width="{width:.0f}" height="{height:.0f}" font-family="sans-serif" font-size="{FONT_SIZE}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+        'orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="context-stroke"/></marker></defs>',
+        f'<rect x="{left:.0f}" y="{top:.0f}" width="{width:.0f}" height="{height:.0f}" fill="{BACKGROUND_COLOR}"/>',
+        f'<text x="{left + MARGIN:.0f}" y="{top + MARGIN:.0f}" fill="white" font-size="{FONT_SIZE * 1.4:.0f}">{escape(asset_name)} - Attack Graph</text>',
+        '<g fill="none" stroke-width="1.5">',
+    ]
+    for edge, control in zip(edges, _edge_controls(nodes, edges).tolist()):
+        (sx, sy), (c1x, c1y), (c2x, c2y), (ex, ey) = control
+        lines.append(
+            f'<path d="M {sx:.1f} {sy:.1f} C {c1x:.1f} {c1y:.1f} {c2x:.1f} {c2y:.1f} {ex:.1f} {ey:.1f}" '
+            f'stroke="{edge.get("color", "#848484")}" marker-end="url(#arrow)"/>'
+        )
+    lines.append('</g><g fill="white">')
+    lines.extend(_svg_node(node) for node in nodes)
+    lines.append("</g>")
+
+    for x, y, color, label in _legend_entries(left, top):
+        lines.append(f'<rect x="{x:.0f}" y="{y - 10:.0f}" width="10" height="10" fill="{color}"/>'
+                     f'<text x="{x + 16:.0f}" y="{y:.0f}" fill="white">{label}</text>')
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+# Function to load the default Pillow font at a given size (older Pillow versions only have a fixed size)
+def _png_font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def render_graph_png(asset_name, nodes, edges, bounds, max_side=PNG_MAX_SIDE):
+    """
+    Draws an attack graph scene (see build_graph_scene) as PNG bytes with Pillow, scaled down so that
+    no side exceeds max_side pixels.
+    """
+    from PIL import Image, ImageDraw
+
+    left, top, width, height = bounds
+    scale = min(1.0, max_side / max(width, height))
+    image = Image.new("RGB", (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+    font = _png_font(max(1, round(FONT_SIZE * scale)))
+    draw_labels = scale >= PNG_MIN_LABEL_SCALE
+
+    def point(x, y):
+        return ((x - left) * scale, (y - top) * scale)
+
+    line_width = max(1, round(1.5 * scale))
+    curves = (_bezier_points(_edge_controls(nodes, edges)) - [left, top]) * scale
+    for edge, points in zip(edges, curves.tolist()):
+        color = edge.get("color", "#848484")
+        draw.line([tuple(p) for p in points], fill=color, width=line_width)
+        # Arrow head along the last segment of the curve
+        (ax, ay), (bx, by) = points[-2], points[-1]
+        angle = math.atan2(by - ay, bx - ax)
+        head = [(bx, by)] + [(bx - 9 * scale * math.cos(angle + side), by - 9 * scale * math.sin(angle + side)) for side in (0.4, -0.4)]
+        draw.polygon([tuple(p) for p in head], fill=color)
+
+    for node in nodes:
+        x, y = node["x"], node["y"]
+        fill, border = _node_colors(node)
+        half_width, half_height = _node_extent(node)
+        shape = node["shape"]
+        if shape == "box":
+            draw.rounded_rectangle([point(x - half_width, y - half_height), point(x + half_width, y + half_height)],
+                                   radius=max(1, 4 * scale), fill=fill, outline=border, width=max(1, round(2 * scale)))
+        elif shape == "ellipse":
+            draw.ellipse([point(x - half_width, y - half_height), point(x + half_width, y + half_height)],
+                         fill=fill, outline=border, width=max(1, round(2 * scale)))
+        elif shape == "diamond":
+            r = NODE_RADIUS * 1.3
+            draw.polygon([point(x, y - r), point(x + r, y), point(x, y + r), point(x - r, y)], fill=fill, outline=border)
+        else:
+            draw.ellipse([point(x - NODE_RADIUS, y - NODE_RADIUS), point(x + NODE_RADIUS, y + NODE_RADIUS)], fill=fill, outline=border)
+        if draw_labels:
+            label_y = y if shape in ("box", "ellipse") else y + half_height + FONT_SIZE * 0.7
+            draw.text(point(x, label_y), str(node["label"]).replace("\n", " "), fill="white", font=font, anchor="mm")
+
+    if draw_labels:
+        draw.text(point(left + MARGIN, top + MARGIN), f"{asset_name} - Attack Graph", fill="white", font=_png_font(round(FONT_SIZE * 1.4 * scale)), anchor="ls")
+        for x, y, color, label in _legend_entries(left, top):
+            draw.rectangle([point(x, y - 10), point(x + 10, y)], fill=color)
+            draw.text(point(x + 16, y), label, fill="white", font=font, anchor="ls")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=3)
+    return buffer.getvalue()
+
+
+# Function to hash everything an asset's images are drawn from
+def graph_image_hash(asset_data, node_risk=None, formats=EXPORT_FORMATS):
+    content = json.dumps([asset_content_hash(asset_data), node_risk or {}, list(formats), GRAPH_EXPORT_VERSION, PNG_MAX_SIDE], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Function to export one asset's attack graph to images in GRAPH_IMAGES_DIR, returning their paths
+def export_attack_graph(asset_data, output_dir, formats=EXPORT_FORMATS, node_risk=None):
+    images_dir = os.path.join(output_dir, GRAPH_IMAGES_DIR)
+    os.makedirs(images_dir, exist_ok=True)
+    nodes, edges, bounds = build_graph_scene(asset_data, os.path.join(output_dir, GRAPH_LAYOUT_DIR), node_risk)
+    paths = []
+    for image_format in formats:
+        path = os.path.join(images_dir, f"{asset_data['name']}.{image_format}")
+        if image_format == "svg":
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(render_graph_svg(asset_data["name"], nodes, edges, bounds))
+        else:
+            with open(path, "wb") as file:
+                file.write(render_graph_png(asset_data["name"], nodes, edges, bounds))
+        paths.append(path)
+    return paths
+
+
+def export_attack_graphs(assets, output_dir, formats=EXPORT_FORMATS, parallel=True, max_workers=None, node_risk=None):
+    """
+    Exports the attack graphs of the assets to SVG and/or PNG files in GRAPH_IMAGES_DIR. Only assets whose
+    content, node risks or formats changed since the last export are drawn again, concurrently in worker
+    processes; images of assets that no longer exist are removed. Returns the paths of all images.
+
+    Parameters:
+    assets (list): Asset dictionaries of the unified attack model.
+    output_dir (str): Directory of the graph pages, whose cached layouts are reused.
+    formats (list): Image formats, among EXPORT_FORMATS.
+    parallel (bool): Draw the assets concurrently in worker processes.
+    max_workers (int): Number of worker processes, the number of CPUs by default.
+    node_risk (dict): Aggregated risk of the nodes per asset name (see risk_rollup.rollup_node_values).
+    """
+    node_risk = node_risk or {}
+    images_dir = os.path.join(output_dir, GRAPH_IMAGES_DIR)
+    os.makedirs(images_dir, exist_ok=True)
+    manifest_path = os.path.join(images_dir, "manifest.json")
+    recorded = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            recorded = json.load(file)
+
+    hashes = {asset["name"]: graph_image_hash(asset, node_risk.get(asset["name"]), formats) for asset in assets}
+    paths = {asset["name"]: [os.path.join(images_dir, f"{asset['name']}.{image_format}") for image_format in formats] for asset in assets}
+    changed = [
+        asset for asset in assets
+        if recorded.get(asset["name"]) != hashes[asset["name"]] or not all(os.path.exists(path) for path in paths[asset["name"]])
+    ]
+    risks = [node_risk.get(asset["name"]) for asset in changed]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(changed))
+    if not parallel or max_workers < 2:
+        for asset, risk in zip(changed, risks):
+            export_attack_graph(asset, output_dir, formats, risk)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(export_attack_graph, changed, [output_dir] * len(changed), [formats] * len(changed), risks))
+
+    keep = {os.path.basename(path) for asset_paths in paths.values() for path in asset_paths}
+    for file_name in os.listdir(images_dir):
+        if file_name != "manifest.json" and file_name not in keep:
+            os.remove(os.path.join(images_dir, file_name))
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(hashes, file, indent=2)
+    return [path for asset_paths in paths.values() for path in asset_paths]
+
+
+# Function to bundle image files into an in-memory zip archive, under the given folder
+def bundle_graph_images(paths, folder="attack_graphs"):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path in paths:
+            # PNG data is already compressed
+            compression = zipfile.ZIP_STORED if path.endswith(".png") else zipfile.ZIP_DEFLATED
+            archive.write(path, f"{folder}/{os.path.basename(path)}", compress_type=compression)
+    return buffer.getvalue()
+
+
+def benchmark_graph_export(output_dir, n_assets=20, **kwargs):
+    """
+    Times exporting synthetic assets to SVG and PNG sequentially and in worker processes, and an export
+    with nothing changed.
+    """
+    assets = generate_benchmark_assets(n_assets, **kwargs)
+    timings = {}
+    for name, parallel in (("sequential", False), ("parallel", True)):
+        images_dir = os.path.join(output_dir, GRAPH_IMAGES_DIR)
+        if os.path.exists(os.path.join(images_dir, "manifest.json")):
+            os.remove(os.path.join(images_dir, "manifest.json"))
+        start = time.perf_counter()
+        paths = export_attack_graphs(assets, output_dir, parallel=parallel)
+        timings[name] = time.perf_counter() - start
+    start = time.perf_counter()
+    export_attack_graphs(assets, output_dir)
+    timings["unchanged"] = time.perf_counter() - start
+    start = time.perf_counter()
+    timings["zip_bytes"] = len(bundle_graph_images(paths))
+    timings["zip"] = time.perf_counter() - start
+    return timings
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        timings = benchmark_graph_export(output_dir)
+    print(f"20 assets to SVG and PNG: sequential {timings['sequential'] * 1000:.0f} ms, "
+          f"parallel {timings['parallel'] * 1000:.0f} ms, unchanged {timings['unchanged'] * 1000:.0f} ms, "
+          f"zip of {timings['zip_bytes'] / 1024:.0f} KB in {timings['zip'] * 1000:.0f} ms")
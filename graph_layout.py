@@ -0,0 +1,201 @@
+# graph_layout.py
+
+import numpy as np
+
+# Horizontal distance between two layers and minimum vertical distance between two nodes of a layer
+LEVEL_SEPARATION = 300
+NODE_SEPARATION = 60
+
+# Number of down/up barycenter sweeps used to reduce edge crossings
+CROSSING_SWEEPS = 4
+
+
+# Function to turn node ids and (from, to) pairs into index arrays, dropping edges to unknown nodes
+def _edge_arrays(node_ids, edges):
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    pairs = [(index[source], index[target]) for source, target in edges if source in index and target in index]
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    sources, targets = np.array(pairs, dtype=np.int64).T
+    return sources, targets
+
+
+def assign_layers(n_nodes, sources, targets, root=0):
+    """
+    Assigns every node to the layer of its breadth-first depth from the root (asset -> threat ->
+    vector/control -> scenario). Nodes that cannot be reached are put on the layer after the last one.
+    """
+    layer = np.full(n_nodes, -1, dtype=np.int64)
+    layer[root] = 0
+    frontier = np.array([root])
+    depth = 0
+    while frontier.size:
+        depth += 1
+        reached = np.unique(targets[np.isin(sources, frontier)])
+        frontier = reached[layer[reached] == -1]
+        layer[frontier] = depth
+    layer[layer == -1] = layer.max() + 1
+    return layer
+
+
+# Function to rank the nodes of every layer, keeping the input order among nodes of the same layer
+def _initial_ranks(layer):
+    order = np.argsort(layer, kind="stable")
+    starts = np.searchsorted(layer[order], layer[order])
+    rank = np.empty(len(layer), dtype=np.float64)
+    rank[order] = np.arange(len(layer)) - starts
+    return rank
+
+
+# Function to reorder one layer by the barycenter of each node's neighbours in the adjacent layer; ranks are
+# compared as fractions of their layer's width so that nodes without neighbours keep their relative place
+def _barycenter_pass(rank, scale, current, neighbours, members):
+    n = len(rank)
+    position = rank * scale
+    sums = np.bincount(current, weights=position[neighbours], minlength=n)
+    counts = np.bincount(current, minlength=n)
+    barycenter = np.where(counts > 0, sums / np.maximum(counts, 1), position)
+    ordered = members[np.lexsort((rank[members], barycenter[members]))]
+    rank[ordered] = np.arange(len(ordered))
+
+
+# Function to count the inversions of a sequence of integer ranks with a Fenwick tree
+def _count_inversions(values):
+    size = int(values.max()) + 2 if len(values) else 1
+    tree = [0] * (size + 1)
+    inversions = 0
+    for seen, value in enumerate(values.tolist()):
+        # Earlier values greater than this one
+        i, not_greater = value + 1, 0
+        while i > 0:
+            not_greater += tree[i]
+            i -= i & -i
+        inversions += seen - not_greater
+        i = value + 1
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return inversions
+
+
+def count_crossings(rank, layer, sources, targets):
+    """
+    Counts the pairs of edges that cross between adjacent layers for the given ranks: with the edges
+    of a layer sorted by their upper and then lower end, every inversion of the lower ends is a crossing.
+    """
+    forward = layer[targets] == layer[sources] + 1
+    sources, targets = sources[forward], targets[forward]
+    total = 0
+    for level in np.unique(layer[sources]):
+        in_level = layer[sources] == level
+        upper, lower = rank[sources[in_level]], rank[targets[in_level]]
+        order = np.lexsort((lower, upper))
+        total += _count_inversions(lower[order].astype(np.int64))
+    return total
+
+
+def reduce_crossings(layer, sources, targets, sweeps=CROSSING_SWEEPS):
+    """
+    Orders the nodes inside each layer with alternating downward and upward barycenter sweeps and
+    returns the ranks with the fewest edge crossings seen after any sweep.
+
+    Parameters:
+    layer (np.ndarray): Layer of every node.
+    sources, targets (np.ndarray): Node indices of the edges.
+    sweeps (int): Number of down/up sweep pairs.
+    """
+    forward = layer[targets] == layer[sources] + 1
+    upper, lower = sources[forward], targets[forward]
+    members = [np.flatnonzero(layer == level) for level in range(layer.max() + 1)]
+
+    widths = np.bincount(layer)
+    scale = 1.0 / np.maximum(widths[layer] - 1, 1)
+
+    rank = _initial_ranks(layer)
+    best_rank, best_crossings = rank.copy(), count_crossings(rank, layer, upper, lower)
+    downward = [(level, lower, upper) for level in range(1, len(members))]
+    upward = [(level, upper, lower) for level in range(len(members) - 2, -1, -1)]
+    for sweep in [downward, upward] * sweeps:
+        if best_crossings == 0:
+            break
+        for level, current, neighbours in sweep:
+            in_level = layer[current] == level
+            _barycenter_pass(rank, scale, current[in_level], neighbours[in_level], members[level])
+        crossings = count_crossings(rank, layer, upper, lower)
+        if crossings < best_crossings:
+            best_rank, best_crossings = rank.copy(), crossings
+    return best_rank
+
+
+# Function to push the positions of an ordered layer apart so that neighbours are at least `gap` away
+def _separate(desired, gap):
+    offsets = np.arange(len(desired)) * gap
+    placed = np.maximum.accumulate(desired - offsets) + offsets
+    return placed - (placed.mean() - desired.mean())
+
+
+def assign_coordinates(rank, layer, sources, targets, level_separation=LEVEL_SEPARATION, node_separation=NODE_SEPARATION):
+    """
+    Computes the x (layer) and y (position in layer) coordinates of the nodes. The widest layer is
+    spread evenly; every other layer, going outwards from it, centres each node on its neighbours in
+    the layer already placed and then pushes the nodes apart to keep the minimum separation.
+    """
+    n_layers = layer.max() + 1
+    members = [np.flatnonzero(layer == level) for level in range(n_layers)]
+    members = [nodes[np.argsort(rank[nodes])] for nodes in members]
+    forward = layer[targets] == layer[sources] + 1
+    upper, lower = sources[forward], targets[forward]
+
+    y = np.zeros(len(rank), dtype=np.float64)
+    widest = max(range(n_layers), key=lambda level: len(members[level]))
+    y[members[widest]] = (np.arange(len(members[widest])) - (len(members[widest]) - 1) / 2) * node_separation
+
+    placement = [(level, level + 1) for level in range(widest - 1, -1, -1)]
+    placement += [(level, level - 1) for level in range(widest + 1, n_layers)]
+    for level, placed_level in placement:
+        nodes = members[level]
+        if not len(nodes):
+            continue
+        if placed_level > level:
+            current, neighbours = upper, lower
+        else:
+            current, neighbours = lower, upper
+        sums = np.bincount(current, weights=y[neighbours], minlength=len(y))
+        counts = np.bincount(current, minlength=len(y))
+        desired = np.where(counts[nodes] > 0, sums[nodes] / np.maximum(counts[nodes], 1), np.nan)
+        valid = ~np.isnan(desired)
+        if not valid.any():
+            desired = (np.arange(len(nodes)) - (len(nodes) - 1) / 2) * node_separation
+        else:
+            # Nodes without placed neighbours sit next to the previous node (or the first placed one)
+            filled = np.maximum.accumulate(np.where(valid, np.arange(len(nodes)), -1))
+            filled[filled == -1] = np.flatnonzero(valid)[0]
+            desired = desired[filled]
+        y[nodes] = _separate(desired, node_separation)
+
+    return layer * float(level_separation), y
+
+
+def layered_layout(node_ids, edges, root=None, sweeps=CROSSING_SWEEPS, layers=None):
+    """
+    Lays a graph out in layers from left to right and returns {node_id: (x, y)}.
+
+    Parameters:
+    node_ids (list): Ids of the nodes; the first one is the root unless `root` is given.
+    edges (list): (from, to) pairs of node ids.
+    root: Id of the node on the first layer.
+    sweeps (int): Number of crossing-reduction sweeps.
+    layers (list): Layer of every node, instead of the depth from the root (for graphs with several roots).
+    """
+    node_ids = list(node_ids)
+    if not node_ids:
+        return {}
+    sources, targets = _edge_arrays(node_ids, edges)
+    if layers is not None:
+        layer = np.asarray(layers, dtype=np.int64)
+    else:
+        root_index = node_ids.index(root) if root is not None else 0
+        layer = assign_layers(len(node_ids), sources, targets, root_index)
+    rank = reduce_crossings(layer, sources, targets, sweeps)
+    x, y = assign_coordinates(rank, layer, sources, targets)
+    return {node_id: (int(round(x[i])), int(round(y[i]))) for i, node_id in enumerate(node_ids)}
@@ -0,0 +1,85 @@
+# graph_selection.py
+
+import os
+import streamlit as st
+import streamlit.components.v1 as components
+from util import rerun_fragment
+
+# Bidirectional component embedding an attack graph page: the app sends the selected scenarios, the page
+# sends back every scenario added or removed with the Scenario Details buttons
+_attack_graph_selection = components.declare_component(
+    "attack_graph_selection",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "attack_graph_selection"),
+)
+
+
+# Function to return the scenarios selected in the attack graphs, {scenario key: scenario details}, kept in
+# the session; the details have the fields of the scenarios read by the customized likelihood assessment
+def get_selected_scenarios():
+    if "graph_selection" not in st.session_state:
+        st.session_state.graph_selection = {}
+    return st.session_state.graph_selection
+
+
+# Function to apply one add/remove event sent by the component, once: the component keeps returning its
+# last value on every rerun
+def apply_selection_event(event):
+    if not event or event.get("id") == st.session_state.get("graph_selection_event"):
+        return False
+    st.session_state.graph_selection_event = event["id"]
+    scenario = event["scenario"]
+    selection = get_selected_scenarios()
+    if event["action"] == "add":
+        selection[scenario["key"]] = {
+            "asset": scenario["asset"],
+            "threat": scenario["threat"],
+            "vector": scenario["vector"],
+            "scenario_id": scenario["scenario_id"],
+            "scenario_desc": scenario["scenario_desc"],
+        }
+    else:
+        selection.pop(scenario["key"], None)
+    return True
+
+
+def attack_graph_selection(url, asset_name, height=760, key="attack_graph_selection"):
+    """
+    Embeds an attack graph page and keeps its scenario selection in sync with the session: the
+    scenarios of the asset already selected are marked in the graph, and scenarios added or removed in
+    the graph are applied to get_selected_scenarios() right away.
+
+    Parameters:
+    url (str): URL of the graph page, relative to the app (such as app/static/...).
+    asset_name (str): Asset of the page, whose selected scenarios are sent to it.
+    height (int): Height of the graph in pixels.
+    key (str): Widget key of the component.
+    """
+    selected = [
+        dict(scenario, key=scenario_key)
+        for scenario_key, scenario in get_selected_scenarios().items()
+        if scenario["asset"] == asset_name
+    ]
+    event = _attack_graph_selection(url=url, selected=selected, height=height, key=key, default=None)
+    if apply_selection_event(event):
+        # The selection sent above predates the event; rerun so the graph marks the updated selection.
+        # The event is recorded as applied, so the rerun does not apply it again
+        rerun_fragment()
+
+
+# Function to show the scenarios selected in the attack graphs, with a button to clear them
+def display_selected_scenarios():
+    selection = get_selected_scenarios()
+    if not selection:
+        st.caption("Select scenarios in the graph with the + button of the Scenario Details box; they go straight to the customized likelihood assessment.")
+        return
+    st.markdown(f"**Selected scenarios ({len(selection)})**")
+    st.dataframe(
+        [
+            {"Asset": s["asset"], "Threat": s["threat"], "Attack Vector": s["vector"], "Scenario ID": s["scenario_id"], "Scenario": s["scenario_desc"]}
+            for s in selection.values()
+        ],
+        hide_index=True,
+    )
+    if st.button("Clear Selection"):
+        selection.clear()
+        rerun_fragment()  # Unmark the scenarios in the graph
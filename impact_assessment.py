@@ -3,7 +3,11 @@ import pandas as pd
 import os
 import json
 import time
-from util import impact_levels, reset_impact_assessment_state
+from util import impact_levels, reset_impact_assessment_state, rerun_fragment
+from rating_store import UNRATED, IMPACT_FACTORS, IMPACT_CODES, create_rating_store, get_codes, impact_entries
+from assessment_journal import load_submitted_scenarios, record_submit, record_remove, finalize_journal, get_scenario_key
+from scenario_search import scenario_picker
+from rating_kb import display_rating_suggestions
 
 # Function to check if the final likelihood assessment file exists
 def likelihood_assessment_file_exists():
@@ -20,6 +24,7 @@ def load_likelihood_assessment():
             return json.load(f)
     return None
 
+@st.fragment
 def impact_assessment():
     st.title("Impact Assessment")
 
@@ -50,12 +55,14 @@ def impact_assessment():
         # Initialize session state for impact assessment if not already done
         if "impact_selected_scenario" not in st.session_state:
             st.session_state.impact_selected_scenario = list(scenario_mapping.keys())[0]
-        if "impact_selected_levels" not in st.session_state:
-            st.session_state.impact_selected_levels = {factor: impact_levels[factor][0] for factor in impact_levels}
+        if "impact_rating_store" not in st.session_state or st.session_state.impact_rating_store["keys"] != list(scenario_mapping):
+            st.session_state.impact_rating_store = create_rating_store(scenario_mapping, IMPACT_FACTORS, default_code=0)
         if "impact_submitted_scenarios" not in st.session_state:
-            st.session_state.impact_submitted_scenarios = []
+            # Rebuild in-progress work from the journal so a refresh or restart does not lose it
+            st.session_state.impact_submitted_scenarios = load_submitted_scenarios("impact")
         if "impact_available_scenarios" not in st.session_state:
-            st.session_state.impact_available_scenarios = list(scenario_mapping.keys())
+            submitted_keys = {get_scenario_key(s) for s in st.session_state.impact_submitted_scenarios}
+            st.session_state.impact_available_scenarios = [s for s in scenario_mapping if s not in submitted_keys]
         if "impact_update_scenario" not in st.session_state:
             st.session_state.impact_update_scenario = False
 
@@ -66,11 +73,11 @@ def impact_assessment():
         else:
             st.session_state.impact_selected_scenario = None
         st.session_state.impact_update_scenario = False
-        st.rerun()
+        rerun_fragment()
 
     st.subheader("Select Attack Scenario")
     if st.session_state.impact_available_scenarios:
-        selected_scenario = st.selectbox("", st.session_state.impact_available_scenarios, key="impact_selected_scenario")
+        selected_scenario = scenario_picker(scenario_mapping, st.session_state.impact_available_scenarios, key="impact_selected_scenario")
         scenario_details = scenario_mapping[selected_scenario]
 
         st.markdown(
@@ -86,58 +93,48 @@ def impact_assessment():
             unsafe_allow_html=True
         )
 
-        # Initialize data for impact assessment
-        data = {
-            "Impact Factors": ["Safety", "Privacy", "Financial", "Operational"],
-            "Description": [
-                impact_levels["Safety"][0],
-                impact_levels["Privacy"][0],
-                impact_levels["Financial"][0],
-                impact_levels["Operational"][0]
-            ],
-            "Severity Level": [0, 0, 0, 0]
-        }
-
-        df = pd.DataFrame(data)
-
-        session_key = f"impact_assessment_{scenario_details['scenario_id']}"
-        if session_key not in st.session_state:
-            st.session_state[session_key] = df
+        # Impact levels of every scenario are kept as small integer codes in one rating store
+        store = st.session_state.impact_rating_store
+        codes = get_codes(store, selected_scenario)
+        # Levels suggested by the most similar rated scenarios of past projects, applied on request
+        suggested = display_rating_suggestions("impact", scenario_details, key="impact")
+        if suggested is not None:
+            for column, factor in enumerate(IMPACT_FACTORS):
+                if suggested[column] != UNRATED:
+                    codes[column] = suggested[column]
+                    # Dropping the widget state makes the dropdown start again from the code
+                    st.session_state.pop(f"impact_{factor.replace(' ', '_').replace('(', '').replace(')', '')}_{scenario_details['scenario_id']}", None)
 
         st.subheader("Select Impact Levels")
-        for index, row in st.session_state[session_key].iterrows():
-            factor = row["Impact Factors"]
+        for column, factor in enumerate(IMPACT_FACTORS):
             selected_value = st.selectbox(
                 f"Select {factor}",
                 impact_levels[factor],
-                index=impact_levels[factor].index(row["Description"]),
+                index=int(codes[column]),
                 key=f"impact_{factor.replace(' ', '_').replace('(', '').replace(')', '')}_{scenario_details['scenario_id']}"
             )
-            st.session_state[session_key].at[index, "Severity Level"] = impact_levels[factor].index(selected_value)
-            st.session_state[session_key].at[index, "Description"] = selected_value
+            codes[column] = IMPACT_CODES[factor][selected_value]
+
+        df = pd.DataFrame({
+            "Impact Factors": IMPACT_FACTORS,
+            "Description": [impact_levels[factor][code] for factor, code in zip(IMPACT_FACTORS, codes)],
+            "Severity Level": codes.astype(int),
+        })
 
         st.write("### Updated Impact Assessment Table")
-        st.dataframe(st.session_state[session_key].style.hide(axis='index'))
+        st.dataframe(df.style.hide(axis='index'))
     else:
         st.write("No scenarios available")
 
     # Define the integrate_impact function here
-    def integrate_impact(scenario_details, impact_df):
-        impact = [
-            {
-                "Factor": row["Impact Factors"],
-                "Level": row["Description"],
-                "Severity": row["Severity Level"]
-            }
-            for _, row in impact_df.iterrows()
-        ]
-        scenario_details['Impact'] = impact
+    def integrate_impact(scenario_details, codes):
+        scenario_details['Impact'] = impact_entries(codes)
         return scenario_details
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        submit_button = st.button("Submit Impact", help="Submit your impact assessment", key="impact_submit", disabled=not st.session_state.impact_available_scenarios)
+        submit_button = st.button("Submit Impact", help="Submit your impact assessment", key="impact_submit", disabled=not st.session_state.impact_available_scenarios or selected_scenario not in st.session_state.impact_available_scenarios)
     with col2:
         remove_button = st.button("Remove Impact", help="Remove last impact assessment", key="impact_remove", disabled=not st.session_state.impact_submitted_scenarios)
     with col3:
@@ -148,36 +145,37 @@ def impact_assessment():
     st.write(f"Number of submitted scenarios: {len(st.session_state.impact_submitted_scenarios)}")
 
     if submit_button:
-        evaluated_scenario = integrate_impact(scenario_details, st.session_state[session_key])
+        evaluated_scenario = integrate_impact(scenario_details, get_codes(st.session_state.impact_rating_store, selected_scenario))
         st.session_state.impact_submitted_scenarios.append(evaluated_scenario)
+        record_submit("impact", evaluated_scenario, st.session_state.impact_submitted_scenarios)
         st.session_state.impact_available_scenarios.remove(selected_scenario)
         time.sleep(0.1)
-        st.rerun()
+        rerun_fragment()
 
     if remove_button:
         if st.session_state.impact_submitted_scenarios:
             last_submitted = st.session_state.impact_submitted_scenarios.pop()
+            record_remove("impact", last_submitted, st.session_state.impact_submitted_scenarios)
             scenario_key = f"{last_submitted['asset']} - {last_submitted['threat']} - {last_submitted['vector']} - {last_submitted['scenario_id']}"
             st.session_state.impact_available_scenarios.append(scenario_key)
             st.session_state.impact_available_scenarios = sorted(st.session_state.impact_available_scenarios)
             st.session_state.impact_update_scenario = True
             # st.warning(f"Impact Assessment for {last_submitted['scenario_id']} removed.")
             time.sleep(0.1)
-            st.rerun()
+            rerun_fragment()
 
     if finalize_button:
         if st.session_state.impact_submitted_scenarios:
             base_path = os.getcwd()
             json_path = os.path.join(base_path)
-            final_result = {"Scenarios": st.session_state.impact_submitted_scenarios}
             file_path = os.path.join(json_path, ".files\\final_impact_assessment.json")
-            with open(file_path, "w") as f:
-                json.dump(final_result, f, indent=4)
+            # The journal snapshot becomes the final file
+            finalize_journal("impact", st.session_state.impact_submitted_scenarios, file_path)
             st.success(f"Impact Assessment successfully submitted.")
             reset_impact_assessment_state()  # Reset session state
             st.session_state.impact_assessment_complete = True
             time.sleep(0.1)
             st.query_params = {"tab": "Risk Evaluation"}  # Move to the Risk Evaluation tab
-            # st.rerun()
+            st.rerun()  # Refresh the whole app so the Risk Evaluation tab picks up the result
         else:
             st.error("No scenarios submitted. Please submit at least one scenario before finalizing.")
\ No newline at end of file
@@ -2,10 +2,19 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 import os
 import time
-from util import levels, comments, values, reset_likelihood_assessment_state
+from util import levels, comments, values, reset_likelihood_assessment_state, rerun_fragment
+from rating_store import LIKELIHOOD_FACTORS, LIKELIHOOD_CODES, likelihood_entries
+from assessment_journal import load_submitted_scenarios, record_submit, record_remove, finalize_journal, get_scenario_key
+from scenario_search import scenario_picker
+from graph_selection import get_selected_scenarios
+
+# Sources of the scenarios to evaluate
+GRAPH_SOURCE = "Selected in the attack graphs"
+UPLOAD_SOURCE = "Uploaded JSON files"
 
 def extract_and_merge_scenarios(files):
     merged_data = {"assets": []}
@@ -48,37 +57,57 @@ def extract_and_merge_scenarios(files):
                     }
     return scenarios, scenario_mapping
 
+# Function to follow the scenario selection of the attack graphs, which can change between reruns: scenarios
+# selected since are added to the ones still to evaluate, deselected ones are dropped
+def sync_available_scenarios(scenarios):
+    if "available_scenarios" not in st.session_state:
+        return
+    if "submitted_scenarios" not in st.session_state:
+        st.session_state.submitted_scenarios = load_submitted_scenarios("likelihood")
+    submitted_keys = {get_scenario_key(s) for s in st.session_state.submitted_scenarios}
+    st.session_state.available_scenarios = [s for s in scenarios if s not in submitted_keys]
+    selected = st.session_state.get("selected_scenario")
+    if (selected is None and st.session_state.available_scenarios) or (selected is not None and selected not in st.session_state.available_scenarios):
+        st.session_state.update_scenario = True
+
 # Function to integrate likelihood assessment into the selected scenario
-def integrate_likelihood(scenario_details, selected_levels, comments, values):
-    likelihood = [
-        {
-            "Factor": factor,
-            "Level": selected_levels[factor],
-            "Value": values[factor][levels[factor].index(selected_levels[factor])],
-            "Comment": comments[factor][levels[factor].index(selected_levels[factor])]
-        }
-        for factor in levels
-    ]
-    scenario_details['Likelihood'] = likelihood
+def integrate_likelihood(scenario_details, codes):
+    scenario_details['Likelihood'] = likelihood_entries(codes)
     return scenario_details
 
+@st.fragment
 def likelihood_assessment_customized(key):
-    st.subheader("Upload JSON Files")
-    uploaded_files = st.file_uploader("Choose JSON files", accept_multiple_files=True, type="json", key=key)
+    source = UPLOAD_SOURCE
+    graph_selection = get_selected_scenarios()
+    if graph_selection:
+        source = st.radio("Scenarios", [GRAPH_SOURCE, UPLOAD_SOURCE], horizontal=True, key=f"{key}_source")
+
+    uploaded_files = None
+    if source == UPLOAD_SOURCE:
+        st.subheader("Upload JSON Files")
+        uploaded_files = st.file_uploader("Choose JSON files", accept_multiple_files=True, type="json", key=key)
     
-    if uploaded_files:
-        scenarios, scenario_mapping = extract_and_merge_scenarios(uploaded_files)
+    if uploaded_files or source == GRAPH_SOURCE:
+        if source == GRAPH_SOURCE:
+            # Scenarios selected in the attack graphs, keyed by their original scenario IDs
+            scenarios = list(graph_selection)
+            scenario_mapping = {scenario_key: dict(scenario) for scenario_key, scenario in graph_selection.items()}
+            sync_available_scenarios(scenarios)
+        else:
+            scenarios, scenario_mapping = extract_and_merge_scenarios(uploaded_files)
         
         if scenarios:
             # Initialize session state for selected scenario and likelihood
             if "selected_scenario" not in st.session_state:
                 st.session_state.selected_scenario = scenarios[0]
-            if "selected_levels" not in st.session_state:
-                st.session_state.selected_levels = {factor: levels[factor][0] for factor in levels}
+            if "selected_codes" not in st.session_state:
+                st.session_state.selected_codes = np.zeros(len(LIKELIHOOD_FACTORS), dtype=np.int8)
             if "submitted_scenarios" not in st.session_state:
-                st.session_state.submitted_scenarios = []
+                # Rebuild in-progress work from the journal so a refresh or restart does not lose it
+                st.session_state.submitted_scenarios = load_submitted_scenarios("likelihood")
             if "available_scenarios" not in st.session_state:
-                st.session_state.available_scenarios = scenarios.copy()
+                submitted_keys = {get_scenario_key(s) for s in st.session_state.submitted_scenarios}
+                st.session_state.available_scenarios = [s for s in scenarios if s not in submitted_keys]
             if "update_scenario" not in st.session_state:
                 st.session_state.update_scenario = False
 
@@ -91,11 +120,11 @@ def likelihood_assessment_customized(key):
                 else:
                     st.session_state.selected_scenario = None
                 st.session_state.update_scenario = False
-                st.rerun()
+                rerun_fragment()
 
             st.subheader("Select Attack Scenario")
             if st.session_state.available_scenarios:
-                selected_scenario = st.selectbox("", st.session_state.available_scenarios, key="selected_scenario")
+                selected_scenario = scenario_picker(scenario_mapping, st.session_state.available_scenarios, key="selected_scenario")
                 scenario_details = scenario_mapping[selected_scenario]
 
                 # Display scenario details in a styled box
@@ -112,29 +141,24 @@ def likelihood_assessment_customized(key):
                     unsafe_allow_html=True
                 )
 
-                # Initialize DataFrame for likelihood assessment
-                data = {
-                    "Likelihood Factors": list(levels.keys()),
-                    "Levels": [st.session_state.selected_levels[factor] for factor in levels],
-                    "Comments": [comments[factor][levels[factor].index(st.session_state.selected_levels[factor])] for factor in levels],
-                    "Values": [values[factor][levels[factor].index(st.session_state.selected_levels[factor])] for factor in levels]
-                }
-                df = pd.DataFrame(data)
-
-                # Display the table with dropdowns
+                # Display the dropdowns; the selection is kept as one small integer code per factor
+                codes = st.session_state.selected_codes
                 st.subheader("Select Likelihood Levels")
-                for index, row in df.iterrows():
-                    factor = row["Likelihood Factors"]
+                for column, factor in enumerate(LIKELIHOOD_FACTORS):
                     selected_level = st.selectbox(
                         f"Select level for {factor}",
                         levels[factor],
-                        index=levels[factor].index(row["Levels"]),
+                        index=int(codes[column]),
                         key=f"{factor.replace(' ', '_').replace('(', '').replace(')', '')}"
                     )
-                    df.at[index, "Levels"] = selected_level
-                    df.at[index, "Comments"] = comments[factor][levels[factor].index(selected_level)]
-                    df.at[index, "Values"] = values[factor][levels[factor].index(selected_level)]
-                    st.session_state.selected_levels[factor] = selected_level
+                    codes[column] = LIKELIHOOD_CODES[factor][selected_level]
+
+                df = pd.DataFrame({
+                    "Likelihood Factors": LIKELIHOOD_FACTORS,
+                    "Levels": [levels[factor][code] for factor, code in zip(LIKELIHOOD_FACTORS, codes)],
+                    "Comments": [comments[factor][code] for factor, code in zip(LIKELIHOOD_FACTORS, codes)],
+                    "Values": [values[factor][code] for factor, code in zip(LIKELIHOOD_FACTORS, codes)],
+                })
 
                 # Display the updated DataFrame without the row index
                 st.write("### Updated Likelihood Assessment Table")
@@ -147,7 +171,7 @@ def likelihood_assessment_customized(key):
             col1, col2, col3 = st.columns(3)
 
             with col1:
-                submit_button = st.button("Submit Evaluation", help="By clicking on this button you can submit your evaluation of the attack scenario", key="submit", disabled=not st.session_state.available_scenarios)
+                submit_button = st.button("Submit Evaluation", help="By clicking on this button you can submit your evaluation of the attack scenario", key="submit", disabled=not st.session_state.available_scenarios or selected_scenario not in st.session_state.available_scenarios)
             with col2:
                 remove_button = st.button("Remove Evaluation", help="By clicking on this button you can remove your last evaluation", key="remove", disabled=not st.session_state.submitted_scenarios)
             with col3:
@@ -159,37 +183,38 @@ def likelihood_assessment_customized(key):
 
             # Handle the form submission for likelihood evaluation
             if submit_button:
-                evaluated_scenario = integrate_likelihood(scenario_details, st.session_state.selected_levels, comments, values)
+                evaluated_scenario = integrate_likelihood(scenario_details, st.session_state.selected_codes)
                 st.session_state.submitted_scenarios.append(evaluated_scenario)
+                record_submit("likelihood", evaluated_scenario, st.session_state.submitted_scenarios)
                 st.session_state.available_scenarios.remove(selected_scenario)
                 time.sleep(0.1)
-                st.rerun()  # Refresh the page to update scenario selection
+                rerun_fragment()  # Refresh the form to update scenario selection
 
             # Handle removal of a submitted scenario
             if remove_button:
                 if st.session_state.submitted_scenarios:
                     last_submitted = st.session_state.submitted_scenarios.pop()
+                    record_remove("likelihood", last_submitted, st.session_state.submitted_scenarios)
                     scenario_key = f"{last_submitted['asset']} - {last_submitted['threat']} - {last_submitted['vector']} - {last_submitted['scenario_id']}"
                     st.session_state.available_scenarios.append(scenario_key)
                     st.session_state.available_scenarios = sorted(st.session_state.available_scenarios)
                     st.session_state.update_scenario = True
                     time.sleep(0.1)
-                    st.rerun()  # Refresh the page to update scenario selection
+                    rerun_fragment()  # Refresh the form to update scenario selection
 
             # Handle final likelihood assessment
             if finalize_button:
                 if st.session_state.submitted_scenarios:
                     base_path = os.getcwd()
                     json_path = os.path.join(base_path)
-                    final_result = {"Scenarios": st.session_state.submitted_scenarios}
                     file_path = os.path.join(json_path, ".files\\final_likelihood_assessment.json")
-                    with open(file_path, "w") as f:
-                        json.dump(final_result, f, indent=4)
+                    # The journal snapshot becomes the final file
+                    finalize_journal("likelihood", st.session_state.submitted_scenarios, file_path)
                     st.write(f"Final Likelihood Assessment submitted and JSON file saved to {file_path}")
                     reset_likelihood_assessment_state()  # Reset session state
                     st.session_state.likelihood_assessment_complete = True
                     time.sleep(0.1)
                     # st.query_params = {"tab": "Likelihood Assessment"}
-                    # st.rerun()
+                    st.rerun()  # Refresh the whole app so the Impact Assessment tab picks up the result
                 else:
                     st.error("No scenarios submitted. Please submit at least one scenario before finalizing.")
@@ -2,48 +2,68 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 import os
 import time
-from util import levels, comments, values, reset_likelihood_assessment_state
+from util import levels, comments, values, reset_likelihood_assessment_state, rerun_fragment
+from rating_store import UNRATED, LIKELIHOOD_FACTORS, LIKELIHOOD_CODES, likelihood_entries
+from assessment_journal import load_submitted_scenarios, record_submit, record_remove, finalize_journal, get_scenario_key
+from scenario_search import scenario_picker
+from rating_kb import display_rating_suggestions
 
-def likelihood_assessment_full():
+_attack_model_scenarios_cache = {}
+
+# Function to list the scenarios of the unified attack model
+def load_attack_model_scenarios():
     base_path = os.getcwd()
     file_path = os.path.join(base_path, ".files\\unified_attack_model.json")
-    with open(file_path, 'r') as file:
-        attack_model = json.load(file)
-
+    # Parse the attack model once per file version; callers get their own scenario dictionaries
+    mtime = os.path.getmtime(file_path)
+    if _attack_model_scenarios_cache.get("key") != (file_path, mtime):
+        with open(file_path, 'r') as file:
+            attack_model = json.load(file)
+
+        scenarios = []
+        for asset in attack_model['assets']:
+            asset_name = asset['name']
+            for threat in asset['threats']:
+                threat_name = threat['name']
+                for vector in threat['vectors']:
+                    vector_name = vector['vector_name']
+                    for scenario in vector['scenarios']:
+                        scenarios.append({
+                            "asset": asset_name,
+                            "threat": threat_name,
+                            "vector": vector_name,
+                            "scenario_id": scenario['scenario_id'],
+                            "scenario_desc": scenario['scenario_description']
+                        })
+        _attack_model_scenarios_cache["key"] = (file_path, mtime)
+        _attack_model_scenarios_cache["scenarios"] = scenarios
+    return [dict(scenario) for scenario in _attack_model_scenarios_cache["scenarios"]]
+
+@st.fragment
+def likelihood_assessment_full():
     scenarios = []
     scenario_mapping = {}
 
-    for asset in attack_model['assets']:
-        asset_name = asset['name']
-        for threat in asset['threats']:
-            threat_name = threat['name']
-            for vector in threat['vectors']:
-                vector_name = vector['vector_name']
-                for scenario in vector['scenarios']:
-                    scenario_id = scenario['scenario_id']
-                    scenario_desc = scenario['scenario_description']
-                    scenario_key = f"{asset_name} - {threat_name} - {vector_name} - {scenario_id}"
-                    scenarios.append(scenario_key)
-                    scenario_mapping[scenario_key] = {
-                        "asset": asset_name,
-                        "threat": threat_name,
-                        "vector": vector_name,
-                        "scenario_id": scenario_id,
-                        "scenario_desc": scenario_desc
-                    }
+    for scenario in load_attack_model_scenarios():
+        scenario_key = f"{scenario['asset']} - {scenario['threat']} - {scenario['vector']} - {scenario['scenario_id']}"
+        scenarios.append(scenario_key)
+        scenario_mapping[scenario_key] = scenario
 
     if scenarios:
         if "selected_scenario" not in st.session_state:
             st.session_state.selected_scenario = scenarios[0]
-        if "selected_levels" not in st.session_state:
-            st.session_state.selected_levels = {factor: levels[factor][0] for factor in levels}
+        if "selected_codes" not in st.session_state:
+            st.session_state.selected_codes = np.zeros(len(LIKELIHOOD_FACTORS), dtype=np.int8)
         if "submitted_scenarios" not in st.session_state:
-            st.session_state.submitted_scenarios = []
+            # Rebuild in-progress work from the journal so a refresh or restart does not lose it
+            st.session_state.submitted_scenarios = load_submitted_scenarios("likelihood")
         if "available_scenarios" not in st.session_state:
-            st.session_state.available_scenarios = scenarios.copy()
+            submitted_keys = {get_scenario_key(s) for s in st.session_state.submitted_scenarios}
+            st.session_state.available_scenarios = [s for s in scenarios if s not in submitted_keys]
         if "update_scenario" not in st.session_state:
             st.session_state.update_scenario = False
 
@@ -55,11 +75,11 @@ def likelihood_assessment_full():
         else:
             st.session_state.selected_scenario = None
         st.session_state.update_scenario = False
-        st.rerun()
+        rerun_fragment()
 
     st.subheader("Select Attack Scenario")
     if st.session_state.available_scenarios:
-        selected_scenario = st.selectbox("", st.session_state.available_scenarios, key="selected_scenario")
+        selected_scenario = scenario_picker(scenario_mapping, st.session_state.available_scenarios, key="selected_scenario")
         scenario_details = scenario_mapping[selected_scenario]
 
         st.markdown(
@@ -75,29 +95,33 @@ def likelihood_assessment_full():
             unsafe_allow_html=True
         )
 
-        # Initialize DataFrame for likelihood assessment
-        data = {
-            "Likelihood Factors": list(levels.keys()),
-            "Levels": [st.session_state.selected_levels[factor] for factor in levels],
-            "Comments": [comments[factor][levels[factor].index(st.session_state.selected_levels[factor])] for factor in levels],
-            "Values": [values[factor][levels[factor].index(st.session_state.selected_levels[factor])] for factor in levels]
-        }
-        df = pd.DataFrame(data)
+        # Display the dropdowns; the selection is kept as one small integer code per factor
+        codes = st.session_state.selected_codes
+        # Levels suggested by the most similar rated scenarios of past projects, applied on request
+        suggested = display_rating_suggestions("likelihood", scenario_details, key="full")
+        if suggested is not None:
+            for column, factor in enumerate(LIKELIHOOD_FACTORS):
+                if suggested[column] != UNRATED:
+                    codes[column] = suggested[column]
+                    # Dropping the widget state makes the dropdown start again from the code
+                    st.session_state.pop(factor.replace(' ', '_').replace('(', '').replace(')', ''), None)
 
-        # Display the table with dropdowns
         st.subheader("Select Likelihood Levels")
-        for index, row in df.iterrows():
-            factor = row["Likelihood Factors"]
+        for column, factor in enumerate(LIKELIHOOD_FACTORS):
             selected_level = st.selectbox(
                 f"Select level for {factor}",
                 levels[factor],
-                index=levels[factor].index(row["Levels"]),
+                index=int(codes[column]),
                 key=f"{factor.replace(' ', '_').replace('(', '').replace(')', '')}"
             )
-            df.at[index, "Levels"] = selected_level
-            df.at[index, "Comments"] = comments[factor][levels[factor].index(selected_level)]
-            df.at[index, "Values"] = values[factor][levels[factor].index(selected_level)]
-            st.session_state.selected_levels[factor] = selected_level
+            codes[column] = LIKELIHOOD_CODES[factor][selected_level]
+
+        df = pd.DataFrame({
+            "Likelihood Factors": LIKELIHOOD_FACTORS,
+            "Levels": [levels[factor][code] for factor, code in zip(LIKELIHOOD_FACTORS, codes)],
+            "Comments": [comments[factor][code] for factor, code in zip(LIKELIHOOD_FACTORS, codes)],
+            "Values": [values[factor][code] for factor, code in zip(LIKELIHOOD_FACTORS, codes)],
+        })
 
         # Display the updated DataFrame without the row index
         st.write("### Updated Likelihood Assessment Table")
@@ -105,23 +129,14 @@ def likelihood_assessment_full():
     else:
         st.write("No scenarios available")
 
-    def integrate_likelihood(scenario_details, selected_levels, comments, values):
-        likelihood = [
-            {
-                "Factor": factor,
-                "Level": selected_levels[factor],
-                "Value": values[factor][levels[factor].index(selected_levels[factor])],
-                "Comment": comments[factor][levels[factor].index(selected_levels[factor])]
-            }
-            for factor in levels
-        ]
-        scenario_details['Likelihood'] = likelihood
+    def integrate_likelihood(scenario_details, codes):
+        scenario_details['Likelihood'] = likelihood_entries(codes)
         return scenario_details
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        submit_button = st.button("Submit Evaluation", help="Submit your evaluation", key="submit", disabled=not st.session_state.available_scenarios)
+        submit_button = st.button("Submit Evaluation", help="Submit your evaluation", key="submit", disabled=not st.session_state.available_scenarios or selected_scenario not in st.session_state.available_scenarios)
     with col2:
         remove_button = st.button("Remove Evaluation", help="Remove last evaluation", key="remove", disabled=not st.session_state.submitted_scenarios)
     with col3:
@@ -131,35 +146,36 @@ def likelihood_assessment_full():
     st.write(f"Number of submitted scenarios: {len(st.session_state.submitted_scenarios)}")
 
     if submit_button:
-        evaluated_scenario = integrate_likelihood(scenario_details, st.session_state.selected_levels, comments, values)
+        evaluated_scenario = integrate_likelihood(scenario_details, st.session_state.selected_codes)
         st.session_state.submitted_scenarios.append(evaluated_scenario)
+        record_submit("likelihood", evaluated_scenario, st.session_state.submitted_scenarios)
         st.session_state.available_scenarios.remove(selected_scenario)
         time.sleep(0.1)
-        st.rerun()
+        rerun_fragment()
 
     if remove_button:
         if st.session_state.submitted_scenarios:
             last_submitted = st.session_state.submitted_scenarios.pop()
+            record_remove("likelihood", last_submitted, st.session_state.submitted_scenarios)
             scenario_key = f"{last_submitted['asset']} - {last_submitted['threat']} - {last_submitted['vector']} - {last_submitted['scenario_id']}"
             st.session_state.available_scenarios.append(scenario_key)
             st.session_state.available_scenarios = sorted(st.session_state.available_scenarios)
             st.session_state.update_scenario = True
             time.sleep(0.1)
-            st.rerun()
+            rerun_fragment()
 
     if finalize_button:
         if st.session_state.submitted_scenarios:
             base_path = os.getcwd()
             json_path = os.path.join(base_path)
-            final_result = {"Scenarios": st.session_state.submitted_scenarios}
             file_path = os.path.join(json_path, ".files\\final_likelihood_assessment.json")
-            with open(file_path, "w") as f:
-                json.dump(final_result, f, indent=4)
+            # The journal snapshot becomes the final file
+            finalize_journal("likelihood", st.session_state.submitted_scenarios, file_path)
             st.success(f"Likelihood Assessment successfully submitted.")
             reset_likelihood_assessment_state()  # Reset session state
             st.session_state.likelihood_assessment_complete = True
             time.sleep(0.1)
             # st.query_params = {"tab": "Risk Assessment"}
-            # st.rerun()  # Refresh the page
+            st.rerun()  # Refresh the whole app so the Impact Assessment tab picks up the result
         else:
             st.error("No scenarios submitted. Please submit at least one scenario before finalizing.")
\ No newline at end of file
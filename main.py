@@ -1,6 +1,8 @@
 # main.py
+import io
 import os
 import streamlit as st
+from PIL import Image
 import streamlit.components.v1 as components
 import json
 from sidebar import configure_sidebar, render_header
@@ -21,16 +23,29 @@ from threat_model import (
     json_to_markdown,
     save_json_to_file,
 )
-from attack_model import create_attack_model_prompt, json_to_markdown_model, create_unified_threat_model
-from attack_graph import create_attack_graph, display_attackgraph_html_files
+from attack_model import create_attack_model_prompt, create_unified_threat_model
+from attack_model_view import load_attack_model_view, display_attack_model_view
+from attack_graph import update_attack_graphs, publish_attack_graphs, display_attackgraph_html_files
+from graph_export import export_attack_graphs, bundle_graph_images
 import likelihood_assessment_customized as customized
 import likelihood_assessment_full as full
+import bulk_assessment as bulk
+from pre_rating import display_pre_rating
+from rating_kb import display_rating_kb
+from tara_report import display_tara_report
 # from impact_assessment import impact_assessment, load_likelihood_assessment, likelihood_assessment_file_exists
 import impact_assessment
 # from impact_assessment import likelihood_assessment_file_exists
-from risk_computation import risk_evaluation, display_prioritized_risks, load_impact_assessment
+from risk_computation import risk_evaluation, display_prioritized_risks, load_impact_assessment, get_risk_rows
+from risk_simulation import display_risk_simulation
+from mitigation_optimizer import display_mitigation_optimizer
+from attack_paths import display_attack_paths, load_unified_assets
+from risk_rollup import display_risk_rollup, get_risk_rollup, rollup_node_values
 # ------------------ Helper Functions ------------------ #
 
+# Width in pixels the sidebar logo is downscaled to (2x the sidebar width for high-DPI screens)
+LOGO_WIDTH = 600
+
 
 # Function to get user input for the application description and key details
 def get_input():
@@ -47,22 +62,18 @@ def get_input():
     return input_text
 
 
+# Function to load the sidebar logo once, downscaled to the sidebar width
+@st.cache_data(show_spinner=False)
+def load_logo(file_path, mtime):
+    image = Image.open(file_path)
+    image.thumbnail((LOGO_WIDTH, LOGO_WIDTH * image.height // image.width))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
 # ------------------ Streamlit UI Configuration ------------------ #
-# Define the configuration content for the theme
-config_content = """
-[theme]
-primaryColor="#f56b6b"
-backgroundColor="#273750"
-secondaryBackgroundColor="#081324"
-textColor="#ffffff"
-font="serif"
-"""
-# Create the .streamlit directory if it does not exist
-os.makedirs(".streamlit", exist_ok=True)
-
-# Write the configuration content to the config.toml file
-with open(".streamlit/config.toml", "w") as config_file:
-    config_file.write(config_content)
+# The theme is static configuration and lives in .streamlit/config.toml
 st.set_page_config(
     page_title="AutoSecGPT",
     page_icon=":racing_car:",
@@ -72,7 +83,7 @@ st.set_page_config(
 
 # ------------------ Sidebar ------------------ #
 
-st.sidebar.image("logo.png")
+st.sidebar.image(load_logo("logo.png", os.path.getmtime("logo.png")))
 
 headers = [
     ("How to use AutoSecGPT", "#f56b6b"),
@@ -140,6 +151,11 @@ with st.sidebar:
 
     st.markdown("""---""")
 
+if model_provider == "Google AI API":
+    api_key, model_name = google_api_key, google_model
+else:
+    api_key, model_name = openai_api_key, selected_model
+
 # Add "About" section to the sidebar
 render_header(1)
 with st.sidebar:
@@ -188,7 +204,9 @@ with st.sidebar:
 
 tab1, tab2, tab3, tab4 = st.tabs(["Threat Model", "Attack Model", "Attack Graph", "Risk Assessment"])
 
-with tab1:
+# Each tab runs as a fragment, so interacting with one tab only reruns that tab
+@st.fragment
+def threat_model_tab(model_provider, api_key, model_name):
     st.markdown(
         """
         ISO 21434 emphasizes identifying and assessing cybersecurity risks, helping to anticipate and prepare for potential attack scenarios.
@@ -315,11 +333,11 @@ with tab1:
                     # Call the relevant get_threat_model function with the generated prompt
                     if model_provider == "Google AI API":
                         model_output = get_threat_model_google(
-                            google_api_key, google_model, threat_model_prompt
+                            api_key, model_name, threat_model_prompt
                         )
                     elif model_provider == "OpenAI API":
                         model_output = get_threat_model(
-                            openai_api_key, selected_model, threat_model_prompt
+                            api_key, model_name, threat_model_prompt
                         )
 
                     # Access the threat model from the parsed content
@@ -359,13 +377,18 @@ with tab1:
             mime="text/markdown",
         )
 
-# If the submit button is clicked and the user has not provided an application description
-if threat_model_submit_button and not st.session_state.get("app_input"):
-    st.error("Please enter your application details before submitting.")
+    # If the submit button is clicked and the user has not provided an application description
+    if threat_model_submit_button and not st.session_state.get("app_input"):
+        st.error("Please enter your application details before submitting.")
+
+
+with tab1:
+    threat_model_tab(model_provider, api_key, model_name)
 
 # ------------------ Attack Model ------------------- #
 
-with tab2:
+@st.fragment
+def attack_model_tab(api_key, model_name):
     st.markdown(
         """
         This tab provides an attack model based on identified threats for each asset and investigates scenarios of how the attacks might happen in the system. The structure of the attack model includes a detailed breakdown of each threat, specifying the attack vectors and scenarios. Each identified threat lists the attacker objectives, followed by various attack vectors.
@@ -380,9 +403,7 @@ with tab2:
     if attack_model_submit_button or st.session_state.attack_model_generated:
         base_path = os.getcwd()
         input_file_name = os.path.join(base_path, ".files\\threats.json")
-        api_key = openai_api_key  
         output_file_name = os.path.join(base_path, ".files\\attack_model.json")
-        model_name = selected_model  
 
         if not os.path.exists(output_file_name):
             with st.spinner("Analyzing potential attacks..."):
@@ -408,22 +429,35 @@ with tab2:
 
         st.session_state.attack_model_generated = True
         unified_output_file_name= os.path.join(base_path, ".files\\unified_attack_model.json")
-        create_unified_threat_model(input_file_name, output_file_name, unified_output_file_name)
-        # Convert the threat model JSON to Markdown
-        markdown_output_attack_model = json_to_markdown_model(output_file_name)
-        # Display the attack model in Markdown
-        st.markdown(markdown_output_attack_model, unsafe_allow_html=True)
+        # Only rebuild the unified attack model when its sources changed
+        if (attack_model_submit_button or not os.path.exists(unified_output_file_name)
+                or os.path.getmtime(unified_output_file_name) < max(os.path.getmtime(input_file_name), os.path.getmtime(output_file_name))):
+            create_unified_threat_model(input_file_name, output_file_name, unified_output_file_name)
+        # Display the attack model one asset and one page of threats at a time
+        display_attack_model_view(load_attack_model_view(unified_output_file_name, output_file_name))
+
+
+with tab2:
+    attack_model_tab(api_key, model_name)
 
 # ------------------ Attack Graph ------------------- #
-with tab3:
+# Function to return the risk rolled up from the evaluated scenarios, filled into the graph nodes, None before any evaluation
+def get_graph_node_risk():
+    risk_rows = get_risk_rows()
+    rollup = get_risk_rollup(risk_rows, "risk", st.session_state.get("risk_rollup_operator", "max")) if risk_rows else None
+    return rollup_node_values(rollup) if rollup is not None else None
+
+
+@st.fragment
+def attack_graph_tab():
     st.markdown(
         """
         This tab visualizes the attack graph for each asset, illustrating the relationships between assets, threats, attack vectors, and scenarios. The graph dynamically displays interconnected nodes, detailing the progression from initial threats to potential attack scenarios and corresponding controls. This enables a comprehensive analysis of potential attack paths.
     To use this tab:
     1) Select an asset from the dropdown list.
     2) Click on each node to generate and view related threats, attack vectors, and scenarios.
-    3) In the Scenario Detail box, you can add or remove scenarios for further risk assessment.
-    4) After selecting scenarios for each asset, click on 'Selection Completed'. A JSON file will be downloaded, which can be used for the Risk Assessment process.
+    3) In the Scenario Detail box, you can add or remove scenarios for further risk assessment. Selected scenarios are listed below the graph and go straight to the 'Customized Scenario' likelihood assessment.
+    4) Optionally, click on 'Selection Completed' to download the selected scenarios of the asset as a JSON file, which can also be uploaded in the likelihood assessment.
         """
     )
     st.markdown("""---""")
@@ -453,21 +487,47 @@ with tab3:
             # Create attack graphs for each asset in the JSON file
             try:
                 with st.spinner("Generating attack graphs..."):
-                    graph_paths = []
-                    for asset in data["assets"]:
-                        output_path = create_attack_graph(asset, output_dir)
-                        graph_paths.append(output_path)
-                    
+                    # Render only the assets that changed since the last generation, concurrently, and
+                    # remove the graphs of assets that no longer exist
+                    update = update_attack_graphs(data["assets"], output_dir, node_risk=get_graph_node_risk())
+                    graph_paths = update["paths"]
+
+                    # Publish the pages to the static route, where the browser caches them by content hash
+                    publish_attack_graphs(output_dir)
+
                     # Save graph paths to session state
                     st.session_state['graph_paths'] = graph_paths
-                st.success("Attack graphs generated successfully.")
+                st.success(
+                    f"Attack graphs generated successfully ({len(update['rendered'])} updated, "
+                    f"{len(graph_paths) - len(update['rendered'])} unchanged, {len(update['removed'])} removed)."
+                )
             except Exception as e:
                 st.error(f"Error creating attack graphs: {e}")
                 st.stop()
 
     # If graphs have been generated, display the assets dropdown and graphs
     if 'graph_paths' in st.session_state:
-        display_attackgraph_html_files(os.path.join(base_path, ".files\\.attackgraph"))
+        output_dir = os.path.join(base_path, ".files\\.attackgraph")
+        display_attackgraph_html_files(output_dir)
+
+        # Draw every asset graph to SVG and PNG on the server, without any browser or CDN script
+        st.markdown("""---""")
+        if st.button("Export Graph Images"):
+            with st.spinner("Exporting attack graph images..."):
+                assets = load_unified_assets(unified_attack_model_path, os.path.getmtime(unified_attack_model_path))
+                image_paths = export_attack_graphs(assets, output_dir, node_risk=get_graph_node_risk())
+                st.session_state['graph_images_zip'] = bundle_graph_images(image_paths)
+        if 'graph_images_zip' in st.session_state:
+            st.download_button(
+                label="Download Attack Graph Images",
+                data=st.session_state['graph_images_zip'],
+                file_name="attack_graphs.zip",
+                mime="application/zip",
+            )
+
+
+with tab3:
+    attack_graph_tab()
 
 
 
@@ -485,6 +545,88 @@ def check_likelihood_assessment_complete():
     else:
         st.session_state.impact_assessment_ready = False
 
+@st.fragment
+def likelihood_assessment_tab():
+    st.markdown(
+    """
+    First step of our risk assessment is to determine the likelihood level of each attack scenario, based on defined a set of likelihood factors.
+    """
+     )
+
+    st.markdown("---")
+
+    likelihood_assessment_option = st.radio(
+        "Select Likelihood Assessment Option:",
+        ["Customized Scenario Selection", "Full Scenario", "Bulk Grid"],
+        key="likelihood_assessment_radio"
+    )
+
+    if likelihood_assessment_option == "Customized Scenario Selection":
+        customized.likelihood_assessment_customized(key="customized")
+    elif likelihood_assessment_option == "Full Scenario":
+        full.likelihood_assessment_full()
+    elif likelihood_assessment_option == "Bulk Grid":
+        bulk.bulk_likelihood_assessment()
+
+    if st.session_state.likelihood_assessment_complete:
+        st.success("Likelihood Assessment is complete. You can now proceed to Impact Assessment.")
+        check_likelihood_assessment_complete()
+
+
+@st.fragment
+def impact_assessment_tab():
+    st.markdown(
+    """
+    Second step is to determine the impact level of each attack scenario, based on defined a set of impact factors.
+    """
+     )
+
+    st.markdown("---")
+    if st.session_state.impact_assessment_ready:
+        impact_assessment_option = st.radio(
+            "Select Impact Assessment Option:",
+            ["Scenario by Scenario", "Bulk Grid"],
+            key="impact_assessment_radio"
+        )
+        if impact_assessment_option == "Scenario by Scenario":
+            impact_assessment.impact_assessment()
+        else:
+            bulk.bulk_impact_assessment()
+    else:
+        st.write("Complete the Likelihood Assessment first.")
+
+
+@st.fragment
+def risk_evaluation_tab():
+    st.markdown(
+    """
+    The third step is to evaluate the risk levels. Click the button below to compute the risk evaluation.
+    """
+    )
+
+    st.markdown("---")
+    impact_data = load_impact_assessment()
+    if impact_data is None:
+        st.write("Complete the Likelihood and Impact Assessments first.")
+    else:
+        st.write("You can now perform the Risk Evaluation based on the completed assessments.")
+        if st.button("Risk Computation"):
+            st.spinner("The risk is computing...")
+            risk_evaluation()
+            display_prioritized_risks()
+
+        risk_rows = get_risk_rows()
+        if risk_rows:
+            st.markdown("---")
+            display_risk_simulation(risk_rows)
+            st.markdown("---")
+            display_risk_rollup(risk_rows)
+            st.markdown("---")
+            display_attack_paths(risk_rows)
+            st.markdown("---")
+            display_mitigation_optimizer(risk_rows)
+
+
 with tab4:
     st.markdown(
         """
@@ -493,69 +635,34 @@ with tab4:
     )
 
 
+    with st.expander("LLM Pre-rating of Likelihood and Impact Factors"):
+        display_pre_rating(model_provider, api_key, model_name)
+
+    with st.expander("Rating Knowledge Base"):
+        display_rating_kb()
+
     tabs = st.tabs(["Likelihood Assessment", "Impact Assessment", "Risk Evaluation"])
 
     # Likelihood Assessment Tab
     with tabs[0]:
-        st.markdown(
-        """
-        First step of our risk assessment is to determine the likelihood level of each attack scenario, based on defined a set of likelihood factors.
-        """
-         )
-
-        st.markdown("---")
-
-        likelihood_assessment_option = st.radio(
-            "Select Likelihood Assessment Option:",
-            ["Customized Scenario Selection", "Full Scenario"],
-            key="likelihood_assessment_radio"
-        )
-
-        if likelihood_assessment_option == "Customized Scenario Selection":
-            customized.likelihood_assessment_customized(key="customized")
-        elif likelihood_assessment_option == "Full Scenario":
-            full.likelihood_assessment_full()
-
-        if st.session_state.likelihood_assessment_complete:
-            st.success("Likelihood Assessment is complete. You can now proceed to Impact Assessment.")
-            check_likelihood_assessment_complete()
+        likelihood_assessment_tab()
 
     # Impact Assessment Tab
     with tabs[1]:
-        st.markdown(
-        """
-        Second step is to determine the impact level of each attack scenario, based on defined a set of impact factors.
-        """
-         )
-
-        st.markdown("---")
-        if st.session_state.impact_assessment_ready:
-            impact_assessment.impact_assessment()
-        else:
-            st.write("Complete the Likelihood Assessment first.")
+        impact_assessment_tab()
 
     # Risk Evaluation Tab
     with tabs[2]:
-        st.markdown(
-        """
-        The third step is to evaluate the risk levels. Click the button below to compute the risk evaluation.
-        """
-        )
+        risk_evaluation_tab()
 
-        st.markdown("---")
-        impact_data = load_impact_assessment()
-        if impact_data is None:
-            st.write("Complete the Likelihood and Impact Assessments first.")
-        else:
-            st.write("You can now perform the Risk Evaluation based on the completed assessments.")
-            if st.button("Risk Computation"):
-                st.spinner("The risk is computing...")
-                risk_evaluation()
-                display_prioritized_risks()
-
-        # st.markdown("---")
-        # if st.button("Show Prioritized Risks"):
-        #     display_prioritized_risks()
+    # Report of all the tabs, for the audit of the assessment
+    st.markdown("---")
+    with st.expander("TARA Report"):
+        display_tara_report()
+
+    # st.markdown("---")
+    # if st.button("Show Prioritized Risks"):
+    #     display_prioritized_risks()
 
 
 
@@ -0,0 +1,324 @@
+# mitigation_optimizer.py
+
+import heapq
+import json
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+from util import levels, impact_levels
+from risk_model import load_risk_model, scenario_codes, score_codes
+
+# Largest number of controls the exact solver enumerates (2^n subsets)
+MAX_EXACT_CONTROLS = 16
+# Number of control subsets scored together by the exact solver
+EXACT_BATCH_SIZE = 64
+
+
+# Function to load control definitions from a JSON file of the form {"controls": [...]}
+def load_controls(file_path=None):
+    if file_path is None:
+        file_path = os.path.join(os.getcwd(), ".files\\controls.json")
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r") as f:
+        return json.load(f)["controls"]
+
+
+# Function to check control definitions and raise ValueError on the first problem found
+def validate_controls(controls):
+    names = set()
+    for control in controls:
+        name = control.get("name")
+        if not name:
+            raise ValueError("Every control needs a name.")
+        if name in names:
+            raise ValueError(f"Duplicate control name '{name}'.")
+        names.add(name)
+        if not isinstance(control.get("cost", 1), (int, float)) or control.get("cost", 1) <= 0:
+            raise ValueError(f"Control '{name}' must have a positive cost.")
+        shifts = control.get("shifts", {})
+        if not shifts:
+            raise ValueError(f"Control '{name}' does not shift any factor.")
+        for factor, level in shifts.items():
+            factor_levels = levels.get(factor) or impact_levels.get(factor)
+            if factor_levels is None:
+                raise ValueError(f"Control '{name}' shifts unknown factor '{factor}'.")
+            if level not in factor_levels:
+                raise ValueError(f"Control '{name}' shifts {factor} to unknown level '{level}'.")
+
+
+# Function to precompute, for every control, the scenarios it applies to and the level codes it enforces
+def compile_controls(model, controls, scenarios):
+    factors = model["likelihood_factors"] + model["impact_factors"]
+    n_likelihood = len(model["likelihood_factors"])
+
+    applies = np.zeros((len(controls), len(scenarios)), dtype=bool)
+    # Likelihood factors are raised to at least the control's level, impact factors lowered to at most it
+    targets = np.full((len(controls), len(factors)), -1, dtype=np.int8)
+    for i, control in enumerate(controls):
+        assets = set(control.get("assets", []))
+        threats = set(control.get("threats", []))
+        vectors = set(control.get("vectors", []))
+        applies[i] = [
+            (not assets or s["asset"] in assets) and (not threats or s["threat"] in threats) and (not vectors or s["vector"] in vectors)
+            for s in scenarios
+        ]
+        for factor, level in control["shifts"].items():
+            column = factors.index(factor)
+            if column < n_likelihood:
+                targets[i, column] = model["likelihood_codes"][factor][level]
+            else:
+                targets[i, column] = model["impact_codes"][factor][level]
+
+    return {"applies": applies, "targets": targets, "costs": np.array([c.get("cost", 1) for c in controls], dtype=float)}
+
+
+# Function to apply the target levels of one or more controls to a (..., scenarios, factors) code array
+def _apply_targets(model, codes, targets, mask):
+    n_likelihood = len(model["likelihood_factors"])
+    raised = np.where(mask[..., None] & (targets[..., :n_likelihood] >= 0), np.maximum(codes[..., :n_likelihood], targets[..., :n_likelihood]), codes[..., :n_likelihood])
+    lowered_target = np.where(targets[..., n_likelihood:] >= 0, targets[..., n_likelihood:], 127)
+    lowered = np.where(mask[..., None], np.minimum(codes[..., n_likelihood:], lowered_target), codes[..., n_likelihood:])
+    return np.concatenate([raised, lowered], axis=-1).astype(np.int8)
+
+
+def _risk(model, codes):
+    n_likelihood = len(model["likelihood_factors"])
+    risk = score_codes(model, codes[..., :n_likelihood].reshape(-1, n_likelihood), codes[..., n_likelihood:].reshape(-1, codes.shape[-1] - n_likelihood))["risk"]
+    return np.maximum(risk, 0).reshape(codes.shape[:-1])
+
+
+def _excess(risk, target_risk):
+    # Total number of risk levels above the target, summed over scenarios
+    return np.maximum(risk - target_risk + 1, 0).sum(axis=-1)
+
+
+def _codes_with_controls(model, codes, compiled, selected):
+    codes = codes.copy()
+    for i in selected:
+        codes = _apply_targets(model, codes, compiled["targets"][i], compiled["applies"][i])
+    return codes
+
+
+# Function to pick controls greedily by excess risk removed per unit cost, with lazy re-evaluation
+def optimize_greedy(model, codes, compiled, target_risk):
+    original_codes = codes
+    codes = codes.copy()
+    risk = _risk(model, codes)
+    excess = _excess(risk, target_risk)
+    steps = []
+
+    def gain(i):
+        mask = compiled["applies"][i]
+        if not mask.any():
+            return 0
+        shifted = _apply_targets(model, codes[mask], compiled["targets"][i], np.ones(mask.sum(), dtype=bool))
+        return int(_excess(risk[mask], target_risk) - _excess(_risk(model, shifted), target_risk))
+
+    # Max-heap of (-gain per cost, control index, step at which the gain was computed)
+    heap = [(-gain(i) / compiled["costs"][i], i, 0) for i in range(len(compiled["costs"]))]
+    heapq.heapify(heap)
+
+    while excess > 0 and heap:
+        ratio, i, computed_at = heapq.heappop(heap)
+        if computed_at != len(steps):
+            # Stale gain: re-evaluate against the current codes and push it back
+            heapq.heappush(heap, (-gain(i) / compiled["costs"][i], i, len(steps)))
+            continue
+        if ratio == 0:
+            # Gains are not submodular: a control that helped nothing before may help once others are
+            # applied, so every stale gain is re-evaluated before giving up
+            heap.append((ratio, i, computed_at))
+            if all(entry[2] == len(steps) for entry in heap):
+                break
+            heap = [(-gain(c) / compiled["costs"][c], c, len(steps)) for _, c, _ in heap]
+            heapq.heapify(heap)
+            continue
+
+        mask = compiled["applies"][i]
+        codes[mask] = _apply_targets(model, codes[mask], compiled["targets"][i], np.ones(mask.sum(), dtype=bool))
+        risk[mask] = _risk(model, codes[mask])
+        excess = int(_excess(risk, target_risk))
+        steps.append({"control": i, "excess": excess, "above_target": int((risk >= target_risk).sum())})
+
+    # Drop selected controls, most expensive first, that later picks made redundant
+    selected = [step["control"] for step in steps]
+    for i in sorted(selected, key=lambda c: -compiled["costs"][c]):
+        remaining = [c for c in selected if c != i]
+        remaining_risk = _risk(model, _codes_with_controls(model, original_codes, compiled, remaining))
+        if _excess(remaining_risk, target_risk) <= excess:
+            selected = remaining
+            risk = remaining_risk
+
+    return {"selected": selected, "steps": steps, "risk": risk}
+
+
+# Function to find the cheapest control set bringing every scenario below the target by enumerating subsets
+def optimize_exact(model, codes, compiled, target_risk):
+    n_controls = len(compiled["costs"])
+    if n_controls > MAX_EXACT_CONTROLS:
+        raise ValueError(f"The exact solver supports at most {MAX_EXACT_CONTROLS} controls.")
+
+    # Only scenarios currently at or above the target need to be brought down
+    active = _risk(model, codes) >= target_risk
+    active_codes = codes[active]
+    applies = compiled["applies"][:, active]
+    if not active.any():
+        return {"selected": [], "risk": _risk(model, codes)}
+
+    subsets = np.arange(1 << n_controls)
+    membership = ((subsets[:, None] >> np.arange(n_controls)[None, :]) & 1).astype(bool)
+    subset_costs = membership @ compiled["costs"]
+    order = np.argsort(subset_costs, kind="stable")
+
+    for start in range(0, len(order), EXACT_BATCH_SIZE):
+        batch = order[start:start + EXACT_BATCH_SIZE]
+        batch_codes = np.broadcast_to(active_codes, (len(batch),) + active_codes.shape).copy()
+        for i in range(n_controls):
+            mask = membership[batch, i][:, None] & applies[i][None, :]
+            if mask.any():
+                batch_codes = _apply_targets(model, batch_codes, compiled["targets"][i], mask)
+        feasible = (_risk(model, batch_codes) < target_risk).all(axis=1)
+        if feasible.any():
+            subset = batch[np.argmax(feasible)]
+            selected = [i for i in range(n_controls) if membership[subset, i]]
+            return {"selected": selected, "risk": _risk(model, _codes_with_controls(model, codes, compiled, selected))}
+
+    return None
+
+
+# Function to run the optimizer for assessed scenarios (entries of risk_assessment.json)
+def optimize_controls(scenarios, controls, target_risk, method="greedy", model=None):
+    if model is None:
+        model = load_risk_model()
+    validate_controls(controls)
+    compiled = compile_controls(model, controls, scenarios)
+    codes = np.array([np.concatenate(scenario_codes(model, s)) for s in scenarios], dtype=np.int8).reshape(len(scenarios), -1)
+
+    if method == "exact":
+        result = optimize_exact(model, codes, compiled, target_risk)
+        if result is None:
+            return None
+    else:
+        result = optimize_greedy(model, codes, compiled, target_risk)
+        result["incomplete"] = False
+        if _excess(result["risk"], target_risk) > 0:
+            # Greedy only adds controls that help on their own, and can miss combinations that only help
+            # together; the exact solver settles whether such a combination exists
+            if len(controls) <= MAX_EXACT_CONTROLS:
+                exact = optimize_exact(model, codes, compiled, target_risk)
+                if exact is not None:
+                    result = exact
+            else:
+                result["incomplete"] = True
+
+    result["controls"] = [controls[i] for i in result["selected"]]
+    result["cost"] = float(sum(compiled["costs"][i] for i in result["selected"]))
+    result["remaining"] = [scenarios[i] for i in np.flatnonzero(result["risk"] >= target_risk)]
+    return result
+
+
+# Function to record the selected controls in the per-threat "controls" lists of the unified attack model
+def apply_controls_to_attack_model(unified_attack_model_path, controls):
+    with open(unified_attack_model_path, "r") as f:
+        data = json.load(f)
+
+    for asset in data["assets"]:
+        for threat in asset["threats"]:
+            for control in controls:
+                if control.get("assets") and asset["name"] not in control["assets"]:
+                    continue
+                if control.get("threats") and threat["name"] not in control["threats"]:
+                    continue
+                if control.get("vectors") and not any(v["vector_name"] in control["vectors"] for v in threat["vectors"]):
+                    continue
+                if control["name"] not in threat["controls"]:
+                    threat["controls"].append(control["name"])
+
+    with open(unified_attack_model_path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+@st.fragment
+def display_mitigation_optimizer(scenarios):
+    st.subheader("Mitigation Portfolio Optimizer")
+    st.markdown(
+        "Finds the cheapest set of controls that brings every scenario below the target risk level. "
+        "Each control declares the factor levels it enforces (e.g. Equipment → Bespoke) and the assets, threats or vectors it covers."
+    )
+
+    uploaded_file = st.file_uploader("Upload controls JSON file", type="json", key="optimizer_controls_file")
+    # Results of other controls no longer apply once a different file is uploaded or removed
+    source = uploaded_file.file_id if uploaded_file is not None else None
+    if st.session_state.get("optimizer_controls_source") != source:
+        st.session_state.optimizer_controls_source = source
+        st.session_state.pop("optimizer_result", None)
+    if uploaded_file is not None:
+        try:
+            data = json.load(uploaded_file)
+        except json.JSONDecodeError:
+            st.error(f"The file {uploaded_file.name} is not a valid JSON.")
+            return
+        if not isinstance(data, dict) or "controls" not in data:
+            st.error(f"The file {uploaded_file.name} does not contain 'controls' key.")
+            return
+        controls = data["controls"]
+        if not isinstance(controls, list) or not all(isinstance(control, dict) for control in controls):
+            st.error(f"The 'controls' key of the file {uploaded_file.name} must be a list of control objects.")
+            return
+    else:
+        controls = load_controls()
+    if not controls:
+        st.write('No controls defined. Upload a JSON file of the form {"controls": [{"name": ..., "cost": ..., "shifts": {...}, "threats": [...], "vectors": [...]}]}.')
+        return
+
+    model = load_risk_model()
+    max_risk = int(model["risk_matrix"].max())
+    col1, col2 = st.columns(2)
+    with col1:
+        target_risk = st.selectbox("Target: every risk level below", list(range(2, max_risk + 1)), index=max(0, max_risk - 3), key="optimizer_target")
+    with col2:
+        methods = ["Greedy"] + (["Exact"] if len(controls) <= MAX_EXACT_CONTROLS else [])
+        method = st.radio("Solver", methods, horizontal=True, key="optimizer_method")
+
+    if st.button("Optimize Controls", key="optimizer_run"):
+        try:
+            with st.spinner("Optimizing control set..."):
+                st.session_state.optimizer_result = optimize_controls(scenarios, controls, target_risk, method=method.lower(), model=model)
+        except ValueError as e:
+            st.error(f"Invalid control definitions: {e}")
+            return
+
+    if "optimizer_result" not in st.session_state:
+        return
+    result = st.session_state.optimizer_result
+    if result is None:
+        st.error("No combination of the defined controls brings every scenario below the target risk level.")
+        return
+
+    st.write(f"Selected {len(result['controls'])} control(s) with a total cost of {result['cost']:g}.")
+    st.dataframe(
+        pd.DataFrame([
+            {"Control": c["name"], "Cost": c.get("cost", 1), "Shifts": ", ".join(f"{k} → {v}" for k, v in c["shifts"].items())}
+            for c in result["controls"]
+        ]),
+        hide_index=True,
+    )
+    if result["remaining"]:
+        st.warning(f"{len(result['remaining'])} scenario(s) remain at or above the target risk level with the defined controls.")
+        if result.get("incomplete"):
+            st.caption(
+                f"With more than {MAX_EXACT_CONTROLS} controls only the greedy solver runs, and it can miss "
+                "combinations of controls that only lower the risk together."
+            )
+        st.dataframe(
+            pd.DataFrame([{"Asset": s["asset"], "Threat": s["threat"], "Attack Vector": s["vector"], "Scenario ID": s["scenario_id"]} for s in result["remaining"]]),
+            hide_index=True,
+        )
+
+    unified_attack_model_path = os.path.join(os.getcwd(), ".files\\unified_attack_model.json")
+    if result["controls"] and os.path.exists(unified_attack_model_path):
+        if st.button("Add Selected Controls to Attack Model", key="optimizer_apply"):
+            apply_controls_to_attack_model(unified_attack_model_path, result["controls"])
+            st.success("Selected controls added to the unified attack model. Regenerate the attack graphs to see them.")
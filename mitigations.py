@@ -1,7 +1,3 @@
-import google.generativeai as genai
-from openai import OpenAI
-
-
 # Function to create a prompt to generate mitigating controls
 def create_mitigations_prompt(threats):
     prompt = f"""
@@ -22,6 +18,8 @@ YOUR RESPONSE (do not wrap in a code block):
 
 # Function to get mitigations from the GPT response.
 def get_mitigations(api_key, model_name, prompt):
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
 
     response = client.chat.completions.create(
@@ -40,6 +38,8 @@ def get_mitigations(api_key, model_name, prompt):
 
 # Function to get mitigations from the Google model's response.
 def get_mitigations_google(google_api_key, google_model, prompt):
+    import google.generativeai as genai
+
     genai.configure(api_key=google_api_key)
     model = genai.GenerativeModel(
         google_model,
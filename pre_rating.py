@@ -0,0 +1,313 @@
+# pre_rating.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import streamlit as st
+from util import levels, comments, impact_levels
+from rating_store import likelihood_codes, impact_codes, likelihood_entries, impact_entries
+
+MAX_RETRIES = 5
+
+# Estimated output tokens per scenario of a batch: 9 factors, each with a level of up to 85 characters, a
+# one-sentence rationale and the JSON keys around them
+TOKENS_PER_SCENARIO = 800
+# Output tokens of the response besides the scenarios
+RESPONSE_OVERHEAD_TOKENS = 200
+
+# Largest number of output tokens of each model; batches are capped so that their response fits
+MODEL_MAX_OUTPUT_TOKENS = {
+    "gpt-4o-mini": 16384,
+    "gpt-4o": 16384,
+    "gpt-4-turbo": 4096,
+    # The 8192 tokens of gpt-4 are shared by the prompt and the response
+    "gpt-4": 4096,
+    "gemini-1.5-pro-latest": 8192,
+}
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+
+
+# Function to describe the likelihood and impact factor levels for the prompt
+def describe_factor_levels():
+    lines = ["Likelihood factors (choose exactly one level per factor):"]
+    for factor, factor_levels in levels.items():
+        lines.append(f"- {factor}:")
+        for level, comment in zip(factor_levels, comments[factor]):
+            lines.append(f"    - \"{level}\": {comment}")
+    lines.append("")
+    lines.append("Impact factors (choose exactly one level per factor, quoted exactly as written):")
+    for factor, factor_levels in impact_levels.items():
+        lines.append(f"- {factor}:")
+        for level in factor_levels:
+            lines.append(f"    - \"{level}\"")
+    return "\n".join(lines)
+
+
+# Function to create a prompt to pre-rate a batch of attack scenarios
+def create_pre_rating_prompt(scenarios):
+    scenario_lines = "\n".join(
+        f"- id: {i}\n  Asset: {s['asset']}\n  Threat: {s['threat']}\n  Attack Vector: {s['vector']}\n  Scenario: {s['scenario_desc']}"
+        for i, s in enumerate(scenarios)
+    )
+    prompt = f"""
+As a seasoned automotive cybersecurity expert performing an ISO/SAE 21434 Threat Analysis and Risk Assessment (TARA), propose likelihood (attack potential) and impact ratings for each of the attack scenarios below. A human analyst will review every proposal, so give a short rationale of one sentence for each rating.
+
+{describe_factor_levels()}
+
+Attack scenarios:
+{scenario_lines}
+
+The output MUST be strictly in JSON format with the key "ratings", an array with one object per scenario:
+{{
+    "ratings": [
+        {{
+            "id": 0,
+            "likelihood": {{
+                "Elapsed Time": {{"level": "less than 1 week", "rationale": "..."}},
+                ...one entry per likelihood factor
+            }},
+            "impact": {{
+                "Safety": {{"level": "No injuries.", "rationale": "..."}},
+                ...one entry per impact factor
+            }}
+        }}
+    ]
+}}
+YOUR RESPONSE (do not add introductory text, just provide JSON formatted output):
+"""
+    return prompt
+
+
+# Function to return the largest number of scenarios per request whose response fits the output limit of the model
+def get_max_batch_size(model_name):
+    max_output_tokens = MODEL_MAX_OUTPUT_TOKENS.get(model_name, DEFAULT_MAX_OUTPUT_TOKENS)
+    return max(1, (max_output_tokens - RESPONSE_OVERHEAD_TOKENS) // TOKENS_PER_SCENARIO)
+
+
+# Function to return the output token budget of a request rating batch_size scenarios
+def get_max_tokens(model_name, batch_size):
+    max_output_tokens = MODEL_MAX_OUTPUT_TOKENS.get(model_name, DEFAULT_MAX_OUTPUT_TOKENS)
+    return min(max_output_tokens, RESPONSE_OVERHEAD_TOKENS + TOKENS_PER_SCENARIO * batch_size)
+
+
+# Function to get pre-ratings from the GPT response.
+def get_pre_ratings(api_key, model_name, prompt, max_tokens=DEFAULT_MAX_OUTPUT_TOKENS):
+    from openai import OpenAI
+
+    client = OpenAI(api_key=api_key)
+
+    response = client.chat.completions.create(
+        model=model_name,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=max_tokens,
+    )
+
+    return json.loads(response.choices[0].message.content)
+
+
+# Function to get pre-ratings from the Google response.
+def get_pre_ratings_google(google_api_key, google_model, prompt, max_tokens=DEFAULT_MAX_OUTPUT_TOKENS):
+    import google.generativeai as genai
+
+    genai.configure(api_key=google_api_key)
+    model = genai.GenerativeModel(
+        google_model,
+        generation_config={"response_mime_type": "application/json", "max_output_tokens": max_tokens})
+    response = model.generate_content(prompt)
+    return json.loads(response.candidates[0].content.parts[0].text)
+
+
+# Function to return a wait() function allowing at most requests_per_minute calls across threads
+def make_rate_limiter(requests_per_minute):
+    interval = 60.0 / requests_per_minute if requests_per_minute else 0
+    lock = threading.Lock()
+    next_slot = [time.monotonic()]
+
+    def wait():
+        with lock:
+            now = time.monotonic()
+            slot = max(now, next_slot[0])
+            next_slot[0] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    return wait
+
+
+def get_pre_rating_cache_path():
+    return os.path.join(os.getcwd(), ".files\\pre_rating_cache.json")
+
+
+def load_pre_rating_cache():
+    cache_path = get_pre_rating_cache_path()
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+# Function to keep only the proposed levels that exist in util, with their rationale
+def parse_rating(rating):
+    parsed = {"likelihood": {}, "impact": {}}
+    for section, factor_levels in (("likelihood", levels), ("impact", impact_levels)):
+        for factor, proposal in (rating.get(section) or {}).items():
+            if factor in factor_levels and isinstance(proposal, dict) and proposal.get("level") in factor_levels[factor]:
+                parsed[section][factor] = {"level": proposal["level"], "rationale": proposal.get("rationale", "")}
+    return parsed
+
+
+def pre_rate_scenarios(scenarios, get_ratings, api_key, model_name, batch_size=10, max_workers=4,
+                       requests_per_minute=30, progress_callback=None):
+    """
+    Sends the scenarios to the LLM in concurrent batches and returns one parsed proposal per
+    scenario (None when the model gave no usable proposal). Batches are capped to the size whose
+    response fits the output limit of the model. Complete responses are cached by prompt so re-running
+    the stage only calls the provider for new or changed batches, and for batches with missing ratings.
+
+    Parameters:
+    scenarios (list): Scenario dictionaries with asset, threat, vector, scenario_id and scenario_desc.
+    get_ratings (callable): get_pre_ratings or get_pre_ratings_google.
+    """
+    cache = load_pre_rating_cache()
+    cache_lock = threading.Lock()
+    wait_for_slot = make_rate_limiter(requests_per_minute)
+    batch_size = min(batch_size, get_max_batch_size(model_name))
+    batches = [scenarios[i:i + batch_size] for i in range(0, len(scenarios), batch_size)]
+
+    def rate_batch(batch):
+        prompt = create_pre_rating_prompt(batch)
+        cache_key = hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+        with cache_lock:
+            if cache_key in cache:
+                return cache[cache_key]
+
+        for retry_count in range(1, MAX_RETRIES + 1):
+            wait_for_slot()
+            try:
+                response = get_ratings(api_key, model_name, prompt, get_max_tokens(model_name, len(batch)))
+                ratings = {str(r.get("id")): r for r in response.get("ratings", [])}
+                break
+            except Exception as e:
+                if retry_count == MAX_RETRIES:
+                    print(f"Error pre-rating batch after {MAX_RETRIES} attempts: {e}")
+                    return None
+                time.sleep(2 ** retry_count)
+
+        result = [parse_rating(ratings[str(i)]) if str(i) in ratings else None for i in range(len(batch))]
+        # A batch with missing ratings (such as a cut-off response) is asked again on the next run
+        if None not in result:
+            with cache_lock:
+                cache[cache_key] = result
+        return result
+
+    results = [None] * len(batches)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(rate_batch, batch): index for index, batch in enumerate(batches)}
+        for completed, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(completed, len(batches))
+
+    with open(get_pre_rating_cache_path(), "w") as f:
+        json.dump(cache, f)
+
+    proposals = []
+    for batch, result in zip(batches, results):
+        proposals.extend(result if result is not None else [None] * len(batch))
+    return proposals
+
+
+# Function to save the proposals as draft likelihood and impact assessments for human review
+def save_pre_rating_drafts(scenarios, proposals):
+    likelihood_drafts = []
+    impact_drafts = []
+    for scenario, proposal in zip(scenarios, proposals):
+        if proposal is None:
+            continue
+        details = {
+            "asset": scenario["asset"],
+            "threat": scenario["threat"],
+            "vector": scenario["vector"],
+            "scenario_id": scenario["scenario_id"],
+            "scenario_desc": scenario["scenario_desc"],
+        }
+        # Expand the proposed levels through their codes, keeping the rationale next to each entry
+        likelihood = [
+            dict(entry, Rationale=proposal["likelihood"][entry["Factor"]]["rationale"])
+            for entry in likelihood_entries(likelihood_codes(
+                [{"Factor": factor, "Level": proposed["level"]} for factor, proposed in proposal["likelihood"].items()]
+            ))
+        ]
+        impact = [
+            dict(entry, Rationale=proposal["impact"][entry["Factor"]]["rationale"])
+            for entry in impact_entries(impact_codes(
+                [{"Factor": factor, "Level": proposed["level"]} for factor, proposed in proposal["impact"].items()]
+            ))
+        ]
+        likelihood_drafts.append(dict(details, Likelihood=likelihood))
+        impact_drafts.append(dict(details, Likelihood=likelihood, Impact=impact))
+
+    base_path = os.getcwd()
+    with open(os.path.join(base_path, ".files\\draft_likelihood_assessment.json"), "w") as f:
+        json.dump({"Scenarios": likelihood_drafts}, f, indent=4)
+    with open(os.path.join(base_path, ".files\\draft_impact_assessment.json"), "w") as f:
+        json.dump({"Scenarios": impact_drafts}, f, indent=4)
+    return len(likelihood_drafts)
+
+
+# Function to load a draft assessment ("likelihood" or "impact") keyed by scenario
+def load_pre_rating_drafts(kind):
+    file_path = os.path.join(os.getcwd(), f".files\\draft_{kind}_assessment.json")
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, "r") as f:
+        drafts = json.load(f)["Scenarios"]
+    return {(s["asset"], s["threat"], s["vector"], s["scenario_id"]): s for s in drafts}
+
+
+@st.fragment
+def display_pre_rating(model_provider, api_key, model_name):
+    st.markdown(
+        "Proposes levels and rationales for every likelihood and impact factor with the selected LLM. "
+        "The proposals pre-populate the Bulk Grid of both assessments as drafts for review; nothing is final until you save it there."
+    )
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        batch_size = st.number_input("Scenarios per request", 1, 50, 10, key="pre_rating_batch_size")
+    with col2:
+        max_workers = st.number_input("Concurrent requests", 1, 16, 4, key="pre_rating_workers")
+    with col3:
+        requests_per_minute = st.number_input("Requests per minute", 1, 500, 30, key="pre_rating_rpm")
+    if batch_size > get_max_batch_size(model_name):
+        st.caption(f"Requests to {model_name} are limited to {get_max_batch_size(model_name)} scenarios so that the ratings fit its output limit.")
+
+    if st.button("Pre-rate Scenarios", key="pre_rating_run"):
+        if not api_key:
+            st.error("Please enter your API key in the sidebar first.")
+            return
+        from likelihood_assessment_full import load_attack_model_scenarios
+
+        try:
+            scenarios = load_attack_model_scenarios()
+        except FileNotFoundError:
+            st.error("Unified attack model JSON file does not exist. Please generate the attack model first in the 'Attack Model' tab.")
+            return
+
+        get_ratings = get_pre_ratings_google if model_provider == "Google AI API" else get_pre_ratings
+        progress = st.progress(0.0, text="Pre-rating scenarios...")
+        proposals = pre_rate_scenarios(
+            scenarios, get_ratings, api_key, model_name,
+            batch_size=int(batch_size), max_workers=int(max_workers), requests_per_minute=int(requests_per_minute),
+            progress_callback=lambda done, total: progress.progress(done / total, text=f"Pre-rated {done}/{total} batches"),
+        )
+        drafted = save_pre_rating_drafts(scenarios, proposals)
+        for key in ("bulk_likelihood_grid", "bulk_impact_grid"):
+            st.session_state.pop(key, None)
+        st.success(f"Draft ratings proposed for {drafted} of {len(scenarios)} scenarios. Review them in the Bulk Grid.")
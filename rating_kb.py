@@ -0,0 +1,392 @@
+# rating_kb.py
+
+import json
+import os
+import tempfile
+import time
+import zlib
+import numpy as np
+import pandas as pd
+import streamlit as st
+from util import levels, impact_levels
+from rating_store import UNRATED, LIKELIHOOD_FACTORS, IMPACT_FACTORS, LIKELIHOOD_CODES, IMPACT_CODES
+from scenario_similarity import tokenize
+
+# Length of the hashed TF-IDF vectors of the stored scenarios
+KB_DIMENSIONS = 256
+
+# Number of past scenarios a suggestion is drawn from, and the similarity below which they are ignored
+KB_TOP_K = 5
+KB_MIN_SIMILARITY = 0.3
+
+# Columns of the stored level codes: the likelihood factors, then the impact factors
+KB_FACTORS = {"likelihood": LIKELIHOOD_FACTORS, "impact": IMPACT_FACTORS}
+KB_COLUMNS = {"likelihood": slice(0, len(LIKELIHOOD_FACTORS)), "impact": slice(len(LIKELIHOOD_FACTORS), len(LIKELIHOOD_FACTORS) + len(IMPACT_FACTORS))}
+KB_LEVELS = {"likelihood": levels, "impact": impact_levels}
+
+SCENARIO_FIELDS = ["project", "asset", "threat", "vector", "scenario_id", "scenario_desc"]
+
+_rating_kb_cache = {}
+
+
+def get_rating_kb_paths():
+    base_path = os.getcwd()
+    return {
+        "meta": os.path.join(base_path, ".files\\rating_kb.json"),
+        "vectors": os.path.join(base_path, ".files\\rating_kb_vectors.npy"),
+        "codes": os.path.join(base_path, ".files\\rating_kb_codes.npy"),
+    }
+
+
+# Function to return the text a scenario is matched on: its attack vector and description
+def kb_text(scenario):
+    return f"{scenario['vector']} {scenario['scenario_desc']}"
+
+
+# Function to hash the terms of the texts into (document, dimension, signed count) entries; the sign comes
+# from another bit of the term hash, so that colliding terms tend to cancel out instead of adding up
+def hashed_term_counts(texts, dimensions=KB_DIMENSIONS):
+    docs, hashes, term_ids = [], [], {}
+    for doc, text in enumerate(texts):
+        for term in tokenize(text):
+            term_hash = term_ids.get(term)
+            if term_hash is None:
+                term_hash = term_ids[term] = zlib.crc32(term.encode("utf-8"))
+            docs.append(doc)
+            hashes.append(term_hash)
+    keys, counts = np.unique(np.array(docs, dtype=np.int64) << 32 | np.array(hashes, dtype=np.int64), return_counts=True)
+    term_hashes = keys & 0xFFFFFFFF
+    signs = np.where(term_hashes >> 31, -1.0, 1.0)
+    return keys >> 32, (term_hashes % dimensions).astype(np.int64), signs * (1.0 + np.log(counts))
+
+
+# Function to compute the inverse document frequency of every dimension
+def dimension_idf(docs, dims, size, dimensions=KB_DIMENSIONS):
+    present = np.unique(docs * dimensions + dims) % dimensions
+    return (np.log((1.0 + size) / (1.0 + np.bincount(present, minlength=dimensions))) + 1.0).astype(np.float32)
+
+
+# Function to build the L2-normalized vectors of the texts and return them with the dimension weights used,
+# computed from the texts themselves when not given
+def kb_vectors(texts, idf=None, dimensions=KB_DIMENSIONS):
+    docs, dims, counts = hashed_term_counts(texts, dimensions)
+    if idf is None:
+        idf = dimension_idf(docs, dims, len(texts), dimensions)
+    flat = np.bincount(docs * dimensions + dims, weights=counts * idf[dims], minlength=len(texts) * dimensions)
+    vectors = flat.astype(np.float32).reshape(len(texts), dimensions)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors, idf
+
+
+# Function to convert rating entries into level codes; a level missing from util is stored as unrated and recorded in unknown
+def _kb_codes(entries, factors, level_codes, unknown):
+    by_factor = {entry["Factor"]: entry["Level"] for entry in entries}
+    codes = []
+    for factor in factors:
+        level = by_factor.get(factor)
+        code = level_codes[factor].get(level, UNRATED)
+        if level is not None and code == UNRATED:
+            unknown.add(f"{factor}: {level}")
+        codes.append(code)
+    return codes
+
+
+def kb_entries_from_assessment(data, project):
+    """
+    Converts the scenarios of an assessment file into knowledge base entries with their level codes.
+    Returns the entries and the sorted "Factor: Level" names of the levels not defined in util, which
+    are stored as unrated.
+
+    Parameters:
+    data (dict): Content of a final_likelihood_assessment.json or final_impact_assessment.json file.
+    project (str): Name of the project the scenarios come from.
+    """
+    entries, unknown = [], set()
+    for scenario in data.get("Scenarios", []):
+        entry = {field: scenario.get(field, "") for field in SCENARIO_FIELDS}
+        entry["project"] = project
+        entry["codes"] = (
+            _kb_codes(scenario.get("Likelihood", []), LIKELIHOOD_FACTORS, LIKELIHOOD_CODES, unknown)
+            + _kb_codes(scenario.get("Impact", []), IMPACT_FACTORS, IMPACT_CODES, unknown)
+        )
+        entries.append(entry)
+    return entries, sorted(unknown)
+
+
+# Function to save the knowledge base: the vectors are memory-mapped on load, the scenarios and weights in JSON
+def save_rating_kb(scenarios, codes):
+    if not scenarios:
+        return
+    paths = get_rating_kb_paths()
+    # Release the memory map first, a mapped file cannot be replaced on Windows
+    _rating_kb_cache.clear()
+    vectors, idf = kb_vectors([kb_text(scenario) for scenario in scenarios])
+    np.save(paths["vectors"] + ".tmp.npy", vectors)
+    os.replace(paths["vectors"] + ".tmp.npy", paths["vectors"])
+    np.save(paths["codes"] + ".tmp.npy", np.asarray(codes, dtype=np.int8).reshape(len(scenarios), -1))
+    os.replace(paths["codes"] + ".tmp.npy", paths["codes"])
+    # The JSON file is written last, its modification time identifies the knowledge base version
+    with open(paths["meta"] + ".tmp", "w") as f:
+        json.dump({"dimensions": KB_DIMENSIONS, "idf": idf.tolist(), "scenarios": scenarios}, f)
+    os.replace(paths["meta"] + ".tmp", paths["meta"])
+
+
+def load_rating_kb():
+    """
+    Loads the knowledge base, None when it is empty. The vector matrix is memory-mapped, so only the
+    pages read by the searches are loaded; the load is cached until the knowledge base is saved again.
+    """
+    paths = get_rating_kb_paths()
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    mtime = os.path.getmtime(paths["meta"])
+    if _rating_kb_cache.get("mtime") != mtime:
+        with open(paths["meta"], "r") as f:
+            meta = json.load(f)
+        codes = np.load(paths["codes"])
+        _rating_kb_cache.clear()
+        _rating_kb_cache.update({
+            "mtime": mtime,
+            "kb": {
+                "scenarios": meta["scenarios"],
+                "idf": np.array(meta["idf"], dtype=np.float32),
+                "dimensions": meta["dimensions"],
+                "vectors": np.load(paths["vectors"], mmap_mode="r"),
+                "codes": codes,
+                # Scenarios rated on every factor of an assessment, the only ones suggested for it
+                "rated": {kind: (codes[:, columns] != UNRATED).all(axis=1) for kind, columns in KB_COLUMNS.items()},
+            },
+        })
+    return _rating_kb_cache["kb"] if _rating_kb_cache["kb"]["scenarios"] else None
+
+
+def add_to_rating_kb(entries, project):
+    """
+    Adds the rated scenarios of a project to the knowledge base, replacing the scenarios stored for
+    that project before. Returns the number of scenarios stored.
+
+    Parameters:
+    entries (list): Entries built by kb_entries_from_assessment.
+    project (str): Name of the project the scenarios come from.
+    """
+    if not entries:
+        return 0
+    kb = load_rating_kb()
+    scenarios, codes = [], []
+    if kb is not None:
+        kept = [row for row, scenario in enumerate(kb["scenarios"]) if scenario["project"] != project]
+        scenarios = [kb["scenarios"][row] for row in kept]
+        codes = kb["codes"][kept].tolist()
+    # An entry rated in several files (likelihood, then impact) keeps the codes of each file
+    merged = {}
+    for entry in entries:
+        key = (entry["asset"], entry["threat"], entry["vector"], entry["scenario_id"])
+        if key in merged:
+            merged[key]["codes"] = [new if new != UNRATED else old for old, new in zip(merged[key]["codes"], entry["codes"])]
+        else:
+            merged[key] = dict(entry)
+    for entry in merged.values():
+        scenarios.append({field: entry[field] for field in SCENARIO_FIELDS})
+        codes.append(entry["codes"])
+    save_rating_kb(scenarios, codes)
+    return len(scenarios)
+
+
+def search_rating_kb(kb, scenario, kind, k=KB_TOP_K):
+    """
+    Returns the rows and cosine similarities of the k stored scenarios most similar to a scenario,
+    among the ones rated on every factor of the assessment, most similar first.
+
+    Parameters:
+    kb (dict): Knowledge base returned by load_rating_kb.
+    scenario (dict): Scenario with vector and scenario_desc.
+    kind (str): "likelihood" or "impact".
+    """
+    query = kb_vectors([kb_text(scenario)], kb["idf"], kb["dimensions"])[0][0]
+    similarities = np.asarray(kb["vectors"] @ query)
+    similarities[~kb["rated"][kind]] = -np.inf
+    k = min(k, int(kb["rated"][kind].sum()))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows = np.argpartition(-similarities, k - 1)[:k]
+    rows = rows[np.argsort(-similarities[rows], kind="stable")]
+    return rows, similarities[rows]
+
+
+def suggest_ratings(kb, rows, similarities, kind, min_similarity=KB_MIN_SIMILARITY):
+    """
+    Suggests one level code per factor by a similarity-weighted vote of the given stored scenarios.
+    Returns the codes (UNRATED when no scenario is similar enough) and the agreement of every factor,
+    the share of the vote its level received.
+    """
+    factors = KB_FACTORS[kind]
+    similar = similarities >= min_similarity
+    codes = kb["codes"][rows[similar], KB_COLUMNS[kind]].astype(np.int64)
+    weights = similarities[similar].astype(np.float64)
+    suggested = np.full(len(factors), UNRATED, dtype=np.int8)
+    agreement = np.zeros(len(factors))
+    if not len(weights):
+        return suggested, agreement
+    for column, factor in enumerate(factors):
+        votes = np.bincount(codes[:, column], weights=weights, minlength=len(KB_LEVELS[kind][factor]))
+        suggested[column] = votes.argmax()
+        agreement[column] = votes.max() / weights.sum()
+    return suggested, agreement
+
+
+def display_rating_suggestions(kind, scenario, key):
+    """
+    Shows the past scenarios most similar to a scenario and the levels they suggest. Returns the
+    suggested level codes when the analyst applies them, None otherwise.
+
+    Parameters:
+    kind (str): "likelihood" or "impact".
+    scenario (dict): Scenario being rated.
+    key (str): Prefix of the widget keys.
+    """
+    kb = load_rating_kb()
+    if kb is None:
+        return None
+    rows, similarities = search_rating_kb(kb, scenario, kind)
+    suggested, agreement = suggest_ratings(kb, rows, similarities, kind)
+    with st.expander(f"Suggestions from past assessments (best match {similarities[0]:.0%})" if len(rows) else "Suggestions from past assessments"):
+        if (suggested == UNRATED).all():
+            st.write(f"No past scenario is at least {KB_MIN_SIMILARITY:.0%} similar to this one.")
+            return None
+        factors = KB_FACTORS[kind]
+        factor_levels = KB_LEVELS[kind]
+        st.dataframe(pd.DataFrame({
+            "Factor": factors,
+            "Suggested Level": [factor_levels[factor][code] for factor, code in zip(factors, suggested)],
+            "Agreement": [f"{share:.0%}" for share in agreement],
+        }), hide_index=True)
+        matches = []
+        for row, similarity in zip(rows, similarities):
+            past = kb["scenarios"][row]
+            match = {"Similarity": f"{similarity:.0%}", "Project": past["project"], "Asset": past["asset"], "Scenario": past["scenario_desc"]}
+            for factor, code in zip(factors, kb["codes"][row, KB_COLUMNS[kind]]):
+                match[factor] = factor_levels[factor][code]
+            matches.append(match)
+        st.write("Most similar past scenarios")
+        st.dataframe(pd.DataFrame(matches), hide_index=True)
+        if st.button("Use Suggested Levels", key=f"{key}_use_suggestion"):
+            return suggested
+    return None
+
+
+# Function to load an assessment file of the current project, None when it does not exist
+def _load_project_assessment(file_name):
+    file_path = os.path.join(os.getcwd(), f".files\\{file_name}")
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+@st.fragment
+def display_rating_kb():
+    st.markdown(
+        "Stores the rated scenarios of past projects. While rating a scenario, the Full Scenario and Scenario by Scenario "
+        "assessments suggest the levels of the most similar stored scenarios."
+    )
+    kb = load_rating_kb()
+    if kb is None:
+        st.write("The knowledge base is empty.")
+    else:
+        projects = pd.Series([scenario["project"] for scenario in kb["scenarios"]]).value_counts()
+        st.write(f"{len(kb['scenarios'])} scenarios from {len(projects)} projects.")
+        st.dataframe(projects.rename_axis("Project").reset_index(name="Scenarios"), hide_index=True)
+
+    project = st.text_input("Project name", key="rating_kb_project")
+    uploaded_files = st.file_uploader(
+        "Past final_likelihood_assessment.json / final_impact_assessment.json files",
+        accept_multiple_files=True, type="json", key="rating_kb_files",
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Add Uploaded Files", key="rating_kb_add_files", disabled=not uploaded_files):
+            if not project:
+                st.error("Please enter the project name first.")
+            else:
+                entries = []
+                for uploaded_file in uploaded_files:
+                    try:
+                        data = json.load(uploaded_file)
+                    except json.JSONDecodeError:
+                        st.error(f"The file {uploaded_file.name} is not a valid JSON.")
+                        return
+                    if not isinstance(data, dict) or "Scenarios" not in data:
+                        st.error(f"The file {uploaded_file.name} does not contain 'Scenarios' key.")
+                        return
+                    file_entries, unknown = kb_entries_from_assessment(data, project)
+                    if unknown:
+                        st.error(f"The file {uploaded_file.name} contains unknown levels, stored as unrated: {', '.join(unknown)}.")
+                    entries.extend(file_entries)
+                if not entries:
+                    st.error("The uploaded files contain no scenarios.")
+                    return
+                stored = add_to_rating_kb(entries, project)
+                st.success(f"{len(entries)} rated scenarios added; the knowledge base holds {stored} scenarios.")
+    with col2:
+        if st.button("Add Current Project", key="rating_kb_add_current"):
+            if not project:
+                st.error("Please enter the project name first.")
+            else:
+                # The impact assessment holds the likelihood ratings as well
+                data = _load_project_assessment("final_impact_assessment.json") or _load_project_assessment("final_likelihood_assessment.json")
+                if data is None:
+                    st.error("Complete the Likelihood Assessment first.")
+                else:
+                    entries, unknown = kb_entries_from_assessment(data, project)
+                    if unknown:
+                        st.error(f"The current assessment contains unknown levels, stored as unrated: {', '.join(unknown)}.")
+                    if not entries:
+                        st.error("The current assessment contains no scenarios.")
+                    else:
+                        stored = add_to_rating_kb(entries, project)
+                        st.success(f"{len(entries)} rated scenarios added; the knowledge base holds {stored} scenarios.")
+
+
+def benchmark_rating_kb(size=100000, queries=100, seed=0):
+    """
+    Builds a synthetic knowledge base of size scenarios in a temporary directory, memory-maps it and
+    times the nearest-neighbor lookup of new scenarios.
+    """
+    from scenario_similarity import generate_benchmark_texts
+
+    rng = np.random.default_rng(seed)
+    texts = generate_benchmark_texts(size + queries, seed=seed)
+    scenarios = [{"vector": "", "scenario_desc": text} for text in texts]
+    factors = LIKELIHOOD_FACTORS + IMPACT_FACTORS
+    all_levels = dict(levels, **impact_levels)
+    codes = np.stack([rng.integers(0, len(all_levels[factor]), size) for factor in factors], axis=1).astype(np.int8)
+
+    start = time.perf_counter()
+    vectors, idf = kb_vectors(texts[:size])
+    timings = {"scenarios": size, "build": time.perf_counter() - start}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "vectors.npy")
+        np.save(path, vectors)
+        kb = {
+            "idf": idf, "dimensions": KB_DIMENSIONS, "codes": codes,
+            "vectors": np.load(path, mmap_mode="r"),
+            "rated": {kind: np.ones(size, dtype=bool) for kind in KB_COLUMNS},
+        }
+        durations = []
+        for scenario in scenarios[size:]:
+            start = time.perf_counter()
+            rows, similarities = search_rating_kb(kb, scenario, "likelihood")
+            suggest_ratings(kb, rows, similarities, "likelihood")
+            durations.append(time.perf_counter() - start)
+        del kb
+    timings["lookup_median"] = float(np.median(durations))
+    timings["lookup_p95"] = float(np.percentile(durations, 95))
+    return timings
+
+
+if __name__ == "__main__":
+    timings = benchmark_rating_kb()
+    print(f"{timings['scenarios']} scenarios indexed in {timings['build'] * 1000:.0f} ms, lookup median "
+          f"{timings['lookup_median'] * 1000:.2f} ms, p95 {timings['lookup_p95'] * 1000:.2f} ms")
@@ -0,0 +1,72 @@
+# rating_store.py
+
+import numpy as np
+from util import levels, comments, values, impact_levels
+
+# Code used for a factor that has not been rated yet
+UNRATED = -1
+
+LIKELIHOOD_FACTORS = list(levels)
+IMPACT_FACTORS = list(impact_levels)
+
+# Level <-> code tables derived once from util; a code is the index of the level in its factor's list
+LIKELIHOOD_CODES = {factor: {level: code for code, level in enumerate(levels[factor])} for factor in LIKELIHOOD_FACTORS}
+IMPACT_CODES = {factor: {level: code for code, level in enumerate(impact_levels[factor])} for factor in IMPACT_FACTORS}
+
+
+# Function to create a store of level codes with one row per scenario key and one column per factor
+def create_rating_store(keys, factors, default_code=UNRATED):
+    keys = list(keys)
+    return {
+        "keys": keys,
+        "index": {key: row for row, key in enumerate(keys)},
+        "factors": list(factors),
+        "codes": np.full((len(keys), len(factors)), default_code, dtype=np.int8),
+    }
+
+
+def get_codes(store, key):
+    return store["codes"][store["index"][key]]
+
+
+def set_code(store, key, factor, code):
+    store["codes"][store["index"][key], store["factors"].index(factor)] = code
+
+
+def set_codes(store, key, codes):
+    store["codes"][store["index"][key]] = codes
+
+
+# Function to convert the Likelihood entries of a scenario into level codes
+def likelihood_codes(entries):
+    by_factor = {entry["Factor"]: entry["Level"] for entry in entries}
+    return [LIKELIHOOD_CODES[factor][by_factor[factor]] if factor in by_factor else UNRATED for factor in LIKELIHOOD_FACTORS]
+
+
+# Function to convert the Impact entries of a scenario into level codes
+def impact_codes(entries):
+    by_factor = {entry["Factor"]: entry["Level"] for entry in entries}
+    return [IMPACT_CODES[factor][by_factor[factor]] if factor in by_factor else UNRATED for factor in IMPACT_FACTORS]
+
+
+# Function to expand likelihood level codes into the Likelihood entries stored in the assessment files
+def likelihood_entries(codes):
+    return [
+        {
+            "Factor": factor,
+            "Level": levels[factor][code],
+            "Value": values[factor][code],
+            "Comment": comments[factor][code],
+        }
+        for factor, code in zip(LIKELIHOOD_FACTORS, (int(c) for c in codes))
+        if code != UNRATED
+    ]
+
+
+# Function to expand impact level codes into the Impact entries stored in the assessment files
+def impact_entries(codes):
+    return [
+        {"Factor": factor, "Level": impact_levels[factor][code], "Severity": code}
+        for factor, code in zip(IMPACT_FACTORS, (int(c) for c in codes))
+        if code != UNRATED
+    ]
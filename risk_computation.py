@@ -3,14 +3,27 @@ import os
 import json
 import numpy as np
 import pandas as pd
-import time
+from risk_model import load_risk_model, score_scenarios
+from attack_paths import path_key
+from risk_rollup import get_risk_rollup, rollup_score
+
+# Number of pending row updates tolerated before they are compacted into risk_assessment.json
+MIN_UPDATES_BEFORE_COMPACTION = 50
+
+_impact_assessment_cache = {}
+
 # Function to load the final impact assessment
 def load_impact_assessment():
     base_path = os.getcwd()
     file_path = os.path.join(base_path, ".files\\final_impact_assessment.json")
     if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            return json.load(f)
+        # Only re-parse the file when it has been rewritten since the last load
+        mtime = os.path.getmtime(file_path)
+        if _impact_assessment_cache.get("mtime") != mtime:
+            with open(file_path, "r") as f:
+                _impact_assessment_cache["data"] = json.load(f)
+            _impact_assessment_cache["mtime"] = mtime
+        return _impact_assessment_cache["data"]
     return None
 
 def calculate_attack_potential(risk_level):
@@ -24,16 +37,16 @@ def calculate_attack_potential(risk_level):
         return "Enhanced-Basic"
     else:
         return "Basic"
-    
+
 def calculate_average_likelihood(likelihood_factors):
     values = [factor['Value'] for factor in likelihood_factors]
     # Check for exceptions
     elapsed_time_value = likelihood_factors[0]['Value']
     window_of_opportunity_value = likelihood_factors[3]['Value']
-    
+
     if elapsed_time_value == -1 or window_of_opportunity_value == -1:
         return "Not Applicable"
-    
+
     average_likelihood = np.mean(values)
     return average_likelihood
 
@@ -42,6 +55,80 @@ def calculate_average_impact(impact_factors):
     average_impact = np.mean(severities)
     return average_impact
 
+# Function to build the key identifying a scenario across assessment files
+def get_scenario_key(scenario):
+    return f"{scenario['asset']} - {scenario['threat']} - {scenario['vector']} - {scenario['scenario_id']}"
+
+# Function to summarize the likelihood and impact ratings of a scenario, used to detect changes
+def get_rating_fingerprint(scenario):
+    likelihood = "|".join(factor["Level"] for factor in scenario["Likelihood"])
+    impact = "|".join(factor["Level"] for factor in scenario["Impact"])
+    return f"{likelihood}||{impact}"
+
+def get_risk_assessment_paths():
+    base_path = os.getcwd()
+    return (
+        os.path.join(base_path, ".files\\risk_assessment.json"),
+        os.path.join(base_path, ".files\\risk_assessment_updates.jsonl"),
+    )
+
+# Function to load the persisted risk rows, applying the row updates appended since the last compaction
+def load_risk_state():
+    snapshot_path, updates_path = get_risk_assessment_paths()
+    state = {"rows": {}, "fingerprints": {}, "model": None, "pending_updates": 0}
+
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, "r") as f:
+            snapshot = json.load(f)
+        fingerprints = snapshot.get("Fingerprints", {})
+        for scenario in snapshot["Scenarios"]:
+            key = get_scenario_key(scenario)
+            state["rows"][key] = scenario
+            if key in fingerprints:
+                state["fingerprints"][key] = fingerprints[key]
+        state["model"] = snapshot.get("Model")
+
+    if os.path.exists(updates_path):
+        with open(updates_path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                update = json.loads(line)
+                if update.get("removed"):
+                    state["rows"].pop(update["key"], None)
+                    state["fingerprints"].pop(update["key"], None)
+                else:
+                    state["rows"][update["key"]] = update["row"]
+                    state["fingerprints"][update["key"]] = update["fingerprint"]
+                state["pending_updates"] += 1
+
+    return state
+
+# Function to rewrite risk_assessment.json from the current rows and drop the pending updates
+def compact_risk_state(state):
+    snapshot_path, updates_path = get_risk_assessment_paths()
+    snapshot = {
+        "Scenarios": list(state["rows"].values()),
+        "Fingerprints": state["fingerprints"],
+        "Model": state["model"],
+    }
+    with open(snapshot_path + ".tmp", "w") as f:
+        json.dump(snapshot, f, indent=4)
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+    if os.path.exists(updates_path):
+        os.remove(updates_path)
+    state["pending_updates"] = 0
+
+# Function to append the changed and removed rows to the updates file
+def persist_risk_updates(state, changed_keys, removed_keys):
+    _, updates_path = get_risk_assessment_paths()
+    with open(updates_path, "a") as f:
+        for key in changed_keys:
+            f.write(json.dumps({"key": key, "fingerprint": state["fingerprints"][key], "row": state["rows"][key]}) + "\n")
+        for key in removed_keys:
+            f.write(json.dumps({"key": key, "removed": True}) + "\n")
+    state["pending_updates"] += len(changed_keys) + len(removed_keys)
+
 def risk_evaluation():
     st.subheader("Risk Evaluation")
     # Load the final impact assessment data
@@ -51,69 +138,120 @@ def risk_evaluation():
         st.error("No final impact assessment file found. Please complete the Impact Assessment first.")
         return
 
-    scenarios = impact_data["Scenarios"]
-    
-    # Evaluate risk for each scenario
-    for scenario in scenarios:
-        likelihood_factors = scenario["Likelihood"]
-        impact_factors = scenario["Impact"]
+    try:
+        risk_model = load_risk_model()
+    except ValueError as e:
+        st.error(f"Invalid risk model definition: {e}")
+        return
+
+    if "risk_state" not in st.session_state:
+        st.session_state.risk_state = load_risk_state()
+    state = st.session_state.risk_state
+
+    # A different risk model invalidates every previously computed row
+    model_changed = state["model"] != risk_model["signature"]
+    if model_changed:
+        state["fingerprints"] = {}
+        state["model"] = risk_model["signature"]
+
+    # Find the scenarios whose ratings changed since the last evaluation
+    scenarios = {get_scenario_key(scenario): scenario for scenario in impact_data["Scenarios"]}
+    current_fingerprints = {key: get_rating_fingerprint(scenario) for key, scenario in scenarios.items()}
+    changed_keys = [key for key, fingerprint in current_fingerprints.items() if state["fingerprints"].get(key) != fingerprint]
+    removed_keys = [key for key in state["rows"] if key not in scenarios]
 
-        avg_likelihood = calculate_average_likelihood(likelihood_factors)
+    # Evaluate risk only for the changed scenarios by indexing the risk model lookup tables
+    changed_scenarios = [scenarios[key] for key in changed_keys]
+    for key, scenario, scores in zip(changed_keys, changed_scenarios, score_scenarios(risk_model, changed_scenarios)):
+        row = dict(scenario)
+        row.update(scores)
+        state["rows"][key] = row
+        state["fingerprints"][key] = current_fingerprints[key]
+    for key in removed_keys:
+        state["rows"].pop(key, None)
+        state["fingerprints"].pop(key, None)
 
-        if avg_likelihood == "Not Applicable":
-            risk_level = "Not Applicable"
+    # Save the risk assessment results, appending only the changed rows unless a compaction is due
+    if changed_keys or removed_keys:
+        pending = state["pending_updates"] + len(changed_keys) + len(removed_keys)
+        if model_changed or pending > max(MIN_UPDATES_BEFORE_COMPACTION, len(state["rows"]) // 4):
+            compact_risk_state(state)
         else:
-            avg_impact = calculate_average_impact(impact_factors)
-            risk_level = avg_likelihood * avg_impact
-
-        scenario["Risk Level"] = risk_level
-    
-    # Save the risk assessment results
-    risk_assessment_path = os.path.join(os.getcwd(), ".files\\risk_assessment.json")
-    with open(risk_assessment_path, "w") as f:
-        json.dump({"Scenarios": scenarios}, f, indent=4)
-    
-    st.success(f"Risk Assessment successfully completed.")
+            persist_risk_updates(state, changed_keys, removed_keys)
+
+    st.session_state.risk_changed_keys = changed_keys
+    st.session_state.risk_removed_keys = removed_keys
+    st.success(
+        f"Risk Assessment successfully completed ({len(changed_keys)} scenario(s) recomputed, "
+        f"{len(removed_keys)} removed)."
+    )
+
+# Function to return the risk rows of the current session, loading them from disk on first use
+def get_risk_rows():
+    if "risk_state" not in st.session_state:
+        st.session_state.risk_state = load_risk_state()
+    return list(st.session_state.risk_state["rows"].values())
 
 def load_risk_assessment():
-    base_path = os.getcwd()
-    file_path = os.path.join(base_path, ".files\\risk_assessment.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            return json.load(f)
-    return None
+    state = load_risk_state()
+    if not state["rows"]:
+        return None
+    return {"Scenarios": list(state["rows"].values())}
+
+# Function to build the prioritized table row for a risk assessment row
+def get_prioritized_risk_row(scenario):
+    risk_level = scenario["Risk Level"]
+    if risk_level == "Not Applicable":
+        risk_level = 0  # Treat "Not Applicable" as zero risk
+
+    return {
+        "Asset": scenario["asset"],
+        "Threat": scenario["threat"],
+        "Attack Vector": scenario["vector"],
+        "Scenario ID": scenario["scenario_id"],
+        "Attack Potential": scenario.get("Attack Potential", calculate_attack_potential(risk_level)),
+        "Attack Feasibility": scenario.get("Attack Feasibility", ""),
+        "Impact": scenario.get("Impact Rating", ""),
+        "Risk Level": risk_level
+    }
 
 def display_prioritized_risks():
     st.subheader("Prioritized Risk Levels")
-    risk_data = load_risk_assessment()
-    
-    time.sleep (1)
-    if risk_data is None:
+    if "risk_state" not in st.session_state:
+        st.session_state.risk_state = load_risk_state()
+    rows = st.session_state.risk_state["rows"]
+
+    if not rows:
         st.error("No risk assessment data found. Please perform the Risk Evaluation first.")
         return
 
-    scenarios = risk_data["Scenarios"]
-    
-    # Prepare data for display
-    risk_values = []
-    for scenario in scenarios:
-        risk_level = scenario["Risk Level"]
-        if risk_level == "Not Applicable":
-            risk_level = 0  # Treat "Not Applicable" as zero risk
-    
-        attack_potential = calculate_attack_potential(risk_level)
-
-        risk_values.append({
-            "Asset": scenario["asset"],
-            "Threat": scenario["threat"],
-            "Attack Vector": scenario["vector"],
-            "Scenario ID": scenario["scenario_id"],
-            "Risk Level": risk_level,
-            "Attack Potential": attack_potential
-        })
-
-    # Convert to DataFrame and sort by Risk Level
-    df = pd.DataFrame(risk_values)
-    df = df.sort_values(by="Risk Level", ascending=False)
+    # Update the prioritized table in place for the rows changed by the last evaluation
+    df = st.session_state.get("risk_table")
+    if df is None:
+        df = pd.DataFrame.from_dict({key: get_prioritized_risk_row(row) for key, row in rows.items()}, orient="index")
+    else:
+        removed_keys = [key for key in st.session_state.get("risk_removed_keys", []) if key in df.index]
+        df = df.drop(index=removed_keys)
+        for key in st.session_state.get("risk_changed_keys", []):
+            df.loc[key] = pd.Series(get_prioritized_risk_row(rows[key]))
+    st.session_state.risk_table = df
+    st.session_state.risk_changed_keys = []
+    st.session_state.risk_removed_keys = []
+
+    # Add the risk rolled up to the vector, threat and asset of every scenario, which break ties between
+    # scenarios of the same risk level
+    rollup = get_risk_rollup(list(rows.values()), "risk", st.session_state.get("risk_rollup_operator", "max"))
+    sort_columns = ["Risk Level"]
+    if rollup is not None and not df.empty:
+        df = df.copy()
+        ancestors = {
+            "Vector Risk": ("vector", lambda row: path_key(row["Asset"], row["Threat"], row["Attack Vector"])),
+            "Threat Risk": ("threat", lambda row: path_key(row["Asset"], row["Threat"])),
+            "Asset Risk": ("asset", lambda row: path_key(row["Asset"])),
+        }
+        for column, (level, key) in ancestors.items():
+            df[column] = [rollup_score(rollup, level, key(row)) for row in df.to_dict("records")]
+        sort_columns += list(ancestors)
+
     # Display the sorted DataFrame
-    st.dataframe(df)    
+    st.dataframe(df.sort_values(by=sort_columns, ascending=False, kind="stable"), hide_index=True)
@@ -0,0 +1,285 @@
+# risk_model.py
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from util import levels, values, impact_levels
+from rating_store import LIKELIHOOD_CODES, IMPACT_CODES
+
+# Default ISO/SAE 21434 risk model. Organizations can override any of the keys
+# below by placing a risk_model.json file next to the other assessment files.
+DEFAULT_RISK_MODEL = {
+    # Attack potential rating by minimum sum of the likelihood factor values,
+    # together with the attack feasibility it maps to (ISO/SAE 21434 Annex G:
+    # 0-13 High, 14-19 Medium, 20-24 Low, 25 and above Very Low).
+    "attack_potential": [
+        {"min": 0, "name": "Basic", "feasibility": "High"},
+        {"min": 10, "name": "Enhanced-Basic", "feasibility": "High"},
+        {"min": 14, "name": "Moderate", "feasibility": "Medium"},
+        {"min": 20, "name": "High", "feasibility": "Low"},
+        {"min": 25, "name": "Beyond High", "feasibility": "Very Low"},
+    ],
+    "feasibility_ratings": ["Very Low", "Low", "Medium", "High"],
+    # How the four impact severities are combined: "max" or "weighted"
+    "impact_aggregation": {
+        "method": "max",
+        "weights": {"Safety": 1, "Privacy": 1, "Financial": 1, "Operational": 1},
+    },
+    "impact_ratings": ["Negligible", "Moderate", "Major", "Severe"],
+    # Impact rating index for each aggregated severity level (0-4)
+    "severity_to_impact": [0, 1, 2, 3, 3],
+    # Risk values, one row per impact rating and one column per feasibility rating
+    "risk_matrix": [
+        [1, 1, 1, 1],
+        [1, 2, 2, 3],
+        [1, 2, 3, 4],
+        [2, 3, 4, 5],
+    ],
+}
+
+NOT_APPLICABLE = "Not Applicable"
+
+
+# Function to check a risk model definition and raise ValueError on the first problem found
+def validate_risk_model(definition):
+    for key in DEFAULT_RISK_MODEL:
+        if key not in definition:
+            raise ValueError(f"Risk model is missing the '{key}' key.")
+
+    feasibility_ratings = definition["feasibility_ratings"]
+    if not feasibility_ratings or len(set(feasibility_ratings)) != len(feasibility_ratings):
+        raise ValueError("'feasibility_ratings' must be a non-empty list of unique names.")
+
+    attack_potential = definition["attack_potential"]
+    if not attack_potential:
+        raise ValueError("'attack_potential' must contain at least one rating.")
+    minimums = [row.get("min") for row in attack_potential]
+    if minimums[0] != 0:
+        raise ValueError("The first 'attack_potential' rating must start at 0.")
+    if any(not isinstance(m, int) for m in minimums) or any(b <= a for a, b in zip(minimums, minimums[1:])):
+        raise ValueError("'attack_potential' minimums must be strictly increasing integers.")
+    for row in attack_potential:
+        if not row.get("name"):
+            raise ValueError("Every 'attack_potential' rating needs a name.")
+        if row.get("feasibility") not in feasibility_ratings:
+            raise ValueError(f"Unknown feasibility rating '{row.get('feasibility')}' for attack potential '{row['name']}'.")
+
+    aggregation = definition["impact_aggregation"]
+    if aggregation.get("method") not in ("max", "weighted"):
+        raise ValueError("'impact_aggregation.method' must be either 'max' or 'weighted'.")
+    if aggregation["method"] == "weighted":
+        weights = aggregation.get("weights", {})
+        unknown = set(weights) - set(impact_levels)
+        if unknown:
+            raise ValueError(f"Unknown impact factors in weights: {', '.join(sorted(unknown))}.")
+        if any(weights.get(factor, 0) < 0 for factor in impact_levels):
+            raise ValueError("Impact weights must not be negative.")
+        if sum(weights.get(factor, 0) for factor in impact_levels) <= 0:
+            raise ValueError("At least one impact weight must be positive.")
+
+    impact_ratings = definition["impact_ratings"]
+    if not impact_ratings or len(set(impact_ratings)) != len(impact_ratings):
+        raise ValueError("'impact_ratings' must be a non-empty list of unique names.")
+    severity_count = max(len(options) for options in impact_levels.values())
+    severity_to_impact = definition["severity_to_impact"]
+    if len(severity_to_impact) != severity_count:
+        raise ValueError(f"'severity_to_impact' must have one entry per severity level ({severity_count}).")
+    if any(not 0 <= idx < len(impact_ratings) for idx in severity_to_impact):
+        raise ValueError("'severity_to_impact' entries must be valid impact rating indices.")
+
+    matrix = definition["risk_matrix"]
+    if len(matrix) != len(impact_ratings) or any(len(row) != len(feasibility_ratings) for row in matrix):
+        raise ValueError(
+            f"'risk_matrix' must have {len(impact_ratings)} rows (impact ratings) "
+            f"and {len(feasibility_ratings)} columns (feasibility ratings)."
+        )
+    if any(not isinstance(value, int) or value < 0 for row in matrix for value in row):
+        raise ValueError("'risk_matrix' values must be non-negative integers.")
+
+
+# Function to precompute the lookup tables used for scoring
+def compile_risk_model(definition):
+    validate_risk_model(definition)
+
+    likelihood_factors = list(levels)
+    impact_factors = list(impact_levels)
+
+    # Sum of factor values for every combination of likelihood levels (-1 if not applicable)
+    shape = tuple(len(levels[factor]) for factor in likelihood_factors)
+    sum_table = np.zeros(shape, dtype=np.int16)
+    not_applicable = np.zeros(shape, dtype=bool)
+    for axis, factor in enumerate(likelihood_factors):
+        factor_values = np.array(values[factor], dtype=np.int16)
+        broadcast = [1] * len(shape)
+        broadcast[axis] = len(factor_values)
+        factor_values = factor_values.reshape(broadcast)
+        sum_table = sum_table + np.where(factor_values < 0, 0, factor_values)
+        not_applicable = not_applicable | (factor_values < 0)
+
+    minimums = np.array([row["min"] for row in definition["attack_potential"]])
+    potential_table = (np.searchsorted(minimums, sum_table, side="right") - 1).astype(np.int8)
+    potential_to_feasibility = np.array(
+        [definition["feasibility_ratings"].index(row["feasibility"]) for row in definition["attack_potential"]],
+        dtype=np.int8,
+    )
+    feasibility_table = potential_to_feasibility[potential_table]
+    sum_table = np.where(not_applicable, -1, sum_table).astype(np.int16)
+    potential_table = np.where(not_applicable, -1, potential_table).astype(np.int8)
+    feasibility_table = np.where(not_applicable, -1, feasibility_table).astype(np.int8)
+
+    # Impact rating for every combination of impact severities
+    impact_shape = tuple(len(impact_levels[factor]) for factor in impact_factors)
+    severities = np.indices(impact_shape)
+    aggregation = definition["impact_aggregation"]
+    if aggregation["method"] == "max":
+        aggregated = severities.max(axis=0)
+    else:
+        weights = np.array([aggregation["weights"].get(factor, 0) for factor in impact_factors], dtype=float)
+        weighted = np.tensordot(weights, severities, axes=1) / weights.sum()
+        aggregated = np.floor(weighted + 0.5).astype(int)
+    impact_table = np.array(definition["severity_to_impact"], dtype=np.int8)[aggregated]
+
+    return {
+        "definition": definition,
+        "signature": hashlib.sha1(json.dumps(definition, sort_keys=True).encode("utf-8")).hexdigest(),
+        "likelihood_factors": likelihood_factors,
+        "impact_factors": impact_factors,
+        "likelihood_codes": LIKELIHOOD_CODES,
+        "impact_codes": IMPACT_CODES,
+        "sum_table": sum_table,
+        "potential_table": potential_table,
+        "feasibility_table": feasibility_table,
+        "impact_table": impact_table,
+        "risk_matrix": np.array(definition["risk_matrix"], dtype=np.int16),
+        "potential_names": [row["name"] for row in definition["attack_potential"]],
+        "feasibility_names": list(definition["feasibility_ratings"]),
+        "impact_names": list(definition["impact_ratings"]),
+    }
+
+
+_compiled_models = {}
+
+# Function to load the risk model, using the organization's risk_model.json when present
+def load_risk_model(file_path=None):
+    if file_path is None:
+        file_path = os.path.join(os.getcwd(), ".files\\risk_model.json")
+
+    mtime = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+    cache_key = (file_path, mtime)
+    if cache_key not in _compiled_models:
+        definition = dict(DEFAULT_RISK_MODEL)
+        if mtime is not None:
+            with open(file_path, "r") as f:
+                definition.update(json.load(f))
+        _compiled_models.clear()
+        _compiled_models[cache_key] = compile_risk_model(definition)
+    return _compiled_models[cache_key]
+
+
+# Function to score arrays of level codes (one row per scenario) by table indexing
+def score_codes(model, likelihood_codes, impact_codes):
+    likelihood_index = tuple(np.asarray(likelihood_codes).T)
+    impact_index = tuple(np.asarray(impact_codes).T)
+
+    feasibility = model["feasibility_table"][likelihood_index]
+    impact = model["impact_table"][impact_index]
+    risk = model["risk_matrix"][impact, np.maximum(feasibility, 0)]
+    risk = np.where(feasibility < 0, -1, risk)
+
+    return {
+        "attack_potential_value": model["sum_table"][likelihood_index],
+        "attack_potential": model["potential_table"][likelihood_index],
+        "feasibility": feasibility,
+        "impact": impact,
+        "risk": risk,
+    }
+
+
+# Function to convert the Likelihood and Impact lists of a scenario into level codes
+def scenario_codes(model, scenario):
+    likelihood = {factor["Factor"]: factor["Level"] for factor in scenario["Likelihood"]}
+    impact = {factor["Factor"]: factor["Level"] for factor in scenario["Impact"]}
+    likelihood_codes = [model["likelihood_codes"][factor][likelihood[factor]] for factor in model["likelihood_factors"]]
+    impact_codes = [model["impact_codes"][factor][impact[factor]] for factor in model["impact_factors"]]
+    return likelihood_codes, impact_codes
+
+
+# Function to score a list of assessed scenarios, returning one result dictionary per scenario
+def score_scenarios(model, scenarios):
+    if not scenarios:
+        return []
+
+    codes = [scenario_codes(model, scenario) for scenario in scenarios]
+    scores = score_codes(model, [c[0] for c in codes], [c[1] for c in codes])
+
+    results = []
+    for i in range(len(scenarios)):
+        if scores["feasibility"][i] < 0:
+            results.append({
+                "Attack Potential": NOT_APPLICABLE,
+                "Attack Potential Value": NOT_APPLICABLE,
+                "Attack Feasibility": NOT_APPLICABLE,
+                "Impact Rating": model["impact_names"][scores["impact"][i]],
+                "Risk Level": NOT_APPLICABLE,
+            })
+        else:
+            results.append({
+                "Attack Potential": model["potential_names"][scores["attack_potential"][i]],
+                "Attack Potential Value": int(scores["attack_potential_value"][i]),
+                "Attack Feasibility": model["feasibility_names"][scores["feasibility"][i]],
+                "Impact Rating": model["impact_names"][scores["impact"][i]],
+                "Risk Level": int(scores["risk"][i]),
+            })
+    return results
+
+
+# Function to compare the table-based scoring against the previous mean(likelihood) x mean(impact) formula
+def benchmark_risk_model(n_scenarios=20000, seed=0):
+    from risk_computation import calculate_average_likelihood, calculate_average_impact, calculate_attack_potential
+
+    model = load_risk_model()
+    rng = np.random.default_rng(seed)
+    likelihood_codes = np.stack([rng.integers(0, len(levels[f]), n_scenarios) for f in model["likelihood_factors"]], axis=1)
+    impact_codes = np.stack([rng.integers(0, len(impact_levels[f]), n_scenarios) for f in model["impact_factors"]], axis=1)
+
+    scenarios = []
+    for l_row, i_row in zip(likelihood_codes, impact_codes):
+        scenarios.append({
+            "Likelihood": [
+                {"Factor": f, "Level": levels[f][c], "Value": values[f][c]}
+                for f, c in zip(model["likelihood_factors"], l_row)
+            ],
+            "Impact": [
+                {"Factor": f, "Level": impact_levels[f][c], "Severity": int(c)}
+                for f, c in zip(model["impact_factors"], i_row)
+            ],
+        })
+
+    start = time.perf_counter()
+    for scenario in scenarios:
+        avg_likelihood = calculate_average_likelihood(scenario["Likelihood"])
+        if avg_likelihood != "Not Applicable":
+            calculate_attack_potential(avg_likelihood * calculate_average_impact(scenario["Impact"]))
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    score_scenarios(model, scenarios)
+    table_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    score_codes(model, likelihood_codes, impact_codes)
+    codes_time = time.perf_counter() - start
+
+    return {
+        "scenarios": n_scenarios,
+        "legacy_formula_s": legacy_time,
+        "table_scenarios_s": table_time,
+        "table_codes_s": codes_time,
+    }
+
+
+if __name__ == "__main__":
+    for name, value in benchmark_risk_model().items():
+        print(f"{name}: {value}")
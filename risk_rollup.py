@@ -0,0 +1,283 @@
+# risk_rollup.py
+
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from risk_model import load_risk_model
+from attack_paths import PATH_LEVELS, PATH_METRICS, score_risk_rows, build_path_index, generate_benchmark_model, load_unified_assets
+
+# Operators combining the scores of the children of an asset, threat or attack vector
+ROLLUP_OPERATORS = {
+    "max": "Maximum",
+    "noisy_or": "Noisy-OR",
+    "weighted": "Weighted average",
+}
+
+# Levels the scenario scores are rolled up to, and their column names
+ROLLUP_LEVELS = {"asset": "Asset", "threat": "Threat", "vector": "Attack Vector"}
+
+
+# Function to return the lowest and highest scores of a metric, used to bring scores into [0, 1]; the lowest
+# rating maps to 0, so that it adds nothing to a noisy-OR
+def metric_range(metric, model=None):
+    model = model or load_risk_model()
+    if metric == "risk":
+        return float(model["risk_matrix"].min()), float(model["risk_matrix"].max())
+    return 1.0, float(len(model["feasibility_names"] if metric == "feasibility" else model["impact_names"]))
+
+
+def aggregate_children(child_values, child_weights, child_ptr, parents, operator):
+    """
+    Combines the values of the children of the given parents, ignoring unrated (NaN) children. Returns
+    one value per parent, NaN when no child is rated.
+
+    Parameters:
+    child_values, child_weights (np.ndarray): Value in [0, 1] and weight of every child.
+    child_ptr (np.ndarray): CSR pointers from the parents to their children.
+    parents (np.ndarray): Indices of the parents to compute.
+    operator (str): "max", "noisy_or" (1 - prod(1 - p), children as independent attack paths) or
+        "weighted" (weighted average).
+    """
+    starts, lengths = child_ptr[parents], child_ptr[parents + 1] - child_ptr[parents]
+    offsets = np.cumsum(lengths) - lengths
+    children = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    segment = np.repeat(np.arange(len(parents)), lengths)
+    values = child_values[children]
+    rated = ~np.isnan(values)
+    counts = np.bincount(segment[rated], minlength=len(parents))
+
+    if operator == "max":
+        result = np.full(len(parents), -np.inf)
+        filled = np.where(rated, values, -np.inf)
+        has_children = lengths > 0
+        if has_children.any():
+            result[has_children] = np.maximum.reduceat(filled, offsets[has_children])
+    elif operator == "noisy_or":
+        with np.errstate(divide="ignore"):
+            log_miss = np.where(rated, np.log1p(-np.clip(np.nan_to_num(values), 0.0, 1.0)), 0.0)
+        result = 1.0 - np.exp(np.bincount(segment, weights=log_miss, minlength=len(parents)))
+    elif operator == "weighted":
+        weights = np.where(rated, child_weights[children], 0.0)
+        totals = np.bincount(segment, weights=weights, minlength=len(parents))
+        sums = np.bincount(segment, weights=weights * np.nan_to_num(values), minlength=len(parents))
+        result = sums / np.where(totals > 0, totals, 1.0)
+        counts = np.where(totals > 0, counts, 0)
+    else:
+        raise ValueError(f"Unknown roll-up operator '{operator}'.")
+    return np.where(counts > 0, result, np.nan)
+
+
+def build_risk_rollup(assets, scenario_scores, operator="max", weights=None, scale=1.0, offset=0.0):
+    """
+    Propagates scenario scores up the asset -> threat -> vector -> scenario tree of the unified attack
+    model and returns the roll-up: the normalized value of every node per level, with the tree arrays
+    needed to update it incrementally (see update_risk_rollup).
+
+    Parameters:
+    assets (list): Asset dictionaries of the unified attack model.
+    scenario_scores (dict): Score per scenario key (see score_risk_rows).
+    operator (str): Roll-up operator, one of ROLLUP_OPERATORS.
+    weights (dict): Weight per threat, vector or scenario key (path_key of its names) for the weighted
+        operator, 1 by default.
+    scale, offset (float): Range and lowest score; scores are normalized to (score - offset) / scale,
+        in [0, 1] with the lowest score at 0.
+    """
+    weights = weights or {}
+    index = build_path_index(assets, {})
+    rollup = {
+        "operator": operator,
+        "scale": scale,
+        "offset": offset,
+        "keys": index["keys"],
+        "names": index["names"],
+        "child_ptr": index["child_ptr"],
+        "position": {level: {key: i for i, key in enumerate(index["keys"][level])} for level in PATH_LEVELS},
+        "parent": {
+            child_level: np.repeat(np.arange(len(index["child_ptr"][level]) - 1), np.diff(index["child_ptr"][level]))
+            for level, child_level in zip(PATH_LEVELS, PATH_LEVELS[1:])
+        },
+        "weights": {
+            level: np.array([float(weights.get(key, 1.0)) for key in index["keys"][level]])
+            for level in PATH_LEVELS
+        },
+        "scores": dict(scenario_scores),
+    }
+    rollup["values"] = {"scenario": np.array(
+        [(scenario_scores.get(key, np.nan) - offset) / scale for key in index["keys"]["scenario"]], dtype=np.float64
+    )}
+    for level, child_level in zip(PATH_LEVELS[-2::-1], PATH_LEVELS[:0:-1]):
+        parents = np.arange(len(rollup["keys"][level]))
+        rollup["values"][level] = aggregate_children(
+            rollup["values"][child_level], rollup["weights"][child_level], rollup["child_ptr"][level], parents, operator
+        )
+    return rollup
+
+
+def update_risk_rollup(rollup, changed_scores):
+    """
+    Applies changed scenario scores to a roll-up, recomputing only the ancestors of the changed
+    scenarios. Returns the number of nodes recomputed.
+
+    Parameters:
+    rollup (dict): Roll-up from build_risk_rollup, updated in place.
+    changed_scores (dict): New score per scenario key, None for scenarios that are no longer rated.
+    """
+    positions = []
+    for key, score in changed_scores.items():
+        if score is None:
+            rollup["scores"].pop(key, None)
+        else:
+            rollup["scores"][key] = score
+        if key in rollup["position"]["scenario"]:
+            position = rollup["position"]["scenario"][key]
+            rollup["values"]["scenario"][position] = np.nan if score is None else (score - rollup["offset"]) / rollup["scale"]
+            positions.append(position)
+
+    dirty = np.array(positions, dtype=np.int64)
+    recomputed = 0
+    for level, child_level in zip(PATH_LEVELS[-2::-1], PATH_LEVELS[:0:-1]):
+        if not len(dirty):
+            break
+        dirty = np.unique(rollup["parent"][child_level][dirty])
+        rollup["values"][level][dirty] = aggregate_children(
+            rollup["values"][child_level], rollup["weights"][child_level], rollup["child_ptr"][level], dirty, rollup["operator"]
+        )
+        recomputed += len(dirty)
+    return recomputed
+
+
+# Function to bring a roll-up in line with the current scenario scores, updating only what changed
+def sync_risk_rollup(rollup, scenario_scores):
+    changed = {key: score for key, score in scenario_scores.items() if rollup["scores"].get(key) != score}
+    changed.update({key: None for key in rollup["scores"] if key not in scenario_scores})
+    return update_risk_rollup(rollup, changed) if changed else 0
+
+
+# Function to return the rolled-up score of an asset, threat or vector key, on the scale of the metric
+def rollup_score(rollup, level, key):
+    position = rollup["position"][level].get(key)
+    if position is None or np.isnan(rollup["values"][level][position]):
+        return None
+    return round(float(rollup["values"][level][position] * rollup["scale"] + rollup["offset"]), 2)
+
+
+# Function to list the normalized values of an asset's nodes, {path key: value in [0, 1]}, per asset name
+def rollup_node_values(rollup):
+    node_values = {name: {} for name in rollup["names"]["asset"]}
+    asset_of = {"asset": np.arange(len(rollup["keys"]["asset"]))}
+    for parent_level, level in zip(PATH_LEVELS, PATH_LEVELS[1:]):
+        asset_of[level] = asset_of[parent_level][rollup["parent"][level]]
+    for level in PATH_LEVELS:
+        for key, asset, value in zip(rollup["keys"][level], asset_of[level].tolist(), rollup["values"][level].tolist()):
+            if not np.isnan(value):
+                node_values[rollup["names"]["asset"][asset]][key] = round(value, 3)
+    return node_values
+
+
+# Function to build the table of rolled-up scores of one level, highest first
+def rollup_table(rollup, level, column):
+    depth = PATH_LEVELS.index(level)
+    names = {level: rollup["names"][level]}
+    positions = np.arange(len(rollup["keys"][level]))
+    for parent_level, child_level in zip(PATH_LEVELS[depth - 1::-1] if depth else [], PATH_LEVELS[depth:0:-1]):
+        positions = rollup["parent"][child_level][positions]
+        names[parent_level] = [rollup["names"][parent_level][i] for i in positions]
+    values = rollup["values"][level] * rollup["scale"] + rollup["offset"]
+    table = pd.DataFrame({ROLLUP_LEVELS[name_level]: names[name_level] for name_level in PATH_LEVELS[:depth + 1]})
+    table[column] = np.round(values, 2)
+    return table.dropna(subset=[column]).sort_values(column, ascending=False, kind="stable")
+
+
+# Function to load the optional roll-up weights (path key -> weight) of the weighted operator
+def load_rollup_weights(file_path=None):
+    if file_path is None:
+        file_path = os.path.join(os.getcwd(), ".files\\risk_rollup_weights.json")
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def get_risk_rollup(risk_rows, metric="risk", operator="max"):
+    """
+    Returns the roll-up of the session's risk rows over the unified attack model, or None when there is
+    no attack model. Roll-ups are kept in the session per metric and operator and, while the attack model
+    and weights are unchanged, only the ancestors of the scenarios whose score changed are recomputed.
+    """
+    unified_attack_model_path = os.path.join(os.getcwd(), ".files\\unified_attack_model.json")
+    if not os.path.exists(unified_attack_model_path):
+        return None
+    mtime = os.path.getmtime(unified_attack_model_path)
+    weights = load_rollup_weights() if operator == "weighted" else {}
+    model = load_risk_model()
+    scenario_scores = score_risk_rows(risk_rows, metric, model)
+
+    cached = st.session_state.setdefault("risk_rollups", {}).get((metric, operator))
+    if cached is not None and cached["mtime"] == mtime and cached["weights"] == weights:
+        sync_risk_rollup(cached["rollup"], scenario_scores)
+        return cached["rollup"]
+
+    assets = load_unified_assets(unified_attack_model_path, mtime)
+    lowest, highest = metric_range(metric, model)
+    rollup = build_risk_rollup(assets, scenario_scores, operator, weights, max(highest - lowest, 1.0), lowest)
+    st.session_state.risk_rollups[(metric, operator)] = {"mtime": mtime, "weights": weights, "rollup": rollup}
+    return rollup
+
+
+@st.fragment
+def display_risk_rollup(risk_rows):
+    st.subheader("Aggregated Risk")
+    st.markdown("Propagates the scenario ratings up to their attack vectors, threats and assets.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        operator = st.selectbox("Operator", list(ROLLUP_OPERATORS), format_func=ROLLUP_OPERATORS.get, key="risk_rollup_operator")
+    with col2:
+        metric = st.selectbox("Metric", list(PATH_METRICS), format_func=PATH_METRICS.get, key="risk_rollup_metric")
+    with col3:
+        level = st.radio("Level", list(ROLLUP_LEVELS), format_func=ROLLUP_LEVELS.get, horizontal=True, key="risk_rollup_level")
+
+    rollup = get_risk_rollup(risk_rows, metric, operator)
+    if rollup is None:
+        st.write("Generate the attack model first.")
+        return
+    table = rollup_table(rollup, level, f"Aggregated {PATH_METRICS[metric]}")
+    if table.empty:
+        st.write("No rated scenario matches the attack model.")
+        return
+    st.dataframe(table, hide_index=True)
+
+
+def benchmark_risk_rollup(n_changed=10, operator="noisy_or", seed=0, **kwargs):
+    """
+    Times building the roll-up of a synthetic attack model (10^5 scenarios by default) against updating
+    it after n_changed scenario scores change, and checks the update against a rebuild.
+    """
+    assets, scenario_scores, _ = generate_benchmark_model(**kwargs)
+    start = time.perf_counter()
+    rollup = build_risk_rollup(assets, scenario_scores, operator, scale=4.0, offset=1.0)
+    timings = {"scenarios": len(scenario_scores), "build": time.perf_counter() - start}
+
+    rng = np.random.default_rng(seed)
+    keys = list(scenario_scores)
+    changed = {keys[i]: float(rng.integers(1, 6)) for i in rng.choice(len(keys), n_changed, replace=False)}
+    start = time.perf_counter()
+    timings["recomputed_nodes"] = update_risk_rollup(rollup, changed)
+    timings["update"] = time.perf_counter() - start
+
+    rebuilt = build_risk_rollup(assets, dict(scenario_scores, **changed), operator, scale=4.0, offset=1.0)
+    for level in PATH_LEVELS:
+        if not np.allclose(rollup["values"][level], rebuilt["values"][level], equal_nan=True):
+            raise AssertionError(f"Incremental and rebuilt {level} values differ.")
+    return timings
+
+
+if __name__ == "__main__":
+    for operator in ROLLUP_OPERATORS:
+        timings = benchmark_risk_rollup(operator=operator)
+        print(f"{operator}: {timings['scenarios']} scenarios rolled up in {timings['build'] * 1000:.0f} ms, "
+              f"10 changed scenarios updated in {timings['update'] * 1000:.2f} ms "
+              f"({timings['recomputed_nodes']} nodes recomputed)")
@@ -0,0 +1,208 @@
+# risk_simulation.py
+
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from util import levels, impact_levels
+from risk_model import load_risk_model, scenario_codes, score_codes
+
+# Upper bound on the number of sampled ratings (scenarios x draws) held in memory at once
+MAX_CHUNK_ELEMENTS = 2_000_000
+
+
+# Function to build a symmetric rating distribution: the analyst's level with probability
+# 1 - spread_probability, otherwise shifted by up to max_shift levels in either direction
+def symmetric_distribution(spread_probability=0.3, max_shift=1):
+    if max_shift == 0 or spread_probability == 0:
+        return {0: 1.0}
+    distribution = {0: 1.0 - spread_probability}
+    for shift in range(1, max_shift + 1):
+        distribution[shift] = spread_probability / (2 * max_shift)
+        distribution[-shift] = spread_probability / (2 * max_shift)
+    return distribution
+
+
+# Function to return the per-factor distributions used when none are given
+def default_uncertainty(spread_probability=0.3, max_shift=1):
+    return {factor: symmetric_distribution(spread_probability, max_shift) for factor in list(levels) + list(impact_levels)}
+
+
+def _prepare_distributions(model, uncertainty):
+    prepared = []
+    for factor in model["likelihood_factors"] + model["impact_factors"]:
+        distribution = uncertainty.get(factor) or {0: 1.0}
+        shifts = np.array([int(shift) for shift in distribution], dtype=np.int8)
+        probabilities = np.array(list(distribution.values()), dtype=float)
+        if np.any(probabilities < 0) or probabilities.sum() <= 0:
+            raise ValueError(f"Invalid rating distribution for {factor}.")
+        prepared.append((shifts, np.cumsum(probabilities / probabilities.sum())))
+    return prepared
+
+
+def _sample_risk(model, codes, distributions, n_draws, rng, only_factor=None):
+    # codes: (chunk, 9) level codes; returns (chunk, n_draws) risk values with -1 mapped to 0
+    n_likelihood = len(model["likelihood_factors"])
+    upper = [len(levels[f]) - 1 for f in model["likelihood_factors"]] + [len(impact_levels[f]) - 1 for f in model["impact_factors"]]
+
+    sampled = []
+    for column, (shifts, cumulative) in enumerate(distributions):
+        base = codes[:, column:column + 1].astype(np.int8)
+        fixed = only_factor is not None and column != only_factor
+        if fixed or len(shifts) == 1:
+            shift = 0 if fixed else shifts[0]
+            sampled.append(np.broadcast_to(np.clip(base + shift, 0, upper[column]), (len(codes), n_draws)))
+            continue
+        picks = np.searchsorted(cumulative, rng.random((len(codes), n_draws)), side="right").clip(0, len(shifts) - 1)
+        sampled.append(np.clip(base + shifts[picks], 0, upper[column]))
+
+    feasibility = model["feasibility_table"][tuple(sampled[:n_likelihood])]
+    impact = model["impact_table"][tuple(sampled[n_likelihood:])]
+    risk = model["risk_matrix"][impact, np.maximum(feasibility, 0)]
+    return np.where(feasibility < 0, 0, risk).astype(np.int16)
+
+
+# Function to run the Monte Carlo simulation for an array of scenario level codes
+def simulate_codes(model, likelihood_codes, impact_codes, uncertainty=None, n_draws=2000, top_k=10,
+                   seed=0, max_chunk_elements=MAX_CHUNK_ELEMENTS):
+    """
+    Samples n_draws ratings per scenario from the per-factor distributions and summarizes the
+    resulting risk levels. Scenarios are processed in chunks so that at most max_chunk_elements
+    sampled ratings are held in memory.
+
+    Returns a dictionary of per-scenario arrays (percentiles, rank statistics) and a per-factor
+    sensitivity table.
+    """
+    if uncertainty is None:
+        uncertainty = default_uncertainty()
+    distributions = _prepare_distributions(model, uncertainty)
+    codes = np.hstack([np.asarray(likelihood_codes), np.asarray(impact_codes)]).astype(np.int8)
+    n_scenarios = len(codes)
+    chunk_size = max(1, max_chunk_elements // n_draws)
+    n_values = int(model["risk_matrix"].max()) + 1
+
+    n_likelihood = len(model["likelihood_factors"])
+    point = np.maximum(score_codes(model, codes[:, :n_likelihood], codes[:, n_likelihood:])["risk"], 0)
+
+    percentiles = np.zeros((n_scenarios, 3))
+    mean_risk = np.zeros(n_scenarios)
+    change_probability = np.zeros(n_scenarios)
+    value_counts = np.zeros((n_draws, n_values), dtype=np.int64)
+
+    # First pass: per-scenario risk statistics and per-draw counts of each risk value
+    for chunk_index, start in enumerate(range(0, n_scenarios, chunk_size)):
+        rng = np.random.default_rng([seed, chunk_index])
+        risk = _sample_risk(model, codes[start:start + chunk_size], distributions, n_draws, rng)
+        percentiles[start:start + len(risk)] = np.percentile(risk, [5, 50, 95], axis=1).T
+        mean_risk[start:start + len(risk)] = risk.mean(axis=1)
+        change_probability[start:start + len(risk)] = (risk != point[start:start + len(risk), None]).mean(axis=1)
+        offsets = risk + (np.arange(n_draws) * n_values)[None, :]
+        value_counts += np.bincount(offsets.ravel(), minlength=n_draws * n_values).reshape(n_draws, n_values)
+
+    # Number of scenarios with a strictly higher risk, per draw and risk value
+    higher = value_counts[:, ::-1].cumsum(axis=1)[:, ::-1] - value_counts
+
+    # Second pass: regenerate the same draws to rank every scenario within each draw
+    rank_percentiles = np.zeros((n_scenarios, 2))
+    top_k_probability = np.zeros(n_scenarios)
+    draw_index = np.arange(n_draws)[None, :]
+    for chunk_index, start in enumerate(range(0, n_scenarios, chunk_size)):
+        rng = np.random.default_rng([seed, chunk_index])
+        risk = _sample_risk(model, codes[start:start + chunk_size], distributions, n_draws, rng)
+        ranks = 1 + higher[draw_index, risk]
+        rank_percentiles[start:start + len(risk)] = np.percentile(ranks, [5, 95], axis=1).T
+        top_k_probability[start:start + len(risk)] = (ranks <= top_k).mean(axis=1)
+
+    point_counts = np.bincount(point, minlength=n_values)
+    point_rank = 1 + (point_counts[::-1].cumsum()[::-1] - point_counts)[point]
+
+    # Per-factor sensitivity: vary one factor at a time and measure how often the risk level moves
+    factors = model["likelihood_factors"] + model["impact_factors"]
+    sensitivity = []
+    sensitivity_draws = max(1, n_draws // 4)
+    sensitivity_chunk = max(1, max_chunk_elements // sensitivity_draws)
+    for column, factor in enumerate(factors):
+        changed = 0
+        shift = 0
+        for chunk_index, start in enumerate(range(0, n_scenarios, sensitivity_chunk)):
+            rng = np.random.default_rng([seed, column + 1, chunk_index])
+            risk = _sample_risk(model, codes[start:start + sensitivity_chunk], distributions, sensitivity_draws, rng, only_factor=column)
+            delta = np.abs(risk - point[start:start + len(risk), None])
+            changed += np.count_nonzero(delta)
+            shift += delta.sum()
+        total = max(1, n_scenarios * sensitivity_draws)
+        sensitivity.append({"Factor": factor, "P(risk level changes)": float(changed / total), "Mean |Δ risk|": float(shift / total)})
+
+    return {
+        "point_risk": point,
+        "point_rank": point_rank,
+        "mean_risk": mean_risk,
+        "p5": percentiles[:, 0],
+        "p50": percentiles[:, 1],
+        "p95": percentiles[:, 2],
+        "change_probability": change_probability,
+        "rank_p5": rank_percentiles[:, 0],
+        "rank_p95": rank_percentiles[:, 1],
+        "top_k_probability": top_k_probability,
+        "sensitivity": sensitivity,
+    }
+
+
+# Function to run the simulation for assessed scenarios (entries of risk_assessment.json)
+def simulate_scenarios(model, scenarios, **kwargs):
+    codes = [scenario_codes(model, scenario) for scenario in scenarios]
+    return simulate_codes(model, [c[0] for c in codes], [c[1] for c in codes], **kwargs)
+
+
+@st.fragment
+def display_risk_simulation(scenarios):
+    st.subheader("Uncertainty Analysis")
+    st.markdown(
+        "Simulates analyst disagreement on the likelihood and impact factors and reports how stable each scenario's risk level and priority are."
+    )
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        spread_probability = st.slider("Probability a rating is off", 0.0, 0.9, 0.3, 0.05, key="simulation_spread")
+    with col2:
+        max_shift = st.selectbox("Maximum deviation (levels)", [1, 2], key="simulation_shift")
+    with col3:
+        n_draws = st.number_input("Draws per scenario", 100, 20000, 2000, 100, key="simulation_draws")
+    uncertain_factors = st.multiselect(
+        "Uncertain factors",
+        list(levels) + list(impact_levels),
+        default=list(levels) + list(impact_levels),
+        key="simulation_factors",
+    )
+    top_k = st.number_input("Top-K priority list size", 1, max(1, len(scenarios)), min(10, max(1, len(scenarios))), key="simulation_top_k")
+
+    if st.button("Run Simulation", key="simulation_run"):
+        model = load_risk_model()
+        uncertainty = {factor: symmetric_distribution(spread_probability, max_shift) for factor in uncertain_factors}
+        start = time.perf_counter()
+        with st.spinner("Simulating..."):
+            results = simulate_scenarios(model, scenarios, uncertainty=uncertainty, n_draws=int(n_draws), top_k=int(top_k))
+        elapsed = time.perf_counter() - start
+
+        df = pd.DataFrame({
+            "Asset": [s["asset"] for s in scenarios],
+            "Threat": [s["threat"] for s in scenarios],
+            "Attack Vector": [s["vector"] for s in scenarios],
+            "Scenario ID": [s["scenario_id"] for s in scenarios],
+            "Risk Level": results["point_risk"],
+            "Mean": results["mean_risk"].round(2),
+            "P5": results["p5"],
+            "P50": results["p50"],
+            "P95": results["p95"],
+            "P(level changes)": results["change_probability"].round(3),
+            "Rank": results["point_rank"],
+            "Rank P5-P95": [f"{int(a)}-{int(b)}" for a, b in zip(results["rank_p5"], results["rank_p95"])],
+            f"P(top {int(top_k)})": results["top_k_probability"].round(3),
+        })
+        st.write(f"Simulated {len(scenarios)} scenarios x {int(n_draws)} draws in {elapsed:.2f} s.")
+        st.dataframe(df.sort_values(by=["Risk Level", "Mean"], ascending=False), hide_index=True)
+        st.write("### Factor Sensitivity")
+        st.dataframe(
+            pd.DataFrame(results["sensitivity"]).sort_values(by="P(risk level changes)", ascending=False),
+            hide_index=True,
+        )
@@ -0,0 +1,197 @@
+# scenario_search.py
+
+import bisect
+import re
+import time
+import numpy as np
+import streamlit as st
+from scenario_similarity import TOKEN_PATTERN
+
+# Number of scenarios listed per page of a scenario picker
+PAGE_SIZE = 50
+
+WORD_SEPARATORS = re.compile(r"[-_./]")
+
+
+# Function to split a text into its search terms: its words, and the parts of the words joined by - _ . or /
+def search_terms(text):
+    terms = set()
+    for word in TOKEN_PATTERN.findall((text or "").lower()):
+        terms.add(word)
+        terms.update(part for part in WORD_SEPARATORS.split(word) if part)
+    return terms
+
+
+# Function to split a query into words; every word must begin a term of the scenario
+def query_words(query):
+    return TOKEN_PATTERN.findall((query or "").lower())
+
+
+def build_scenario_index(scenario_mapping):
+    """
+    Builds an inverted index of scenarios over the words of their asset, threat, attack vector, ID and
+    description. The vocabulary is sorted and the postings of each term are stored one after the other,
+    so the postings of all the terms beginning with a prefix are one slice.
+
+    Parameters:
+    scenario_mapping (dict): Scenario key -> scenario details (asset, threat, vector, scenario_id, scenario_desc).
+    """
+    keys = list(scenario_mapping)
+    term_ids, entry_rows, entry_terms = {}, [], []
+    for row, key in enumerate(keys):
+        scenario = scenario_mapping[key]
+        text = " ".join(str(scenario.get(field, "")) for field in ("asset", "threat", "vector", "scenario_id", "scenario_desc"))
+        for term in search_terms(text):
+            entry_rows.append(row)
+            entry_terms.append(term_ids.setdefault(term, len(term_ids)))
+
+    # Rank of every term in the sorted vocabulary; a stable sort by rank keeps the rows of a term in order
+    terms = sorted(term_ids)
+    ranks = np.empty(len(terms), dtype=np.int64)
+    ranks[[term_ids[term] for term in terms]] = np.arange(len(terms))
+    entry_ranks = ranks[np.array(entry_terms, dtype=np.int64)]
+    order = np.argsort(entry_ranks, kind="stable")
+    assets, asset_ids = np.unique([scenario_mapping[key]["asset"] for key in keys], return_inverse=True)
+    threats, threat_ids = np.unique([scenario_mapping[key]["threat"] for key in keys], return_inverse=True)
+    return {
+        "keys": keys,
+        "rows": {key: row for row, key in enumerate(keys)},
+        "terms": terms,
+        "term_ptr": np.concatenate(([0], np.cumsum(np.bincount(entry_ranks, minlength=len(terms))))),
+        "postings": np.array(entry_rows, dtype=np.int64)[order],
+        "assets": assets.tolist(),
+        "asset_ids": asset_ids,
+        "threats": threats.tolist(),
+        "threat_ids": threat_ids,
+    }
+
+
+def search_scenarios(index, query="", assets=None, threats=None, rows=None):
+    """
+    Returns the rows of the scenarios matching every word of the query as a term or term prefix, and
+    the selected assets and threats, in index order.
+
+    Parameters:
+    index (dict): Index built by build_scenario_index.
+    query (str): Words or word beginnings.
+    assets, threats (list): Asset and threat names to keep, all when empty.
+    rows (np.ndarray): Rows to search in, all when None.
+    """
+    size = len(index["keys"])
+    if rows is None:
+        mask = np.ones(size, dtype=bool)
+    else:
+        mask = np.zeros(size, dtype=bool)
+        mask[rows] = True
+    for word in query_words(query):
+        first = bisect.bisect_left(index["terms"], word)
+        last = bisect.bisect_left(index["terms"], word + "\uffff")
+        matches = np.zeros(size, dtype=bool)
+        matches[index["postings"][index["term_ptr"][first]:index["term_ptr"][last]]] = True
+        mask &= matches
+    if assets:
+        mask &= np.isin(index["asset_ids"], [index["assets"].index(asset) for asset in assets])
+    if threats:
+        mask &= np.isin(index["threat_ids"], [index["threats"].index(threat) for threat in threats])
+    return np.flatnonzero(mask)
+
+
+def scenario_picker(scenario_mapping, available, key, page_size=PAGE_SIZE):
+    """
+    Renders a searchable, filterable and paginated scenario selectbox; only the current page of
+    scenarios is sent to the browser. The selected scenario key is kept in st.session_state[key], so
+    setting it moves the picker to the page of that scenario. Returns the selected scenario key.
+
+    Parameters:
+    scenario_mapping (dict): Scenario key -> scenario details, for all the scenarios of the assessment.
+    available (list): Keys of the scenarios not rated yet.
+    key (str): Widget key of the selectbox, and prefix of the other widget keys.
+    page_size (int): Number of scenarios per page.
+    """
+    index_key = f"{key}_index"
+    if index_key not in st.session_state or st.session_state[index_key]["keys"] != list(scenario_mapping):
+        st.session_state[index_key] = build_scenario_index(scenario_mapping)
+    index = st.session_state[index_key]
+
+    col1, col2, col3 = st.columns([3, 2, 2])
+    with col1:
+        query = st.text_input("Search scenarios", key=f"{key}_query", placeholder="Words or word beginnings, such as 'obd inj'")
+    with col2:
+        assets = st.multiselect("Asset", index["assets"], key=f"{key}_assets")
+    with col3:
+        threats = st.multiselect("Threat", index["threats"], key=f"{key}_threats")
+    unrated_only = st.checkbox("Unrated only", value=True, key=f"{key}_unrated")
+
+    available_rows = np.array([index["rows"][scenario] for scenario in available if scenario in index["rows"]], dtype=np.int64)
+    rows = search_scenarios(index, query, assets, threats, available_rows if unrated_only else None)
+
+    # Follow the selection to its page, unless the page was just changed
+    page_key, shown_key = f"{key}_page", f"{key}_page_shown"
+    pages = max(1, -(-len(rows) // page_size))
+    page = min(max(int(st.session_state.get(page_key, 1)), 1), pages)
+    selected_row = index["rows"].get(st.session_state.get(key))
+    position = np.flatnonzero(rows == selected_row)
+    if page == st.session_state.get(shown_key, page) and len(position):
+        page = int(position[0]) // page_size + 1
+    st.session_state[page_key] = page
+    st.session_state[shown_key] = page
+
+    options = [index["keys"][row] for row in rows[(page - 1) * page_size:page * page_size]]
+    if not options:
+        st.write("No scenario matches the search.")
+        selected = st.session_state.get(key)
+        return selected if selected in scenario_mapping else (available[0] if available else None)
+    if st.session_state.get(key) not in options:
+        st.session_state[key] = options[0]
+
+    unrated = set(available)
+    selected = st.selectbox(
+        "Attack scenario", options, key=key, label_visibility="collapsed",
+        format_func=lambda scenario: scenario if scenario in unrated else f"{scenario} (submitted)",
+    )
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.number_input("Page", min_value=1, max_value=pages, key=page_key)
+    with col2:
+        st.caption(f"Scenarios {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(options)} of {len(rows)}")
+    if selected not in unrated:
+        st.info("This scenario has already been submitted.")
+    return selected
+
+
+def benchmark_scenario_search(size=100000, queries=("brak", "can inj", "obd-ii frame", "remote"), repeat=20):
+    """
+    Times building the index of a synthetic attack model of size scenarios and searching it.
+    """
+    from scenario_similarity import generate_benchmark_texts
+
+    words = ["braking", "CAN", "injection", "OBD-II", "frames", "remote", "telematics", "firmware", "update"]
+    rng = np.random.default_rng(0)
+    descriptions = generate_benchmark_texts(size)
+    scenario_mapping = {}
+    for row, description in enumerate(descriptions):
+        scenario = {
+            "asset": f"Asset {row % 50}",
+            "threat": f"Threat {row % 400}",
+            "vector": f"Vector {row % 2000}",
+            "scenario_id": f"scenario_{row % 5 + 1}",
+            "scenario_desc": f"{description} {' '.join(rng.choice(words, 3))}",
+        }
+        scenario_mapping[f"{scenario['asset']} - {scenario['threat']} - {scenario['vector']} - scenario_{row}"] = scenario
+
+    start = time.perf_counter()
+    index = build_scenario_index(scenario_mapping)
+    timings = {"scenarios": size, "build": time.perf_counter() - start}
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            rows = search_scenarios(index, query, assets=["Asset 1", "Asset 2"])
+        timings[query] = ((time.perf_counter() - start) / repeat, len(rows))
+    return timings
+
+
+if __name__ == "__main__":
+    timings = benchmark_scenario_search()
+    print(f"{timings.pop('scenarios')} scenarios indexed in {timings.pop('build') * 1000:.0f} ms")
+    for query, (duration, matches) in timings.items():
+        print(f"'{query}' in 2 assets: {matches} matches in {duration * 1000:.2f} ms")
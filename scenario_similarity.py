@@ -0,0 +1,310 @@
+# scenario_similarity.py
+
+import re
+import time
+import zlib
+import numpy as np
+
+# Cosine similarity of the TF-IDF vectors above which two scenario descriptions are duplicates
+SIMILARITY_THRESHOLD = 0.6
+
+# From this many scenarios on, candidate pairs come from MinHash/LSH instead of the shared terms
+LSH_MIN_SCENARIOS = 2000
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+# Terms in more scenarios than this share (and at least COMMON_TERM_MIN_COUNT) only add to the similarity
+# of candidate pairs, they do not make pairs themselves; LSH buckets larger than MAX_BUCKET_SIZE are skipped
+COMMON_TERM_SHARE = 0.05
+COMMON_TERM_MIN_COUNT = 100
+MAX_BUCKET_SIZE = 500
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "for", "from", "has", "have", "in", "into",
+    "is", "it", "its", "may", "of", "on", "or", "such", "that", "the", "their", "then", "this", "to", "via",
+    "which", "with",
+}
+
+
+# Suffixes removed from the words, so that "injects" and "injected" are the same term
+SUFFIXES = ("ing", "ed", "es", "s")
+
+
+# Function to remove the first matching suffix of a word, keeping at least four letters
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+# Function to split a scenario description into its terms, the stemmed words that are not stop words; word
+# order is ignored, as rewordings of a scenario often reorder it
+def tokenize(text):
+    return [stem(word) for word in TOKEN_PATTERN.findall((text or "").lower()) if word not in STOP_WORDS]
+
+
+def build_similarity_index(texts):
+    """
+    Builds L2-normalized TF-IDF vectors of the given texts as CSR arrays. Terms are identified by their
+    CRC32, so the index needs no vocabulary and stays the same across runs.
+
+    Parameters:
+    texts (list): Scenario descriptions.
+    """
+    size = len(texts)
+    term_ids = {}
+    doc_terms = []
+    for text in texts:
+        ids = []
+        for term in tokenize(text):
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = zlib.crc32(term.encode("utf-8"))
+            ids.append(term_id)
+        doc_terms.append(ids)
+    doc_terms = [np.array(ids, dtype=np.uint64) for ids in doc_terms]
+    lengths = np.array([len(terms) for terms in doc_terms], dtype=np.int64)
+    combined = np.repeat(np.arange(size, dtype=np.uint64), lengths) << np.uint64(32)
+    if lengths.sum():
+        combined |= np.concatenate(doc_terms)
+
+    # Sorting (document, term) gives the term counts of every document, grouped by document
+    entries, term_counts = np.unique(combined, return_counts=True)
+    docs = (entries >> np.uint64(32)).astype(np.int64)
+    terms = (entries & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    _, term_index, document_counts = np.unique(terms, return_inverse=True, return_counts=True)
+
+    idf = np.log((1.0 + size) / (1.0 + document_counts[term_index])) + 1.0
+    weights = (1.0 + np.log(term_counts)) * idf
+    norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=size))
+    weights = weights / norms[docs]
+
+    return {
+        "size": size,
+        "indptr": np.concatenate(([0], np.cumsum(np.bincount(docs, minlength=size)))),
+        "docs": docs,
+        "terms": terms,
+        "weights": weights.astype(np.float32),
+    }
+
+
+# Function to return every pair of items sharing a group, as two arrays: items are sorted by group and the
+# groups given by their start and length
+def _group_pairs(items, starts, lengths):
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.repeat(starts, lengths) + offsets
+    partners = np.repeat(lengths, lengths) - 1 - offsets
+    left = np.repeat(positions, partners)
+    steps = np.arange(partners.sum()) - np.repeat(np.cumsum(partners) - partners, partners) + 1
+    return items[left], items[left + steps]
+
+
+# Function to return the runs of equal values of a sorted array as their starts and lengths
+def _runs(sorted_values):
+    if not len(sorted_values):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], sorted_values[1:] != sorted_values[:-1])))
+    return starts, np.diff(np.append(starts, len(sorted_values)))
+
+
+# Function to keep the unique pairs (left < right) of two arrays of documents
+def _unique_pairs(left, right, size):
+    low, high = np.minimum(left, right), np.maximum(left, right)
+    keys = np.unique(low[low != high].astype(np.int64) * size + high[low != high])
+    return keys // size, keys % size
+
+
+# Function to return the pairs of documents sharing at least one term that is not common
+def candidate_pairs_shared_terms(index):
+    order = np.lexsort((index["docs"], index["terms"]))
+    starts, lengths = _runs(index["terms"][order])
+    max_count = max(COMMON_TERM_MIN_COUNT, int(index["size"] * COMMON_TERM_SHARE))
+    kept = (lengths > 1) & (lengths <= max_count)
+    left, right = _group_pairs(index["docs"][order], starts[kept], lengths[kept])
+    return _unique_pairs(left, right, index["size"])
+
+
+def minhash_signatures(index, num_permutations=NUM_PERMUTATIONS, seed=0, chunk_entries=200000):
+    """
+    Returns the MinHash signature of the term set of every document, one row of num_permutations
+    values per document. Documents without terms get the largest value everywhere. The hash functions
+    are multiply-shift hashes, (a * x + b) >> 32 with 64-bit overflow, which need no modulo.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 64, num_permutations, dtype=np.uint64, endpoint=False) | np.uint64(1)
+    b = rng.integers(0, 2 ** 64, num_permutations, dtype=np.uint64, endpoint=False)
+    signatures = np.full((index["size"], num_permutations), np.iinfo(np.uint64).max, dtype=np.uint64)
+    indptr, terms = index["indptr"], index["terms"].astype(np.uint64)
+
+    # Whole documents per chunk, so that each chunk reduces to complete signatures
+    boundaries = np.searchsorted(indptr, np.arange(0, indptr[-1], chunk_entries), side="right") - 1
+    boundaries = np.unique(np.append(boundaries, index["size"]))
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        documents = np.arange(first, last)
+        documents = documents[indptr[documents + 1] > indptr[documents]]
+        if not len(documents):
+            continue
+        hashes = (terms[indptr[first]:indptr[last], None] * a + b) >> np.uint64(32)
+        signatures[documents] = np.minimum.reduceat(hashes, indptr[documents] - indptr[first], axis=0)
+    return signatures
+
+
+# Function to return the pairs of documents whose signatures agree on all the rows of at least one band
+def candidate_pairs_lsh(index, num_permutations=NUM_PERMUTATIONS, bands=LSH_BANDS, seed=0):
+    signatures = minhash_signatures(index, num_permutations, seed)
+    rows = num_permutations // bands
+    has_terms = np.flatnonzero(np.diff(index["indptr"]) > 0)
+    multipliers = np.random.default_rng(seed + 1).integers(1, 2 ** 63, rows, dtype=np.uint64) | np.uint64(1)
+    left, right = [], []
+    for band in range(bands):
+        # Hash of the rows of the band; colliding bands only add candidates, which are checked anyway
+        keys = (signatures[has_terms, band * rows:(band + 1) * rows] * multipliers).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        starts, lengths = _runs(keys[order])
+        kept = (lengths > 1) & (lengths <= MAX_BUCKET_SIZE)
+        band_left, band_right = _group_pairs(has_terms[order], starts[kept], lengths[kept])
+        left.append(band_left)
+        right.append(band_right)
+    return _unique_pairs(np.concatenate(left), np.concatenate(right), index["size"])
+
+
+# Function to return, for some rows of a CSR index, the positions of their entries and the row they belong to
+def _row_entries(indptr, rows):
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    return positions, np.repeat(np.arange(len(rows)), lengths)
+
+
+def pair_similarity(index, left, right, chunk_pairs=100000):
+    """
+    Returns the exact cosine similarity of the given pairs of documents. The entries of a document are
+    sorted by term, so the (pair, term) keys of the left and right documents are sorted as well and the
+    shared terms are found with a binary search.
+    """
+    similarity = np.zeros(len(left))
+    terms = index["terms"].astype(np.int64)
+    for start in range(0, len(left), chunk_pairs):
+        chunk = slice(start, start + chunk_pairs)
+        left_positions, left_pairs = _row_entries(index["indptr"], left[chunk])
+        right_positions, right_pairs = _row_entries(index["indptr"], right[chunk])
+        left_keys = (left_pairs << 32) | terms[left_positions]
+        right_keys = (right_pairs << 32) | terms[right_positions]
+        found = np.minimum(np.searchsorted(right_keys, left_keys), max(len(right_keys) - 1, 0))
+        shared = np.flatnonzero(right_keys[found] == left_keys) if len(right_keys) else found[:0]
+        products = index["weights"][left_positions[shared]].astype(np.float64) * index["weights"][right_positions[found[shared]]]
+        similarity[chunk] = np.bincount(left_pairs[shared], weights=products, minlength=len(left[chunk]))
+    return similarity
+
+
+def similar_pairs(index, threshold=SIMILARITY_THRESHOLD, method="auto"):
+    """
+    Returns the pairs of documents at least threshold similar, as left, right and similarity arrays.
+
+    Parameters:
+    index (dict): Index built by build_similarity_index.
+    threshold (float): Minimum cosine similarity.
+    method (str): "shared_terms" (candidates share a term), "lsh" (candidates share a MinHash band) or
+        "auto" (LSH from LSH_MIN_SCENARIOS documents on). LSH may miss pairs of low term overlap.
+    """
+    if method == "auto":
+        method = "lsh" if index["size"] >= LSH_MIN_SCENARIOS else "shared_terms"
+    left, right = candidate_pairs_lsh(index) if method == "lsh" else candidate_pairs_shared_terms(index)
+    similarity = pair_similarity(index, left, right)
+    kept = similarity >= threshold - 1e-6
+    return left[kept], right[kept], similarity[kept]
+
+
+# Function to label the connected components of a graph with the smallest document of each component
+def connected_components(size, left, right):
+    labels = np.arange(size)
+    while True:
+        lowest = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, lowest)
+        np.minimum.at(updated, right, lowest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def cluster_scenarios(texts, threshold=SIMILARITY_THRESHOLD, method="auto"):
+    """
+    Groups near-duplicate scenario descriptions. Duplicates are linked pairs of similar descriptions and
+    a cluster is a connected group of them. Each cluster has a representative: the member most similar
+    to the others, or the first one on a tie.
+
+    Parameters:
+    texts (list): Scenario descriptions.
+    threshold (float): Minimum cosine similarity of two duplicates.
+    method (str): Candidate search, see similar_pairs.
+
+    Returns:
+    dict: "representatives" (row of the representative of every text, itself when it is not a
+        duplicate), "clusters" (number of clusters with duplicates) and "pairs" (left, right, similarity).
+    """
+    index = build_similarity_index(texts)
+    left, right, similarity = similar_pairs(index, threshold, method)
+    labels = connected_components(index["size"], left, right)
+
+    strength = np.bincount(left, weights=similarity, minlength=index["size"]) + np.bincount(right, weights=similarity, minlength=index["size"])
+    rows = np.arange(index["size"])
+    order = np.lexsort((rows, -strength, labels))
+    starts, lengths = _runs(labels[order])
+    representative_of_label = np.empty(index["size"], dtype=np.int64)
+    representative_of_label[labels[order][starts]] = order[starts]
+
+    return {
+        "representatives": representative_of_label[labels],
+        "clusters": int((lengths > 1).sum()),
+        "pairs": (left, right, similarity),
+    }
+
+
+# Function to create n synthetic scenario descriptions, about duplicate_share of them rewordings of others;
+# words follow a Zipf distribution like the words of real descriptions
+def generate_benchmark_texts(n, duplicate_share=0.3, vocabulary_size=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    frequencies = 1.0 / np.arange(1, vocabulary_size + 1)
+    frequencies /= frequencies.sum()
+    texts = []
+    for _ in range(n):
+        if texts and rng.random() < duplicate_share:
+            words = texts[rng.integers(len(texts))].split()
+            words[rng.integers(len(words))] = f"word{rng.choice(vocabulary_size, p=frequencies)}"
+        else:
+            words = [f"word{i}" for i in rng.choice(vocabulary_size, 25, p=frequencies)]
+        texts.append(" ".join(words))
+    return texts
+
+
+def benchmark_scenario_similarity(sizes=(1000, 5000, 50000), threshold=SIMILARITY_THRESHOLD, exact_max_size=5000):
+    """
+    Times clustering synthetic scenario descriptions of several sizes with LSH, and up to exact_max_size
+    with the shared terms, which find every similar pair, to give the recall of LSH.
+    """
+    results = []
+    for size in sizes:
+        texts = generate_benchmark_texts(size)
+        result = {"scenarios": size}
+        for method in ("lsh", "shared_terms") if size <= exact_max_size else ("lsh",):
+            start = time.perf_counter()
+            clusters = cluster_scenarios(texts, threshold, method)
+            result[method] = time.perf_counter() - start
+            result[f"{method}_pairs"] = len(clusters["pairs"][0])
+            result[f"{method}_duplicates"] = int((clusters["representatives"] != np.arange(size)).sum())
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    for result in benchmark_scenario_similarity():
+        line = (f"{result['scenarios']} scenarios: LSH {result['lsh'] * 1000:.0f} ms, {result['lsh_duplicates']} duplicates "
+                f"in {result['lsh_pairs']} similar pairs")
+        if "shared_terms" in result:
+            line += (f"; shared terms {result['shared_terms'] * 1000:.0f} ms, {result['shared_terms_duplicates']} duplicates "
+                     f"in {result['shared_terms_pairs']} similar pairs")
+        print(line)
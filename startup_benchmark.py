@@ -0,0 +1,115 @@
+# startup_benchmark.py
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Modules main.py imports at startup
+APP_MODULES = [
+    "streamlit", "PIL.Image", "sidebar", "mitigations", "threat_model", "attack_model", "attack_model_view",
+    "attack_graph", "likelihood_assessment_customized", "likelihood_assessment_full", "bulk_assessment",
+    "scenario_similarity", "scenario_search", "pre_rating", "rating_kb", "impact_assessment", "risk_computation",
+    "risk_simulation", "attack_paths", "risk_rollup", "graph_export", "graph_selection", "mitigation_optimizer",
+    "tara_report",
+]
+
+# Heavy packages that must only be imported on first use, never at startup
+LAZY_PACKAGES = ["openai", "google.generativeai"]
+
+# Default budget in milliseconds for importing APP_MODULES in a fresh interpreter
+DEFAULT_BUDGET_MS = 1500
+
+
+# Function to parse the output of python -X importtime into (name, depth, self_us, cumulative_us) rows
+def parse_importtime(output):
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure_import_time(modules=None, cwd=None):
+    """
+    Imports the modules in a fresh interpreter with -X importtime and returns the total time,
+    the slowest top-level imports and every module that got imported.
+
+    Parameters:
+    modules (list): Module names to import, APP_MODULES by default.
+    cwd (str): Directory to run the interpreter in, the directory of this file by default.
+    """
+    modules = modules or APP_MODULES
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the app modules failed:\n{result.stderr[-2000:]}")
+
+    rows = parse_importtime(result.stderr)
+    top_level = sorted((row for row in rows if row[1] == 0), key=lambda row: row[3], reverse=True)
+    return {
+        "total_ms": sum(row[3] for row in top_level) / 1000,
+        "slowest": [(name, cumulative / 1000) for name, _, _, cumulative in top_level[:10]],
+        "imported": {row[0] for row in rows},
+    }
+
+
+# Function to time a fresh process running main.py once headlessly, up to the end of the first script run
+def measure_first_run(cwd=None):
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    script = (
+        "import time; start = time.perf_counter()\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        f"at = AppTest.from_file({os.path.join(cwd, 'main.py')!r}, default_timeout=120).run()\n"
+        "print(time.perf_counter() - start, len(at.exception))\n"
+    )
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd, capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Running main.py failed:\n{result.stderr[-2000:]}")
+    run_seconds, exceptions = result.stdout.split()[-2:]
+    return {"process_ms": total * 1000, "first_run_ms": float(run_seconds) * 1000, "exceptions": int(exceptions)}
+
+
+def check_startup(budget_ms=DEFAULT_BUDGET_MS, repeat=3):
+    """
+    Returns a list of problems (empty when the startup is within budget): the best import time
+    of several fresh interpreters must not exceed the budget and no LAZY_PACKAGES may be imported.
+    """
+    runs = [measure_import_time() for _ in range(repeat)]
+    best = min(runs, key=lambda run: run["total_ms"])
+    problems = []
+    if best["total_ms"] > budget_ms:
+        problems.append(f"Importing the app modules took {best['total_ms']:.0f} ms, over the {budget_ms} ms budget.")
+    for package in LAZY_PACKAGES:
+        if package in best["imported"]:
+            problems.append(f"'{package}' is imported at startup; import it on first use instead.")
+    return best, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cold start of AutoSecGPT and enforce an import-time budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-run", action="store_true", help="Also time a headless first run of main.py.")
+    args = parser.parse_args()
+
+    best, problems = check_startup(args.budget_ms, args.repeat)
+    print(f"Import time of the app modules: {best['total_ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative_ms in best["slowest"]:
+        print(f"  {cumulative_ms:8.1f} ms  {name}")
+    if args.first_run:
+        first_run = measure_first_run()
+        print(f"Fresh process to end of first script run: {first_run['process_ms']:.0f} ms "
+              f"(script run {first_run['first_run_ms']:.0f} ms, {first_run['exceptions']} exceptions)")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
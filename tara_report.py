@@ -0,0 +1,647 @@
+# tara_report.py
+
+import base64
+import functools
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+import streamlit as st
+from util import levels, impact_levels
+from graph_export import GRAPH_IMAGES_DIR
+from risk_computation import load_risk_state, get_prioritized_risk_row
+from mitigation_optimizer import load_controls
+from attack_model import get_unassigned_threats
+from attack_model_view import UNASSIGNED_SECTION
+
+# Bumped whenever the content or layout of the sections changes, so that cached sections are built again
+TARA_REPORT_VERSION = 2
+
+# Size in bytes of the chunks the report files are written, copied and encoded in
+REPORT_CHUNK_SIZE = 1 << 16
+
+# Formats the report is written to
+REPORT_FORMATS = ["md", "html", "xlsx"]
+
+# Sections of the report, in order: (section ID, title)
+REPORT_SECTIONS = [
+    ("threat_model", "Threat Model"),
+    ("attack_model", "Attack Model"),
+    ("attack_graphs", "Attack Graphs"),
+    ("likelihood", "Likelihood Assessment"),
+    ("impact", "Impact Assessment"),
+    ("risk", "Prioritized Risks"),
+    ("mitigations", "Mitigations"),
+]
+
+# Files each section is built from, relative to the working directory; the attack graph images are listed
+# from their directory
+SECTION_SOURCES = {
+    "threat_model": [".files\\threats.json"],
+    "attack_model": [".files\\unified_attack_model.json", ".files\\attack_model.json"],
+    "likelihood": [".files\\final_likelihood_assessment.json"],
+    "impact": [".files\\final_impact_assessment.json"],
+    "risk": [".files\\risk_assessment.json", ".files\\risk_assessment_updates.jsonl"],
+    "mitigations": [".files\\controls.json", ".files\\unified_attack_model.json"],
+}
+
+# Folder of the attack graph images referenced by the Markdown report, as in the graph images zip
+GRAPH_IMAGES_FOLDER = "attack_graphs"
+
+HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>TARA Report</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; margin-bottom: 1.5em; }
+th, td { border: 1px solid #999999; padding: 4px 8px; text-align: left; vertical-align: top; }
+th { background: #eeeeee; }
+img { max-width: 100%; }
+</style>
+</head>
+<body>
+"""
+
+# Largest number of characters in an XLSX cell
+XLSX_MAX_CELL_LENGTH = 32767
+
+# Style index of the bold cells in XLSX_STYLES
+XLSX_BOLD_STYLE = 1
+
+# Characters not allowed in XML 1.0
+XML_ILLEGAL_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Parts of the XLSX package besides the sheets, which are written by the sections
+XLSX_RELATIONSHIPS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+XLSX_CONTENT_TYPES = (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{overrides}</Types>'
+)
+XLSX_PACKAGE_RELATIONSHIPS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    f'<Relationship Id="rId1" Type="{XLSX_RELATIONSHIPS}/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    f'xmlns:r="{XLSX_RELATIONSHIPS}"><sheets>{{sheets}}</sheets></workbook>'
+)
+XLSX_WORKBOOK_RELATIONSHIPS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{relationships}'
+    f'<Relationship Id="rId{{styles_id}}" Type="{XLSX_RELATIONSHIPS}/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+XLSX_STYLES = (
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+XLSX_SHEET_HEAD = (
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<cols><col min="1" max="16" width="30" customWidth="1"/></cols><sheetData>'
+)
+XLSX_SHEET_TAIL = "</sheetData></worksheet>"
+
+
+def get_tara_report_dir():
+    return os.path.join(os.getcwd(), ".files\\.tara_report")
+
+
+# Function to list the files a section is built from
+def get_section_sources(section_id):
+    base_path = os.getcwd()
+    if section_id == "attack_graphs":
+        images_dir = os.path.join(base_path, ".files\\.attackgraph", GRAPH_IMAGES_DIR)
+        if not os.path.isdir(images_dir):
+            return []
+        return sorted(os.path.join(images_dir, name) for name in os.listdir(images_dir) if name.endswith((".svg", ".png")))
+    return [os.path.join(base_path, name) for name in SECTION_SOURCES[section_id]]
+
+
+# Function to hash the version, size and name of the files a section is built from, missing files included
+def section_fingerprint(section_id, paths):
+    files = [
+        [os.path.basename(path), os.path.getmtime(path), os.path.getsize(path)] if os.path.exists(path) else [os.path.basename(path), None, None]
+        for path in paths
+    ]
+    content = json.dumps([TARA_REPORT_VERSION, section_id, files])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _join(value):
+    return "; ".join(value) if isinstance(value, list) else str(value or "")
+
+
+# Functions building the sections as streams of blocks: ("heading", level, text), ("text", text),
+# ("table", columns) followed by its ("row", values), and ("image", asset name, SVG path, PNG path)
+
+def threat_model_blocks(paths):
+    threat_model = _load_json(paths[0])
+    if not threat_model:
+        yield ("text", "No threat model found. Please generate the threat model first in the 'Threat Model' tab.")
+        return
+    yield ("table", ["Asset", "Threats", "Potential Consequences"])
+    for threat in threat_model:
+        yield ("row", [threat["Asset"], threat["Threats"], threat["Potential Consequences"]])
+
+
+def attack_model_blocks(paths):
+    attack_model = _load_json(paths[0])
+    if not attack_model or not attack_model.get("assets"):
+        yield ("text", "No attack model found. Please generate the attack model first in the 'Attack Model' tab.")
+        return
+    groups = list(attack_model["assets"])
+    # Threats of the attack model whose name matches no threat of the threat model are in no asset
+    source_model = _load_json(paths[1])
+    unassigned = get_unassigned_threats(attack_model["assets"], source_model) if source_model else []
+    if unassigned:
+        groups.append({"name": UNASSIGNED_SECTION, "threats": unassigned})
+    for asset in groups:
+        yield ("heading", 3, asset["name"])
+        if asset.get("consequences"):
+            yield ("text", f"Potential consequences: {_join(asset['consequences'])}")
+        yield ("table", ["Threat", "Attacker Objectives"])
+        for threat in asset["threats"]:
+            yield ("row", [threat["name"], _join(threat.get("objectives", []))])
+        yield ("table", ["Threat", "Attack Vector", "Scenario ID", "Scenario Description"])
+        for threat in asset["threats"]:
+            for vector in threat.get("vectors", []):
+                for scenario in vector["scenarios"]:
+                    yield ("row", [threat["name"], vector["vector_name"], scenario["scenario_id"], scenario["scenario_description"]])
+
+
+def attack_graph_blocks(paths):
+    images = {}
+    for path in paths:
+        name, image_format = os.path.splitext(os.path.basename(path))
+        images.setdefault(name, {})[image_format[1:]] = path
+    if not images:
+        yield ("text", "No attack graph images found. Please export the graph images first in the 'Attack Graph' tab.")
+        return
+    yield ("text", f"The Markdown report links the images of the '{GRAPH_IMAGES_FOLDER}' folder of the attack graph images zip.")
+    for name, formats in images.items():
+        yield ("image", name, formats.get("svg"), formats.get("png"))
+
+
+def _scenario_cells(scenario):
+    return [scenario["asset"], scenario["threat"], scenario["vector"], scenario["scenario_id"]]
+
+
+def likelihood_blocks(paths):
+    assessment = _load_json(paths[0])
+    if not assessment or not assessment.get("Scenarios"):
+        yield ("text", "No likelihood assessment found. Please complete the Likelihood Assessment first.")
+        return
+    yield ("table", ["Asset", "Threat", "Attack Vector", "Scenario ID"] + list(levels))
+    for scenario in assessment["Scenarios"]:
+        ratings = {factor["Factor"]: f"{factor['Level']} ({factor['Value']})" for factor in scenario["Likelihood"]}
+        yield ("row", _scenario_cells(scenario) + [ratings.get(factor, "") for factor in levels])
+
+
+def impact_blocks(paths):
+    assessment = _load_json(paths[0])
+    if not assessment or not assessment.get("Scenarios"):
+        yield ("text", "No impact assessment found. Please complete the Impact Assessment first.")
+        return
+    yield ("table", ["Asset", "Threat", "Attack Vector", "Scenario ID"] + list(impact_levels))
+    for scenario in assessment["Scenarios"]:
+        ratings = {factor["Factor"]: f"{factor['Level']} ({factor['Severity']})" for factor in scenario["Impact"]}
+        yield ("row", _scenario_cells(scenario) + [ratings.get(factor, "") for factor in impact_levels])
+
+
+def risk_blocks(paths):
+    # The risk rows are the snapshot with its pending updates applied
+    rows = [get_prioritized_risk_row(row) for row in load_risk_state()["rows"].values()]
+    if not rows:
+        yield ("text", "No risk assessment found. Please perform the Risk Evaluation first.")
+        return
+    rows.sort(key=lambda row: row["Risk Level"], reverse=True)
+    yield ("table", list(rows[0]))
+    for row in rows:
+        yield ("row", list(row.values()))
+
+
+def mitigation_blocks(paths):
+    controls = load_controls(paths[0]) or []
+    attack_model = _load_json(paths[1]) or {"assets": []}
+    threat_controls = [
+        [asset["name"], threat["name"], _join(threat["controls"])]
+        for asset in attack_model["assets"] for threat in asset["threats"] if threat.get("controls")
+    ]
+    if not controls and not threat_controls:
+        yield ("text", "No controls defined. Please define controls in the Mitigation Portfolio Optimizer first.")
+        return
+    if controls:
+        yield ("heading", 3, "Control Definitions")
+        yield ("table", ["Control", "Cost", "Shifts", "Scope"])
+        for control in controls:
+            scope = [f"{field.capitalize()}: {_join(control[field])}" for field in ("assets", "threats", "vectors") if control.get(field)]
+            yield ("row", [
+                control["name"], control.get("cost", 1),
+                ", ".join(f"{factor} → {level}" for factor, level in control.get("shifts", {}).items()),
+                "; ".join(scope) or "All scenarios",
+            ])
+    yield ("heading", 3, "Controls per Threat")
+    if not threat_controls:
+        yield ("text", "No controls have been added to the attack model yet.")
+        return
+    yield ("table", ["Asset", "Threat", "Controls"])
+    for row in threat_controls:
+        yield ("row", row)
+
+
+SECTION_BUILDERS = {
+    "threat_model": threat_model_blocks,
+    "attack_model": attack_model_blocks,
+    "attack_graphs": attack_graph_blocks,
+    "likelihood": likelihood_blocks,
+    "impact": impact_blocks,
+    "risk": risk_blocks,
+    "mitigations": mitigation_blocks,
+}
+
+
+def _markdown_cell(value):
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+# Function to render a block to Markdown
+def markdown_block(block):
+    kind = block[0]
+    if kind == "heading":
+        return f"{'#' * block[1]} {block[2]}\n\n"
+    if kind == "text":
+        return f"{block[1]}\n\n"
+    if kind == "table":
+        return f"| {' | '.join(_markdown_cell(column) for column in block[1])} |\n|{'---|' * len(block[1])}\n"
+    if kind == "row":
+        return f"| {' | '.join(_markdown_cell(value) for value in block[1])} |\n"
+    image = f"{GRAPH_IMAGES_FOLDER}/{quote(block[1])}.{'png' if block[3] else 'svg'}"
+    return f"**{block[1]}**\n\n![{block[1]} attack graph]({image})\n\n"
+
+
+# Function to render a block to HTML; images are embedded by write_html_image
+def html_block(block):
+    kind = block[0]
+    if kind == "heading":
+        return f"<h{block[1]}>{html.escape(block[2])}</h{block[1]}>\n"
+    if kind == "text":
+        return f"<p>{html.escape(block[1])}</p>\n"
+    if kind == "table":
+        return f"<table><thead><tr>{''.join(f'<th>{html.escape(str(column))}</th>' for column in block[1])}</tr></thead><tbody>\n"
+    if kind == "row":
+        return f"<tr>{''.join(f'<td>{html.escape(str(value))}</td>' for value in block[1])}</tr>\n"
+    return ""
+
+
+# Function to embed an image block in the HTML file, base64-encoding the image file chunk by chunk
+def write_html_image(file, block):
+    _, name, svg_path, png_path = block
+    path, mime = (svg_path, "image/svg+xml") if svg_path else (png_path, "image/png")
+    file.write(f"<h3>{html.escape(name)}</h3>\n<img alt=\"{html.escape(name)} attack graph\" src=\"data:{mime};base64,")
+    # A multiple of 3 bytes encodes without padding, so the encoded chunks can be concatenated
+    chunk_size = REPORT_CHUNK_SIZE // 3 * 3
+    with open(path, "rb") as image:
+        for chunk in iter(functools.partial(image.read, chunk_size), b""):
+            file.write(base64.b64encode(chunk).decode("ascii"))
+    file.write("\">\n")
+
+
+def get_section_part_paths(section_id, cache_dir):
+    return {part: os.path.join(cache_dir, f"{section_id}.{part}") for part in ("md", "html", "xml")}
+
+
+def build_report_section(section_id, title, source_paths, cache_dir):
+    """
+    Builds one section of the report and writes it, block by block, to its Markdown and HTML parts
+    and to its XLSX sheet. Only one block is held in memory at a time.
+
+    Parameters:
+    section_id (str): ID of the section, among REPORT_SECTIONS.
+    title (str): Title of the section.
+    source_paths (list): Files the section is built from (see get_section_sources).
+    cache_dir (str): Directory of the section parts.
+    """
+    parts = get_section_part_paths(section_id, cache_dir)
+    with open(parts["md"] + ".tmp", "w", encoding="utf-8", buffering=REPORT_CHUNK_SIZE) as md_file, \
+            open(parts["html"] + ".tmp", "w", encoding="utf-8", buffering=REPORT_CHUNK_SIZE) as html_file, \
+            open(parts["xml"] + ".tmp", "w", encoding="utf-8", buffering=REPORT_CHUNK_SIZE) as xml_file:
+        md_file.write(f"## {title}\n\n")
+        html_file.write(f"<h2 id=\"{section_id}\">{html.escape(title)}</h2>\n")
+        xml_file.write(XML_DECLARATION + XLSX_SHEET_HEAD)
+        in_table = False
+        for block in SECTION_BUILDERS[section_id](source_paths):
+            # A table ends at the first block that is not one of its rows
+            if in_table and block[0] != "row":
+                md_file.write("\n")
+                html_file.write("</tbody></table>\n")
+            in_table = block[0] in ("table", "row")
+            md_file.write(markdown_block(block))
+            if block[0] == "image":
+                write_html_image(html_file, block)
+            else:
+                html_file.write(html_block(block))
+            xml_file.write(xlsx_block(block))
+        if in_table:
+            md_file.write("\n")
+            html_file.write("</tbody></table>\n")
+        xml_file.write(XLSX_SHEET_TAIL)
+    for path in parts.values():
+        os.replace(path + ".tmp", path)
+    return section_id
+
+
+# Function to render a block to the rows of an XLSX sheet, with the headings and table columns in bold
+def xlsx_block(block):
+    kind = block[0]
+    if kind == "heading":
+        return f"<row/><row>{_xlsx_cell(block[2], XLSX_BOLD_STYLE)}</row>"
+    if kind == "text":
+        return f"<row>{_xlsx_cell(block[1])}</row>"
+    if kind == "table":
+        return f"<row>{''.join(_xlsx_cell(column, XLSX_BOLD_STYLE) for column in block[1])}</row>"
+    if kind == "row":
+        return f"<row>{''.join(_xlsx_cell(value) for value in block[1])}</row>"
+    image = f"{GRAPH_IMAGES_FOLDER}/{block[1]}.{'png' if block[3] else 'svg'}"
+    return f"<row>{_xlsx_cell(block[1])}{_xlsx_cell(image)}</row>"
+
+
+def _xlsx_cell(value, style=0):
+    style = f' s="{style}"' if style else ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c{style}><v>{value}</v></c>"
+    value = XML_ILLEGAL_CHARACTERS.sub("", str(value))[:XLSX_MAX_CELL_LENGTH]
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+
+# Function to write the XLSX report, one sheet per section, streaming the cached sheet parts into the archive
+def write_report_xlsx(path, cache_dir):
+    sheets = "".join(
+        f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{index}" r:id="rId{index}"/>'
+        for index, (_, title) in enumerate(REPORT_SECTIONS, 1)
+    )
+    relationships = "".join(
+        f'<Relationship Id="rId{index}" Type="{XLSX_RELATIONSHIPS}/worksheet" Target="worksheets/sheet{index}.xml"/>'
+        for index in range(1, len(REPORT_SECTIONS) + 1)
+    )
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{index}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for index in range(1, len(REPORT_SECTIONS) + 1)
+    )
+    parts = {
+        "[Content_Types].xml": XLSX_CONTENT_TYPES.format(overrides=overrides),
+        "_rels/.rels": XLSX_PACKAGE_RELATIONSHIPS,
+        "xl/workbook.xml": XLSX_WORKBOOK.format(sheets=sheets),
+        "xl/_rels/workbook.xml.rels": XLSX_WORKBOOK_RELATIONSHIPS.format(
+            relationships=relationships, styles_id=len(REPORT_SECTIONS) + 1,
+        ),
+        "xl/styles.xml": XLSX_STYLES,
+    }
+    with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in parts.items():
+            archive.writestr(name, XML_DECLARATION + content)
+        for index, (section_id, _) in enumerate(REPORT_SECTIONS, 1):
+            with open(get_section_part_paths(section_id, cache_dir)["xml"], "rb") as part, \
+                    archive.open(f"xl/worksheets/sheet{index}.xml", "w", force_zip64=True) as sheet:
+                shutil.copyfileobj(part, sheet, REPORT_CHUNK_SIZE)
+    os.replace(path + ".tmp", path)
+
+
+# Function to write the Markdown or HTML report by copying the section parts chunk by chunk
+def write_report_text(path, cache_dir, report_format):
+    generated = time.strftime("%Y-%m-%d %H:%M")
+    with open(path + ".tmp", "w", encoding="utf-8") as report:
+        if report_format == "md":
+            report.write(f"# TARA Report\n\nGenerated on {generated}.\n\n")
+            report.write("".join(f"- [{title}](#{title.lower().replace(' ', '-')})\n" for _, title in REPORT_SECTIONS) + "\n")
+        else:
+            report.write(HTML_HEAD)
+            report.write(f"<h1>TARA Report</h1>\n<p>Generated on {generated}.</p>\n<ul>\n")
+            report.write("".join(f"<li><a href=\"#{section_id}\">{html.escape(title)}</a></li>\n" for section_id, title in REPORT_SECTIONS) + "</ul>\n")
+        for section_id, _ in REPORT_SECTIONS:
+            with open(get_section_part_paths(section_id, cache_dir)[report_format], "r", encoding="utf-8") as part:
+                shutil.copyfileobj(part, report, REPORT_CHUNK_SIZE)
+        if report_format == "html":
+            report.write("</body>\n</html>\n")
+    os.replace(path + ".tmp", path)
+
+
+def build_tara_report(formats=REPORT_FORMATS, parallel=True, max_workers=None):
+    """
+    Builds the TARA report in the given formats from the threat model, attack model, attack graph
+    images, likelihood and impact assessments, prioritized risks and controls. Only sections whose
+    source files changed since the last build are built again, concurrently in worker processes; the
+    report files are then assembled from the cached section parts. Returns the report paths per
+    format and the IDs of the sections that were built.
+
+    Parameters:
+    formats (list): Report formats, among REPORT_FORMATS.
+    parallel (bool): Build the changed sections concurrently in worker processes.
+    max_workers (int): Number of worker processes, the number of CPUs by default.
+    """
+    cache_dir = get_tara_report_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    manifest = _load_json(manifest_path) or {"sections": {}, "reports": {}}
+
+    sources = {section_id: get_section_sources(section_id) for section_id, _ in REPORT_SECTIONS}
+    fingerprints = {section_id: section_fingerprint(section_id, paths) for section_id, paths in sources.items()}
+    changed = [
+        (section_id, title) for section_id, title in REPORT_SECTIONS
+        if manifest["sections"].get(section_id) != fingerprints[section_id]
+        or not all(os.path.exists(path) for path in get_section_part_paths(section_id, cache_dir).values())
+    ]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(changed))
+    if not parallel or max_workers < 2:
+        for section_id, title in changed:
+            build_report_section(section_id, title, sources[section_id], cache_dir)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(
+                build_report_section, [section_id for section_id, _ in changed], [title for _, title in changed],
+                [sources[section_id] for section_id, _ in changed], [cache_dir] * len(changed),
+            ))
+    manifest["sections"].update({section_id: fingerprints[section_id] for section_id, _ in changed})
+
+    # A report is written again only when one of its sections changed
+    report_hash = hashlib.sha256(json.dumps([fingerprints[section_id] for section_id, _ in REPORT_SECTIONS]).encode("utf-8")).hexdigest()
+    paths = {}
+    for report_format in formats:
+        paths[report_format] = os.path.join(cache_dir, f"tara_report.{report_format}")
+        if manifest["reports"].get(report_format) == report_hash and os.path.exists(paths[report_format]):
+            continue
+        if report_format == "xlsx":
+            write_report_xlsx(paths[report_format], cache_dir)
+        else:
+            write_report_text(paths[report_format], cache_dir, report_format)
+        manifest["reports"][report_format] = report_hash
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return {"paths": paths, "built": [section_id for section_id, _ in changed]}
+
+
+def read_report_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+REPORT_DOWNLOADS = {
+    "md": ("Download Markdown", "text/markdown"),
+    "html": ("Download HTML", "text/html"),
+    "xlsx": ("Download XLSX", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+@st.fragment
+def display_tara_report():
+    st.markdown(
+        "Builds the complete TARA work product from the threat model, attack model, attack graph images, "
+        "likelihood and impact assessments, prioritized risks and controls. Sections whose inputs did not "
+        "change since the last build are reused."
+    )
+    if st.button("Build TARA Report", key="tara_report_build"):
+        with st.spinner("Building the TARA report..."):
+            st.session_state.tara_report = build_tara_report()
+        report = st.session_state.tara_report
+        st.success(f"TARA report built ({len(report['built'])} sections updated, {len(REPORT_SECTIONS) - len(report['built'])} unchanged).")
+
+    if "tara_report" not in st.session_state:
+        return
+    paths = st.session_state.tara_report["paths"]
+    columns = st.columns(len(REPORT_DOWNLOADS))
+    for column, (report_format, (label, mime)) in zip(columns, REPORT_DOWNLOADS.items()):
+        if report_format in paths and os.path.exists(paths[report_format]):
+            with column:
+                # The file is only read when the button is clicked
+                st.download_button(
+                    label=label, data=functools.partial(read_report_file, paths[report_format]),
+                    file_name=f"v-gpt_tara_report.{report_format}", mime=mime, key=f"tara_report_download_{report_format}",
+                )
+
+
+# Function to write synthetic assessment files of n_assets * n_threats * n_vectors * n_scenarios scenarios
+def write_benchmark_sources(base_path, n_assets=50, n_threats=20, n_vectors=5, n_scenarios=4, seed=0):
+    import numpy as np
+    from attack_paths import generate_benchmark_model
+    from rating_store import LIKELIHOOD_FACTORS, IMPACT_FACTORS, likelihood_entries, impact_entries
+
+    rng = np.random.default_rng(seed)
+    assets, _, _ = generate_benchmark_model(n_assets, n_threats, n_vectors, n_scenarios, seed)
+    for asset in assets:
+        asset["consequences"] = f"Consequences for {asset['name']}"
+        for threat in asset["threats"]:
+            threat["objectives"] = [f"Objective of {threat['name']}"]
+            threat["controls"] = ["Control 0"] if rng.random() < 0.2 else []
+    scenarios = []
+    for asset in assets:
+        for threat in asset["threats"]:
+            for vector in threat["vectors"]:
+                for scenario in vector["scenarios"]:
+                    likelihood = [int(rng.integers(len(levels[factor]))) for factor in LIKELIHOOD_FACTORS]
+                    impact = [int(rng.integers(len(impact_levels[factor]))) for factor in IMPACT_FACTORS]
+                    scenarios.append({
+                        "asset": asset["name"], "threat": threat["name"], "vector": vector["vector_name"],
+                        "scenario_id": scenario["scenario_id"], "scenario_desc": scenario["scenario_description"],
+                        "Likelihood": likelihood_entries(likelihood), "Impact": impact_entries(impact),
+                        "Risk Level": float(rng.integers(1, 26)),
+                    })
+    files = {
+        ".files\\threats.json": [
+            {"Asset": asset["name"], "Threats": ", ".join(threat["name"] for threat in asset["threats"]), "Potential Consequences": asset["consequences"]}
+            for asset in assets
+        ],
+        ".files\\unified_attack_model.json": {"assets": assets},
+        ".files\\final_likelihood_assessment.json": {"Scenarios": scenarios},
+        ".files\\final_impact_assessment.json": {"Scenarios": scenarios},
+        ".files\\risk_assessment.json": {"Scenarios": scenarios},
+        ".files\\controls.json": {"controls": [{"name": "Control 0", "cost": 1, "shifts": {"Equipment": "Bespoke"}}]},
+    }
+    for name, data in files.items():
+        with open(os.path.join(base_path, name), "w") as f:
+            json.dump(data, f)
+    return len(scenarios)
+
+
+def benchmark_tara_report(**kwargs):
+    """
+    Times building the report of a synthetic assessment (20,000 scenarios by default) sequentially
+    and in worker processes, rebuilding it with nothing changed and after one assessment file
+    changed, and measures the peak memory traced while assembling the report files.
+    """
+    import tracemalloc
+
+    timings = {}
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as base_path:
+        os.chdir(base_path)
+        try:
+            timings["scenarios"] = write_benchmark_sources(base_path, **kwargs)
+            for name, parallel in (("sequential", False), ("parallel", True)):
+                shutil.rmtree(get_tara_report_dir(), ignore_errors=True)
+                start = time.perf_counter()
+                result = build_tara_report(parallel=parallel)
+                timings[name] = time.perf_counter() - start
+            timings["report_bytes"] = {report_format: os.path.getsize(path) for report_format, path in result["paths"].items()}
+
+            start = time.perf_counter()
+            build_tara_report()
+            timings["unchanged"] = time.perf_counter() - start
+
+            impact_path = os.path.join(base_path, ".files\\final_impact_assessment.json")
+            os.utime(impact_path, (time.time() + 10, time.time() + 10))
+            start = time.perf_counter()
+            result = build_tara_report()
+            timings["one_changed"] = (time.perf_counter() - start, result["built"])
+
+            # The sections are cached, so the traced memory is the one of the writers alone
+            manifest_path = os.path.join(get_tara_report_dir(), "manifest.json")
+            manifest = _load_json(manifest_path)
+            manifest["reports"] = {}
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            tracemalloc.start()
+            build_tara_report()
+            timings["assembly_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        finally:
+            os.chdir(working_dir)
+    return timings
+
+
+if __name__ == "__main__":
+    timings = benchmark_tara_report()
+    sizes = ", ".join(f"{report_format} {size / 1e6:.1f} MB" for report_format, size in timings["report_bytes"].items())
+    print(f"Report of {timings['scenarios']} scenarios ({sizes}) built in {timings['sequential']:.2f} s sequentially, "
+          f"{timings['parallel']:.2f} s in worker processes")
+    print(f"Rebuilt in {timings['unchanged'] * 1000:.0f} ms with nothing changed, {timings['one_changed'][0]:.2f} s "
+          f"after changing the impact assessment (sections built: {', '.join(timings['one_changed'][1])})")
+    print(f"Peak traced memory while assembling the reports: {timings['assembly_peak_bytes'] / 1e6:.1f} MB")
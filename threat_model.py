@@ -1,8 +1,6 @@
 # threat_model.py
 
 import json
-import google.generativeai as genai
-from openai import OpenAI
 import streamlit as st
 
 
@@ -65,6 +63,8 @@ Example of expected JSON response format:
 
 # Function to get threat model from the GPT response.
 def get_threat_model(api_key, model_name, prompt):
+    from openai import OpenAI  # Imported on first use so the app starts without loading the SDK
+
     client = OpenAI(api_key=api_key)
 
     response = client.chat.completions.create(
@@ -89,6 +89,8 @@ def save_json_to_file(data, json_path):
 
 # Function to get threat model from the Google response.
 def get_threat_model_google(google_api_key, google_model, prompt):
+    import google.generativeai as genai
+
     genai.configure(api_key=google_api_key)
     model = genai.GenerativeModel(
         google_model,
@@ -1,6 +1,7 @@
 # util.py
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # Define the likelihood levels for each factor
 levels = {
@@ -52,7 +53,7 @@ values = {
 
 def reset_likelihood_assessment_state():
     """Resets session state variables for risk assessment."""
-    for key in ["risk_assessment_tab", "selected_scenario", "selected_levels",
+    for key in ["risk_assessment_tab", "selected_scenario", "selected_codes",
                 "submitted_scenarios", "available_scenarios", "update_scenario"]:
         if key in st.session_state:
             del st.session_state[key]
@@ -93,7 +94,15 @@ def reset_impact_assessment_state():
     keys_to_remove = [
         key for key in st.session_state if key.startswith("impact_assessment_")
     ]
-    keys_to_remove.extend(["submitted_impact_assessments", "impact_assessment_ready", "impact_assessment_complete"])
+    keys_to_remove.extend(["submitted_impact_assessments", "impact_rating_store", "impact_assessment_ready", "impact_assessment_complete"])
     for key in keys_to_remove:
         if key in st.session_state:
-            del st.session_state[key]
\ No newline at end of file
+            del st.session_state[key]
+
+
+# Function to rerun only the calling fragment when it is being rerun on its own, otherwise the whole app
+def rerun_fragment():
+    ctx = get_script_run_ctx()
+    if ctx is not None and ctx.fragment_ids_this_run:
+        st.rerun(scope="fragment")
+    st.rerun()